@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark định dạng đầu vào của /predict/batch: JSON (mảng dict) so với
+msgpack / Arrow IPC dạng cột, và ML từng email so với predict_many (vectorized)
+
+Usage:
+    python benchmarks/batch_input_bench.py [--sizes 1000,10000] [--repeat N]
+"""
+
+import argparse
+import json
+
+from common import MODELS_DIR, SAMPLE_EMAILS, quiet_logging, time_call
+
+
+def make_columns(n):
+    emails = [SAMPLE_EMAILS[i % len(SAMPLE_EMAILS)] for i in range(n)]
+    return {
+        'title': [email['title'] for email in emails],
+        'content': [email['content'] for email in emails],
+        'from_email': [email['from_email'] for email in emails]
+    }
+
+
+def encode_payloads(columns):
+    """Mã hóa cùng một batch theo từng định dạng hỗ trợ"""
+    import columnar_input
+
+    n = len(columns['title'])
+    records = [
+        {'title': columns['title'][i], 'content': columns['content'][i], 'from_email': columns['from_email'][i]}
+        for i in range(n)
+    ]
+    payloads = {'json': ('application/json', json.dumps({'emails': records}, ensure_ascii=False).encode('utf-8'))}
+
+    if columnar_input.msgpack is not None:
+        payloads['msgpack'] = ('application/msgpack', columnar_input.msgpack.packb(columns))
+
+    if columnar_input.pyarrow is not None:
+        pa = columnar_input.pyarrow
+        table = pa.table(columns)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        payloads['arrow'] = (columnar_input.ARROW_STREAM_TYPE, sink.getvalue().to_pybytes())
+
+    return payloads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1000,10000', help='Số email mỗi batch, phân cách bằng dấu phẩy')
+    parser.add_argument('--repeat', type=int, default=5, help='Số lần lặp cho mỗi phép đo')
+    args = parser.parse_args()
+
+    quiet_logging()
+    import serialization
+    from columnar_input import EmailColumns, decode_columns
+    from lightweight_email_classifier import LightweightEmailClassifier
+
+    ml_classifier = LightweightEmailClassifier(model_path=MODELS_DIR)
+
+    print('\n%-7s %-26s %12s %12s' % ('n', 'stage', 'time (ms)', 'bytes'))
+    for n in [int(s) for s in args.sizes.split(',')]:
+        columns = make_columns(n)
+        for name, (mimetype, body) in encode_payloads(columns).items():
+            if name == 'json':
+                def decode():
+                    emails, _, _, _ = serialization.validate_batch(serialization.loads(body))
+                    return EmailColumns.from_records(emails)
+            else:
+                def decode():
+                    return decode_columns(body, mimetype)
+            _, ms = time_call(decode, repeat=args.repeat)
+            print('%-7d %-26s %12.3f %12d' % (n, f'decode {name}', ms, len(body)))
+
+        def per_email():
+            return [ml_classifier.predict(t, c, f)
+                    for t, c, f in zip(columns['title'], columns['content'], columns['from_email'])]
+        _, loop_ms = time_call(per_email, repeat=1)
+        _, vector_ms = time_call(ml_classifier.predict_many, columns['title'], columns['content'],
+                                 columns['from_email'], repeat=args.repeat)
+        print('%-7d %-26s %12.3f' % (n, 'ml per-email loop', loop_ms))
+        print('%-7d %-26s %12.3f' % (n, 'ml predict_many', vector_ms))
+
+
+if __name__ == '__main__':
+    main()
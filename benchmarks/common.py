@@ -0,0 +1,137 @@
+"""
+Các hàm dùng chung cho scripts benchmark và đánh giá
+"""
+
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+MODULE_DIR = os.path.join(ROOT_DIR, 'email_classification_module')
+MODELS_DIR = os.path.join(ROOT_DIR, 'models')
+
+for path in (MODULE_DIR, MODELS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+SAMPLE_EMAILS = [
+    {
+        'title': 'Thông báo khẩn từ ngân hàng',
+        'content': 'Tài khoản của bạn sẽ bị khóa trong 24h nếu không xác minh ngay.',
+        'from_email': 'security@bank-verify.tk'
+    },
+    {
+        'title': 'Xác nhận đơn hàng',
+        'content': 'Cảm ơn bạn đã đặt hàng. Đơn hàng của bạn đã được xác nhận.',
+        'from_email': 'orders@shopee.vn'
+    },
+    {
+        'title': 'GIẢM GIÁ 90% - CHỈ HÔM NAY!!!',
+        'content': 'Giảm giá 80% chỉ còn 3 giờ, click ngay vào link bit.ly/sale-90 để nhận quà!!!',
+        'from_email': 'promo@deals24.net'
+    },
+    {
+        'title': 'Kính gửi sinh viên',
+        'content': 'Kính gửi các bạn sinh viên, lịch thi cuối kỳ đã được cập nhật trên hệ thống. Trân trọng.',
+        'from_email': 'daotao@fpt.edu.vn'
+    },
+    {
+        'title': 'Urgent: hạn chót nộp báo cáo',
+        'content': 'Vui lòng cung cấp số tài khoản trong vòng 12 giờ để hoàn tất thủ tục.',
+        'from_email': 'admin@it-system.click'
+    },
+    {
+        'title': 'Cập nhật bảo mật ngay',
+        'content': 'Click vào link để xác nhận thông tin bảo mật của bạn trong 2 giờ.',
+        'from_email': 'support@amaz0n-security.com'
+    },
+    {
+        'title': 'Ưu đãi đặc biệt',
+        'content': 'Số lượng có hạn, đăng ký ngay để nhận ưu đãi dành riêng cho bạn.',
+        'from_email': 'marketing@brand.com'
+    },
+    {
+        'title': 'Họp nhóm tuần này',
+        'content': 'Dear team, cuộc họp tuần này dời sang thứ năm lúc 14h. Best regards',
+        'from_email': 'lead@abccorp.com'
+    }
+]
+
+CORPORATE_EMAILS = [
+    {
+        'title': 'Lịch họp giao ban tuần %d',
+        'content': 'Kính gửi anh chị, phòng nhân sự xin gửi lịch họp giao ban tuần này. '
+                   'Nội dung gồm báo cáo tiến độ dự án và kế hoạch quý tới. Trân trọng.',
+        'from_email': 'hr@abccorp.com'
+    },
+    {
+        'title': 'Biên bản cuộc họp dự án %d',
+        'content': 'Thân gửi cả nhóm, mình gửi lại biên bản cuộc họp sáng nay và các đầu việc '
+                   'đã thống nhất. Mọi người xem và phản hồi giúp mình nhé. Thân ái.',
+        'from_email': 'pm@fpt.edu.vn'
+    },
+    {
+        'title': 'Báo cáo doanh thu tháng %d',
+        'content': 'Dear all, attached is the monthly revenue report. Numbers are in line with '
+                   'the forecast and the team will review it on Friday. Best regards',
+        'from_email': 'finance@xyzcompany.com'
+    }
+]
+
+FILLER_WORDS = (
+    'bản tin tuần này tổng hợp các hoạt động nổi bật của công ty cùng những chia sẻ hữu ích '
+    'về công việc sức khỏe và đời sống mời bạn đọc cùng theo dõi các chuyên mục dưới đây '
+    'the quarterly newsletter covers product updates community events and team highlights'
+).split()
+
+
+def corporate_emails(n):
+    """Sinh n email nội bộ "sạch" (không cần regex nào khớp)"""
+    emails = []
+    for i in range(n):
+        template = CORPORATE_EMAILS[i % len(CORPORATE_EMAILS)]
+        emails.append({
+            'title': template['title'] % (i + 1),
+            'content': template['content'],
+            'from_email': template['from_email']
+        })
+    return emails
+
+
+def filler_text(n_chars, seed=0, html=False):
+    """Sinh đoạn văn bản (hoặc HTML) dài khoảng n_chars ký tự"""
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    while size < n_chars:
+        sentence = ' '.join(rng.choice(FILLER_WORDS) for _ in range(rng.randint(8, 20))) + '.'
+        if html:
+            sentence = '<p style="font-family:Arial;color:#333">%s</p>' % sentence
+        parts.append(sentence)
+        size += len(sentence) + 1
+    return '\n'.join(parts)[:n_chars]
+
+
+def time_call(func, *args, repeat=1, **kwargs):
+    """Chạy func `repeat` lần, trả về (kết quả cuối, thời gian trung bình theo ms)"""
+    result = None
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000 / repeat
+
+
+def percentile(values, pct):
+    """Percentile đơn giản (nearest-rank) cho danh sách số"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def quiet_logging():
+    """Tắt log INFO của các classifiers khi benchmark"""
+    import logging
+    logging.disable(logging.INFO)
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Benchmark khả năng mở rộng theo số thread và số process của rule-based và ML
+classifier, cho từng loại tác vụ của server (email đơn lẻ và batch).
+
+Với thread, mọi thread gọi chung một classifier (kiểm tra luôn tính reentrant:
+kết quả phải giống hệt khi chạy tuần tự). Với process, mỗi tác vụ được gửi
+sang ProcessPoolExecutor như server làm (một lần pickle/IPC mỗi request), nên
+throughput đã gồm chi phí gửi dữ liệu.
+
+Từ throughput đo được, script ước lượng phần thời gian chạy song song được giữa
+các thread (theo định luật Amdahl - phần không giữ GIL) và đề xuất thread hay
+process cho từng tác vụ. --write-policy ghi đề xuất ra file JSON để server dùng
+(EMAIL_EXECUTION_POLICY=policy.json).
+
+Usage:
+    python benchmarks/concurrency_bench.py [--workers 1,2,4,8,16] [--tasks rule,ml,batch_rule,batch_ml]
+        [--calls 400] [--batch-size 200] [--write-policy policy.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from common import MODELS_DIR, SAMPLE_EMAILS, quiet_logging
+
+PROCESS_ADVANTAGE = 1.1     # Chỉ đề xuất process khi nhanh hơn thread ít nhất 10% (process tốn bộ nhớ hơn)
+
+
+def _init_process():
+    """Load classifiers trong worker process của benchmark"""
+    quiet_logging()
+    import execution
+    from email_classifier import EmailClassifier
+    from lightweight_email_classifier import LightweightEmailClassifier
+    execution.register_classifiers(EmailClassifier(), LightweightEmailClassifier(model_path=MODELS_DIR))
+
+
+def _ready(_):
+    time.sleep(0.05)
+    return os.getpid()
+
+
+def make_calls(task, calls, batch_size):
+    """Danh sách (hàm, tham số) cho từng request của tác vụ"""
+    from execution import run_columns, run_email
+
+    method = 'rule' if task.endswith('rule') else 'ml'
+    if not task.startswith('batch'):
+        emails = []
+        for i in range(calls):
+            email = dict(SAMPLE_EMAILS[i % len(SAMPLE_EMAILS)])
+            email['title'] = f"{email['title']} {i}"
+            emails.append(email)
+        return [(run_email, (method, email)) for email in emails]
+    batches = []
+    for i in range(max(1, calls // batch_size)):
+        emails = [SAMPLE_EMAILS[(i + j) % len(SAMPLE_EMAILS)] for j in range(batch_size)]
+        batches.append((run_columns, (
+            method,
+            [f"{email['title']} {i}-{j}" for j, email in enumerate(emails)],
+            [email['content'] for email in emails],
+            [email['from_email'] for email in emails]
+        )))
+    return batches
+
+
+def _call(item):
+    func, args = item
+    return func(*args)
+
+
+def run_threads(items, workers):
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        start = time.perf_counter()
+        results = list(pool.map(_call, items))
+        return results, time.perf_counter() - start
+
+
+def run_processes(pool, items):
+    start = time.perf_counter()
+    results = list(pool.map(_call, items, chunksize=1))
+    return results, time.perf_counter() - start
+
+
+def strip_timing(results):
+    """Bỏ processing_time (thay đổi theo lần chạy) trước khi so sánh kết quả"""
+    def clean(result):
+        return {key: value for key, value in result.items() if key != 'processing_time'}
+    return [[clean(r) for r in result] if isinstance(result, list) else clean(result) for result in results]
+
+
+def parallel_fraction(speedup, workers):
+    """Phần chạy song song được p theo Amdahl: speedup = 1 / ((1 - p) + p / n)"""
+    if workers <= 1 or speedup <= 0:
+        return None
+    return max(0.0, min(1.0, (1 - 1 / speedup) / (1 - 1 / workers)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', default='1,2,4,8,16', help='Số thread/process, phân cách bằng dấu phẩy')
+    parser.add_argument('--tasks', default='rule,ml,batch_rule,batch_ml', help='Tác vụ cần đo')
+    parser.add_argument('--calls', type=int, default=400, help='Số email mỗi lần đo')
+    parser.add_argument('--batch-size', type=int, default=200, help='Số email mỗi batch (tác vụ batch_*)')
+    parser.add_argument('--write-policy', default=None, help='Ghi chính sách đề xuất ra file JSON')
+    args = parser.parse_args()
+
+    quiet_logging()
+    import execution
+
+    counts = [int(n) for n in args.workers.split(',')]
+    tasks = args.tasks.split(',')
+    for task in tasks:
+        if task not in execution.TASKS:
+            raise SystemExit(f'Unknown task: {task} (allowed: {", ".join(execution.TASKS)})')
+    cpus = os.cpu_count() or 1
+
+    _init_process()
+    context = multiprocessing.get_context('spawn')
+    pools = {}
+    for n in counts:
+        pool = ProcessPoolExecutor(max_workers=n, mp_context=context, initializer=_init_process)
+        # Chờ mọi worker khởi động xong để không tính thời gian spawn + load model
+        list(pool.map(_ready, range(n * 2)))
+        pools[n] = pool
+
+    print(f'CPUs: {cpus}')
+    print(f"{'task':<11} {'workers':>7} {'thread/s':>10} {'process/s':>10} {'thread x':>9} {'process x':>10} "
+          f"{'parallel %':>10}")
+    measurements = {}
+    recommendations = {}
+    all_identical = True
+    try:
+        for task in tasks:
+            items = make_calls(task, args.calls, args.batch_size)
+            emails_per_item = 1 if not task.startswith('batch') else args.batch_size
+            # Khởi động (compile regex, cache vocabulary) và kết quả tham chiếu tuần tự
+            _call(items[0])
+            expected = strip_timing([_call(item) for item in items])
+            rows = []
+            for n in counts:
+                thread_results, thread_time = run_threads(items, n)
+                process_results, process_time = run_processes(pools[n], items)
+                identical = strip_timing(thread_results) == expected and strip_timing(process_results) == expected
+                all_identical = all_identical and identical
+                rows.append({
+                    'workers': n,
+                    'thread_per_s': len(items) * emails_per_item / thread_time,
+                    'process_per_s': len(items) * emails_per_item / process_time,
+                    'identical': identical
+                })
+            base = rows[0]['thread_per_s']
+            for row in rows:
+                row['thread_speedup'] = row['thread_per_s'] / base
+                row['process_speedup'] = row['process_per_s'] / base
+                fraction = parallel_fraction(row['thread_speedup'], min(row['workers'], cpus))
+                row['thread_parallel_fraction'] = fraction
+                print(f"{task:<11} {row['workers']:>7} {row['thread_per_s']:>10.0f} {row['process_per_s']:>10.0f} "
+                      f"{row['thread_speedup']:>8.2f}x {row['process_speedup']:>9.2f}x "
+                      f"{(f'{fraction * 100:.0f}%' if fraction is not None else '-'):>10}"
+                      f"{'' if row['identical'] else '  ❌ results differ'}")
+            # Chi phí gửi sang process (pickle + IPC) ước lượng từ 1 thread vs 1 process
+            overhead_ms = (1 / rows[0]['process_per_s'] - 1 / rows[0]['thread_per_s']) * 1000 * emails_per_item
+            print(f"{task:<11} process dispatch overhead ≈ {overhead_ms:.3f} ms/request, "
+                  f"compute ≈ {1000 * emails_per_item / rows[0]['thread_per_s']:.3f} ms/request")
+            for row in rows:
+                row['dispatch_overhead_ms'] = overhead_ms
+            measurements[task] = rows
+
+            # Chỉ so sánh số worker không vượt quá số CPU (vượt quá chỉ tăng tranh chấp)
+            usable = [row for row in rows if row['workers'] <= cpus] or rows[:1]
+            best_thread = max(row['thread_per_s'] for row in usable)
+            best_process = max(row['process_per_s'] for row in usable)
+            recommendations[task] = 'process' if best_process > best_thread * PROCESS_ADVANTAGE else 'thread'
+    finally:
+        for pool in pools.values():
+            pool.shutdown()
+
+    print()
+    print('✅ Kết quả giống hệt nhau giữa tuần tự, thread và process' if all_identical else
+          '❌ Kết quả khác nhau khi chạy đồng thời')
+    print('Đề xuất: ' + ', '.join(f'{task}={mode}' for task, mode in recommendations.items()))
+    if cpus == 1:
+        print('(Máy chỉ có 1 CPU: thread và process đều không chạy song song được, nên đo lại trên máy chạy server)')
+
+    if args.write_policy:
+        with open(args.write_policy, 'w', encoding='utf-8') as f:
+            json.dump({
+                'policy': recommendations,
+                'cpus': cpus,
+                'measured_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'measurements': measurements
+            }, f, ensure_ascii=False, indent=2)
+        print(f'Policy written to {args.write_policy}')
+
+
+if __name__ == '__main__':
+    main()
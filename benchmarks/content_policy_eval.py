@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Đánh giá ContentPolicy: độ khớp kết quả phân loại và thời gian xử lý
+trên mẫu email phân tầng theo kích thước (1KB -> 5MB), và recall trên email
+đối kháng giấu payload dưới header trả lời giả (strip_quoted bật / tắt)
+
+Usage:
+    python benchmarks/content_policy_eval.py [--sizes 1000,10000,...] [--repeat N] [--quoted-budgets 0,4000]
+"""
+
+import argparse
+
+from common import MODELS_DIR, SAMPLE_EMAILS, filler_text, quiet_logging, time_call
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000, 5000000]
+
+# Header trả lời / chuyển tiếp giả đặt trước payload
+FAKE_REPLY_HEADERS = [
+    'On Mon, 3 Jun 2024 at 09:12, IT Support <support@company.com> wrote:',
+    'Vào Th 2, 3 thg 6, 2024 lúc 09:12 Phòng IT đã viết:',
+    '---------- Forwarded message ---------',
+    'From: IT Support <support@company.com>\nSent: Monday, June 3, 2024 9:12 AM'
+]
+BENIGN_LEAD = 'Chào bạn, mình gửi lại email bên dưới để bạn tiện theo dõi. Cảm ơn nhiều.'
+
+
+def build_sample(size):
+    """Sinh email cỡ `size` từ các email mẫu: tín hiệu ở đầu, newsletter ở giữa, lời kết ở cuối"""
+    emails = []
+    for i, base in enumerate(SAMPLE_EMAILS):
+        for html in (False, True):
+            body = base['content'] + '\n' + filler_text(size, seed=i, html=html) + '\nTrân trọng.'
+            if html:
+                body = '<html><body><div>%s</div></body></html>' % body
+            emails.append(dict(base, content=body))
+    return emails
+
+
+def evaluate(size, policy, rule_classifier, ml_classifier, repeat):
+    emails = build_sample(size)
+    stats = {'rule': [0, 0.0, 0.0], 'ml': [0, 0.0, 0.0]}
+
+    for email in emails:
+        cleaned, policy_ms = time_call(policy.apply, email, repeat=repeat)
+
+        full, full_ms = time_call(rule_classifier.classify_email, email, repeat=repeat)
+        trimmed, trimmed_ms = time_call(rule_classifier.classify_email, cleaned, repeat=repeat)
+        stats['rule'][0] += full['category'] == trimmed['category']
+        stats['rule'][1] += full_ms
+        stats['rule'][2] += trimmed_ms + policy_ms
+
+        if ml_classifier is not None:
+            full, full_ms = time_call(ml_classifier.predict, email['title'], email['content'],
+                                      email['from_email'], repeat=repeat)
+            trimmed, trimmed_ms = time_call(ml_classifier.predict, cleaned['title'], cleaned['content'],
+                                            cleaned['from_email'], repeat=repeat)
+            stats['ml'][0] += full['category'] == trimmed['category']
+            stats['ml'][1] += full_ms
+            stats['ml'][2] += trimmed_ms + policy_ms
+
+    return len(emails), stats
+
+
+def build_adversarial():
+    """Payload của email mẫu nằm dưới phần mở đầu vô hại + header trả lời giả (từng dòng cũng có thể là "> ...")"""
+    emails = []
+    for base in SAMPLE_EMAILS:
+        for header in FAKE_REPLY_HEADERS:
+            emails.append(dict(base, title='Re: ' + base['title'],
+                               content=f"{BENIGN_LEAD}\n\n{header}\n{base['content']}"))
+        emails.append(dict(base, title='Re: ' + base['title'],
+                           content=f"{BENIGN_LEAD}\n> {base['content']}"))
+    return emails
+
+
+def evaluate_adversarial(policies, rule_classifier, ml_classifier):
+    """
+    Recall trên email đối kháng: tỉ lệ email giữ nguyên verdict của payload gốc
+    (không qua header giả) sau khi qua từng policy
+    """
+    emails = build_adversarial()
+    rows = []
+    for name, policy in policies:
+        kept = {'rule': 0, 'ml': 0}
+        for email in emails:
+            payload = next(base for base in SAMPLE_EMAILS if email['content'].endswith(base['content']))
+            cleaned = policy.apply(email)
+            kept['rule'] += (rule_classifier.classify_email(cleaned)['category']
+                             == rule_classifier.classify_email(payload)['category'])
+            if ml_classifier is not None:
+                kept['ml'] += (ml_classifier.predict(cleaned['title'], cleaned['content'], cleaned['from_email'])['category']
+                               == ml_classifier.predict(payload['title'], payload['content'], payload['from_email'])['category'])
+        rows.append((name, kept))
+    return len(emails), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help='Các kích thước content (ký tự), phân cách bằng dấu phẩy')
+    parser.add_argument('--repeat', type=int, default=1, help='Số lần lặp cho mỗi phép đo')
+    parser.add_argument('--no-ml', action='store_true', help='Bỏ qua ML classifier')
+    parser.add_argument('--quoted-budgets', default='0,1000,4000',
+                        help='Các giá trị max_quoted_chars đánh giá với strip_quoted bật')
+    args = parser.parse_args()
+
+    quiet_logging()
+    from content_policy import ContentPolicy
+    from email_classifier import EmailClassifier
+
+    policy = ContentPolicy()
+    rule_classifier = EmailClassifier()
+    ml_classifier = None
+    if not args.no_ml:
+        from lightweight_email_classifier import LightweightEmailClassifier
+        ml_classifier = LightweightEmailClassifier(model_path=MODELS_DIR)
+
+    print('\n%-10s %-5s %6s %10s %12s %14s %9s' % (
+        'size', 'model', 'n', 'agreement', 'full (ms)', 'policy (ms)', 'speedup'))
+    for size in [int(s) for s in args.sizes.split(',')]:
+        n, stats = evaluate(size, policy, rule_classifier, ml_classifier, args.repeat)
+        for model, (agree, full_ms, trimmed_ms) in stats.items():
+            if model == 'ml' and ml_classifier is None:
+                continue
+            print('%-10d %-5s %6d %9.1f%% %12.2f %14.2f %8.1fx' % (
+                size, model, n, 100.0 * agree / n, full_ms / n, trimmed_ms / n,
+                full_ms / trimmed_ms if trimmed_ms else 0.0))
+
+    policies = [('strip_quoted=off', policy)]
+    for budget in [int(b) for b in args.quoted_budgets.split(',')]:
+        policies.append((f'strip_quoted=on, max_quoted_chars={budget}',
+                         ContentPolicy(strip_quoted=True, max_quoted_chars=budget)))
+    n, rows = evaluate_adversarial(policies, rule_classifier, ml_classifier)
+    print(f'\nEmail đối kháng (payload dưới header trả lời giả, n={n}): tỉ lệ giữ verdict của payload')
+    for name, kept in rows:
+        print('%-42s rule %5.1f%%%s' % (name, 100.0 * kept['rule'] / n,
+                                        '' if ml_classifier is None else '   ml %5.1f%%' % (100.0 * kept['ml'] / n)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark prefilter literal (Aho-Corasick) của rule-based classifier: thời gian
+phân loại và số regex thực sự phải chạy, có/không có prefilter, trên email nội
+bộ "sạch" (gần như không regex nào cần chạy) và trên bộ email mẫu đủ loại.
+Kết quả phân loại phải giống hệt nhau giữa các chế độ.
+
+Usage:
+    python benchmarks/prefilter_bench.py [--n 2000] [--sizes 0,2000,20000] [--repeat 3]
+"""
+
+import argparse
+
+from common import SAMPLE_EMAILS, corporate_emails, filler_text, quiet_logging, time_call
+
+
+def make_corpus(kind, n, extra_chars):
+    """Email nội bộ (corporate) hoặc email mẫu (mixed), nội dung kéo dài thêm extra_chars ký tự"""
+    if kind == 'corporate':
+        emails = corporate_emails(n)
+    else:
+        emails = [dict(SAMPLE_EMAILS[i % len(SAMPLE_EMAILS)]) for i in range(n)]
+    if extra_chars:
+        filler = filler_text(extra_chars, seed=1)
+        for email in emails:
+            email['content'] = email['content'] + '\n' + filler
+    return emails
+
+
+def count_regex_runs(classifier, emails):
+    """Số lần gọi regex và số regex thực sự chạy (qua được prefilter) trên corpus"""
+    from prefilter import TextScan
+
+    counts = {'calls': 0, 'ran': 0}
+
+    class CountingScan(TextScan):
+        __slots__ = ()
+
+        def search(self, pattern, text):
+            clauses = self._prefilter.requirements.get(pattern)
+            counts['calls'] += 1
+            if len(text) < self._prefilter.min_text_length or clauses is None or \
+                    self._allowed(clauses, self._lookup(text)):
+                counts['ran'] += 1
+            return TextScan.search(self, pattern, text)
+
+        def search_joined(self, pattern, left, sep, right):
+            result = TextScan.search_joined(self, pattern, left, sep, right)
+            clauses = self._prefilter.requirements.get(pattern)
+            counts['calls'] += 1
+            if clauses is None or self._allowed(clauses, self._found[(left, sep, right)]):
+                counts['ran'] += 1
+            return result
+
+    prefilter = classifier.prefilter
+    original_scan = prefilter.scan
+    prefilter.scan = lambda: CountingScan(prefilter)
+    try:
+        for email in emails:
+            classifier.classify_email(email)
+    finally:
+        prefilter.scan = original_scan
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n', type=int, default=2000, help='Số email mỗi corpus')
+    parser.add_argument('--sizes', default='0,2000,20000',
+                        help='Số ký tự nội dung thêm vào mỗi email, phân cách bằng dấu phẩy')
+    parser.add_argument('--repeat', type=int, default=3, help='Số lần lặp cho mỗi phép đo')
+    args = parser.parse_args()
+
+    quiet_logging()
+    import prefilter
+    from email_classifier import EmailClassifier
+
+    direct = EmailClassifier(use_prefilter=False)
+    automaton = EmailClassifier()
+    substring = EmailClassifier()
+    substring.prefilter = prefilter.LiteralPrefilter(
+        substring.ruleset.patterns, use_automaton=False, literals=substring.ruleset.literals)
+
+    print(f'pyahocorasick: {"yes" if prefilter.ahocorasick is not None else "no (substring fallback)"}')
+    print(f'regex có literal bắt buộc: {len(automaton.prefilter.requirements)}')
+
+    print('\n%-10s %7s %-22s %12s %10s %14s' % ('corpus', 'extra', 'mode', 'ms/email', 'speedup', 'regex ran'))
+    for kind in ('corporate', 'mixed'):
+        for extra in [int(s) for s in args.sizes.split(',')]:
+            emails = make_corpus(kind, args.n, extra)
+            expected, base_ms = time_call(direct.classify_columns,
+                                          [e['title'] for e in emails],
+                                          [e['content'] for e in emails],
+                                          [e['from_email'] for e in emails],
+                                          repeat=args.repeat)
+            counts = count_regex_runs(automaton, emails)
+            print('%-10s %7d %-22s %12.4f %10s %14s' % (
+                kind, extra, 'direct', base_ms / len(emails), '1.00x', counts['calls']))
+
+            modes = [('prefilter (automaton)', automaton)]
+            if automaton.prefilter.use_automaton:
+                modes.append(('prefilter (substring)', substring))
+            for name, classifier in modes:
+                results, ms = time_call(classifier.classify_columns,
+                                        [e['title'] for e in emails],
+                                        [e['content'] for e in emails],
+                                        [e['from_email'] for e in emails],
+                                        repeat=args.repeat)
+                if results != expected:
+                    raise SystemExit(f'❌ {name}: kết quả khác với chạy trực tiếp ({kind}, extra={extra})')
+                ran = '%d/%d' % (counts['ran'], counts['calls'])
+                print('%-10s %7d %-22s %12.4f %9.2fx %14s' % (
+                    kind, extra, name, ms / len(emails), base_ms / ms, ran))
+
+    print('\n✅ Kết quả giống hệt nhau giữa các chế độ')
+
+
+if __name__ == '__main__':
+    main()
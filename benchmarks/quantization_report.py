@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Báo cáo lượng tử hóa (float32, int8) của ML model so với pipeline float64 gốc:
+độ khớp dự đoán, độ lệch xác suất lớn nhất, kích thước model và thời gian
+phân loại theo batch.
+
+Usage:
+    python benchmarks/quantization_report.py [--n 5000] [--batch-sizes 1,32,256,2048] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+
+import numpy as np
+
+from common import CORPORATE_EMAILS, MODELS_DIR, SAMPLE_EMAILS, filler_text, quiet_logging, time_call
+
+
+def mixed_emails(n, seed=0):
+    """Email ghép ngẫu nhiên từ các email mẫu, email nội bộ và đoạn văn dài"""
+    rng = random.Random(seed)
+    pool = SAMPLE_EMAILS + CORPORATE_EMAILS
+    emails = []
+    for i in range(n):
+        parts = rng.sample(pool, rng.randint(1, 3))
+        content = ' '.join(part['content'] for part in parts)
+        if rng.random() < 0.3:
+            content += '\n' + filler_text(rng.randint(200, 5000), seed=i)
+        emails.append({
+            'title': parts[0]['title'].replace('%d', str(i)),
+            'content': content,
+            'from_email': rng.choice(pool)['from_email']
+        })
+    return emails
+
+
+def weight_bytes(classifier):
+    """Bộ nhớ của các trọng số số học (idf, coef, intercept)"""
+    if classifier.scorer is not None:
+        return classifier.scorer.nbytes
+    vectorizer = classifier.pipeline.steps[0][1]
+    model = classifier.pipeline.steps[-1][1]
+    return vectorizer.idf_.nbytes + model.coef_.nbytes + model.intercept_.nbytes
+
+
+def artifact_bytes(classifier):
+    """Kích thước file model (pkl gốc hoặc npz đã lượng tử hóa)"""
+    from lightweight_email_classifier import MODEL_FILE
+    if classifier.scorer is not None:
+        return len(classifier.scorer.dumps())
+    return os.path.getsize(os.path.join(MODELS_DIR, MODEL_FILE))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--n', type=int, default=5000, help='Số email để đo độ khớp')
+    parser.add_argument('--batch-sizes', default='1,32,256,2048', help='Kích thước batch, phân cách bằng dấu phẩy')
+    parser.add_argument('--repeat', type=int, default=5, help='Số lần lặp cho mỗi phép đo thời gian')
+    args = parser.parse_args()
+
+    quiet_logging()
+    from lightweight_email_classifier import PRECISIONS, LightweightEmailClassifier
+
+    classifiers = {
+        precision: LightweightEmailClassifier(model_path=MODELS_DIR, precision=precision)
+        for precision in PRECISIONS
+    }
+    emails = mixed_emails(args.n)
+    reference = classifiers['float64']
+    preprocess = reference.preprocess_text
+    texts = [
+        preprocess(e['title']) + ' ' + preprocess(e['content']) + ' ' + preprocess(e['from_email'])
+        for e in emails
+    ]
+    expected = reference.predict_proba(texts)
+    expected_labels = expected.argmax(axis=1)
+
+    print(f'{args.n} email, {len(set(expected_labels.tolist()))} lớp được dự đoán')
+    print('\n%-8s %10s %14s %14s %14s %14s' % (
+        'precision', 'agreement', 'max drift', 'mean drift', 'weights (B)', 'artifact (B)'))
+    for precision, classifier in classifiers.items():
+        probabilities = classifier.predict_proba(texts)
+        drift = np.abs(probabilities.astype(np.float64) - expected)
+        agreement = float((probabilities.argmax(axis=1) == expected_labels).mean())
+        print('%-8s %9.3f%% %14.2e %14.2e %14s %14s' % (
+            precision, agreement * 100, drift.max(), drift.mean(),
+            f'{weight_bytes(classifier):,}', f'{artifact_bytes(classifier):,}'))
+
+    print('\n%-8s %8s %16s %12s' % ('precision', 'batch', 'ms/batch', 'speedup'))
+    for batch_size in [int(s) for s in args.batch_sizes.split(',')]:
+        batch = emails[:batch_size]
+        columns = ([e['title'] for e in batch], [e['content'] for e in batch], [e['from_email'] for e in batch])
+        base_ms = None
+        for precision, classifier in classifiers.items():
+            _, ms = time_call(classifier.predict_many, *columns, repeat=args.repeat)
+            base_ms = base_ms or ms
+            print('%-8s %8d %16.3f %11.2fx' % (precision, len(batch), ms, base_ms / ms))
+
+
+if __name__ == '__main__':
+    main()
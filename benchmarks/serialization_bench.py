@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark lớp serialization của /predict/batch: parse + validate request,
+encode response (records vs columnar) so với cách cũ (get_json + jsonify)
+
+Usage:
+    python benchmarks/serialization_bench.py [--sizes 100,1000,10000] [--repeat N]
+"""
+
+import argparse
+import json
+import random
+
+from common import SAMPLE_EMAILS, quiet_logging, time_call
+
+CATEGORIES = ['An toàn', 'Nghi ngờ', 'Spam', 'Giả mạo']
+
+
+def make_request(n):
+    return json.dumps({
+        'method': 'ml',
+        'emails': [SAMPLE_EMAILS[i % len(SAMPLE_EMAILS)] for i in range(n)]
+    }, ensure_ascii=False).encode('utf-8')
+
+
+def make_results(n, seed=0):
+    """Kết quả ML giả lập có cùng cấu trúc với LightweightEmailClassifier.predict"""
+    rng = random.Random(seed)
+    results = []
+    for _ in range(n):
+        weights = [rng.random() for _ in CATEGORIES]
+        total = sum(weights)
+        probabilities = {category: w / total for category, w in zip(CATEGORIES, weights)}
+        category = max(probabilities, key=probabilities.get)
+        results.append({
+            'category': category,
+            'confidence': probabilities[category],
+            'probabilities': probabilities
+        })
+    return results
+
+
+def legacy_validate(data):
+    """Vòng validate cũ trong predict_batch"""
+    emails = data['emails']
+    for i, email in enumerate(emails):
+        for field in ['title', 'content', 'from_email']:
+            if field not in email:
+                return f'Email {i+1} missing required field: {field}'
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='100,1000,10000', help='Số email mỗi batch, phân cách bằng dấu phẩy')
+    parser.add_argument('--repeat', type=int, default=20, help='Số lần lặp cho mỗi phép đo')
+    args = parser.parse_args()
+
+    quiet_logging()
+    from flask import Flask, jsonify
+    import serialization
+
+    app = Flask(__name__)
+    id_to_category = dict(enumerate(CATEGORIES))
+    print(f'codec: {serialization.codec}')
+
+    print('\n%-7s %-28s %12s %12s' % ('n', 'stage', 'time (ms)', 'bytes'))
+    for n in [int(s) for s in args.sizes.split(',')]:
+        body = make_request(n)
+        results = make_results(n)
+        payload = {'success': True, 'method': 'ml', 'results': results, 'total_processed': n}
+
+        _, legacy_parse = time_call(lambda: legacy_validate(json.loads(body)), repeat=args.repeat)
+        _, fast_parse = time_call(lambda: serialization.validate_batch(serialization.loads(body)),
+                                  repeat=args.repeat)
+
+        with app.app_context():
+            legacy_body, legacy_encode = time_call(lambda: jsonify(payload).get_data(), repeat=args.repeat)
+        fast_body, fast_encode = time_call(serialization.dumps, payload, repeat=args.repeat)
+
+        def encode_columnar():
+            columns = serialization.columnar_results('ml', results, id_to_category)
+            header = {key: value for key, value in payload.items() if key != 'results'}
+            return serialization.dumps(dict(header, **columns))
+        columnar_body, columnar_encode = time_call(encode_columnar, repeat=args.repeat)
+
+        rows = [
+            ('parse+validate (legacy)', legacy_parse, len(body)),
+            ('parse+validate (fast)', fast_parse, len(body)),
+            ('encode records (jsonify)', legacy_encode, len(legacy_body)),
+            ('encode records (fast)', fast_encode, len(fast_body)),
+            ('encode columnar (fast)', columnar_encode, len(columnar_body))
+        ]
+        for stage, ms, size in rows:
+            print('%-7d %-28s %12.3f %12d' % (n, stage, ms, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+Soak test: tải liên tục lên API đang chạy trong thời gian dài và theo dõi bộ
+nhớ của worker (RSS, bộ nhớ được trace) qua /admin/memory, để phát hiện RSS
+tăng dần theo thời gian.
+
+Mỗi khoảng --interval giây ghi một dòng CSV (thời gian, số request, lỗi, RPS,
+p50/p95 độ trễ, RSS, bộ nhớ được trace). Cuối cùng in mức tăng RSS, độ dốc
+(MB/giờ) và (với --diagnostics) các bước xử lý / vị trí cấp phát tăng nhiều
+nhất. Vẽ biểu đồ PNG nếu có matplotlib, ngược lại in biểu đồ dạng text.
+
+Với nhiều worker (gunicorn), mỗi lần gọi /admin/memory chỉ trả về một worker:
+chạy API một worker khi soak test.
+
+Usage:
+    python api_backend.py &
+    python benchmarks/soak_test.py [--url http://localhost:5001] [--duration 600]
+        [--concurrency 4] [--mix rule=4,ml=2,batch=1] [--batch-size 100]
+        [--interval 5] [--diagnostics] [--csv soak.csv] [--plot soak.png]
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from common import SAMPLE_EMAILS, percentile
+
+ENDPOINTS = {
+    'rule': '/predict/rule',
+    'ml': '/predict/ml',
+    'batch': '/predict/batch'
+}
+CSV_FIELDS = ('elapsed_s', 'requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'rss_bytes', 'traced_bytes')
+
+
+def request_json(url, payload=None, headers=None, timeout=30):
+    """Gửi request JSON (POST nếu có payload), trả về (status, body dạng dict)"""
+    data = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers=dict(headers or {}, **{'Content-Type': 'application/json'}))
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            return response.status, json.loads(response.read() or b'{}')
+    except urllib.error.HTTPError as e:
+        return e.code, None
+
+
+def parse_mix(text):
+    """'rule=4,ml=2,batch=1' -> danh sách endpoint theo tỉ lệ"""
+    mix = []
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ENDPOINTS:
+            raise SystemExit(f'Unknown endpoint in --mix: {name} (allowed: {", ".join(ENDPOINTS)})')
+        mix.extend([name] * int(weight or 1))
+    return mix
+
+
+class SoakStats:
+    """Bộ đếm dùng chung giữa các thread gửi tải, được lấy và reset theo từng khoảng"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.latencies = []
+
+    def add(self, latency_ms, ok):
+        with self._lock:
+            self.requests += 1
+            if not ok:
+                self.errors += 1
+            self.latencies.append(latency_ms)
+
+    def take(self):
+        with self._lock:
+            requests, errors, latencies = self.requests, self.errors, self.latencies
+            self.requests, self.errors, self.latencies = 0, 0, []
+        return requests, errors, latencies
+
+
+def make_payload(kind, counter, batch_size):
+    """Email mẫu với title khác nhau để phần lớn request không trúng cache kết quả"""
+    i = next(counter)
+    email = dict(SAMPLE_EMAILS[i % len(SAMPLE_EMAILS)])
+    email['title'] = f"{email['title']} #{i}"
+    if kind != 'batch':
+        return email
+    emails = []
+    for j in range(batch_size):
+        item = dict(SAMPLE_EMAILS[(i + j) % len(SAMPLE_EMAILS)])
+        item['title'] = f"{item['title']} #{i}-{j}"
+        emails.append(item)
+    return {'emails': emails, 'method': 'rule' if i % 2 else 'ml'}
+
+
+def load_worker(args, mix, stats, counter, stop):
+    for kind in itertools.cycle(mix):
+        if stop.is_set():
+            return
+        payload = make_payload(kind, counter, args.batch_size)
+        start = time.perf_counter()
+        try:
+            status, _ = request_json(args.url + ENDPOINTS[kind], payload)
+            ok = status == 200
+        except (OSError, ValueError):
+            ok = False
+        stats.add((time.perf_counter() - start) * 1000, ok)
+
+
+def memory_report(args, top=0):
+    status, body = request_json(f'{args.url}/admin/memory?top={top}', headers=args.headers)
+    if status != 200 or body is None:
+        raise SystemExit(f'/admin/memory returned HTTP {status} (check --admin-token; /admin/* needs EMAIL_ADMIN_TOKEN on the server)')
+    return body
+
+
+def slope_per_hour(points):
+    """Độ dốc bình phương tối thiểu (đơn vị/giờ) của các điểm (giây, giá trị)"""
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var_x = sum((x - mean_x) ** 2 for x, _ in points)
+    if not var_x:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var_x * 3600
+
+
+def text_plot(rows, width=60, height=12):
+    """Biểu đồ RSS theo thời gian dạng text"""
+    values = [row['rss_bytes'] / 1024 / 1024 for row in rows if row['rss_bytes']]
+    if len(values) < 2:
+        return
+    if len(values) > width:
+        step = len(values) / width
+        values = [values[int(i * step)] for i in range(width)]
+    low, high = min(values), max(values)
+    span = (high - low) or 1
+    levels = [int((value - low) / span * (height - 1)) for value in values]
+    print(f'\nRSS (MB) {low:.1f} - {high:.1f}')
+    for level in range(height - 1, -1, -1):
+        print('|' + ''.join('*' if value_level == level else ' ' for value_level in levels))
+    print('+' + '-' * len(levels) + ' time')
+
+
+def save_plot(rows, path):
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print('matplotlib not installed: printing text plot instead')
+        text_plot(rows)
+        return
+    elapsed = [row['elapsed_s'] for row in rows]
+    fig, (ax_memory, ax_latency) = plt.subplots(2, 1, sharex=True, figsize=(10, 6))
+    ax_memory.plot(elapsed, [(row['rss_bytes'] or 0) / 1024 / 1024 for row in rows], label='RSS')
+    if any(row['traced_bytes'] is not None for row in rows):
+        ax_memory.plot(elapsed, [(row['traced_bytes'] or 0) / 1024 / 1024 for row in rows], label='traced (tracemalloc)')
+    ax_memory.set_ylabel('MB')
+    ax_memory.legend()
+    ax_latency.plot(elapsed, [row['p50_ms'] for row in rows], label='p50')
+    ax_latency.plot(elapsed, [row['p95_ms'] for row in rows], label='p95')
+    ax_latency.set_ylabel('ms')
+    ax_latency.set_xlabel('seconds')
+    ax_latency.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+    print(f'Plot saved to {path}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://localhost:5001', help='Địa chỉ API')
+    parser.add_argument('--duration', type=float, default=600, help='Thời gian chạy (giây)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Số thread gửi tải')
+    parser.add_argument('--mix', default='rule=4,ml=2,batch=1', help='Tỉ lệ các loại request')
+    parser.add_argument('--batch-size', type=int, default=100, help='Số email mỗi request /predict/batch')
+    parser.add_argument('--interval', type=float, default=5, help='Giây giữa hai lần lấy mẫu bộ nhớ')
+    parser.add_argument('--diagnostics', action='store_true',
+                        help='Bật tracemalloc trên server trong lúc chạy (chậm hơn, có số liệu theo stage)')
+    parser.add_argument('--top', type=int, default=10, help='Số vị trí cấp phát in ra cuối cùng')
+    parser.add_argument('--admin-token', default=None,
+                        help='Giá trị EMAIL_ADMIN_TOKEN của server (bắt buộc: /admin/* bị tắt khi server không đặt token)')
+    parser.add_argument('--csv', default=None, help='Ghi số liệu theo thời gian ra file CSV')
+    parser.add_argument('--plot', default=None, help='Vẽ biểu đồ bộ nhớ/độ trễ ra file PNG')
+    args = parser.parse_args()
+    args.url = args.url.rstrip('/')
+    args.headers = {'X-Admin-Token': args.admin_token} if args.admin_token else {}
+
+    mix = parse_mix(args.mix)
+    if args.diagnostics:
+        request_json(f'{args.url}/admin/memory', {'action': 'start', 'rss_interval': args.interval},
+                     headers=args.headers)
+
+    stats = SoakStats()
+    counter = itertools.count()
+    stop = threading.Event()
+    threads = [
+        threading.Thread(target=load_worker, args=(args, mix[i % len(mix):] + mix[:i % len(mix)], stats, counter, stop),
+                         daemon=True)
+        for i in range(args.concurrency)
+    ]
+
+    rows = []
+    start = time.time()
+    writer = None
+    csv_file = open(args.csv, 'w', newline='') if args.csv else None
+    if csv_file is not None:
+        writer = csv.DictWriter(csv_file, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+
+    print(f'Soak test {args.url} for {args.duration:.0f}s, concurrency {args.concurrency}, mix {args.mix}')
+    print(f"{'elapsed':>8} {'requests':>9} {'errors':>7} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'RSS MB':>8} {'traced MB':>10}")
+    try:
+        for thread in threads:
+            thread.start()
+        while time.time() - start < args.duration:
+            time.sleep(min(args.interval, max(0.0, args.duration - (time.time() - start))))
+            requests, errors, latencies = stats.take()
+            memory = memory_report(args)
+            row = {
+                'elapsed_s': round(time.time() - start, 1),
+                'requests': requests,
+                'errors': errors,
+                'rps': round(requests / args.interval, 1),
+                'p50_ms': round(percentile(latencies, 50), 2),
+                'p95_ms': round(percentile(latencies, 95), 2),
+                'rss_bytes': memory.get('rss_bytes'),
+                'traced_bytes': memory.get('traced_bytes')
+            }
+            rows.append(row)
+            if writer is not None:
+                writer.writerow(row)
+                csv_file.flush()
+            traced = f"{row['traced_bytes'] / 1024 / 1024:10.2f}" if row['traced_bytes'] is not None else f"{'-':>10}"
+            rss = (row['rss_bytes'] or 0) / 1024 / 1024
+            print(f"{row['elapsed_s']:8.1f} {requests:9d} {errors:7d} {row['rps']:8.1f} "
+                  f"{row['p50_ms']:8.2f} {row['p95_ms']:8.2f} {rss:8.1f} {traced}")
+    except KeyboardInterrupt:
+        print('Interrupted')
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join(30)
+        if csv_file is not None:
+            csv_file.close()
+
+    rss_points = [(row['elapsed_s'], row['rss_bytes']) for row in rows if row['rss_bytes']]
+    if rss_points:
+        first, last = rss_points[0][1], rss_points[-1][1]
+        print(f'\nRSS: {first / 1024 / 1024:.1f} MB -> {last / 1024 / 1024:.1f} MB '
+              f'({(last - first) / 1024 / 1024:+.1f} MB), slope {slope_per_hour(rss_points) / 1024 / 1024:+.1f} MB/hour')
+    print(f"Requests: {sum(row['requests'] for row in rows)}, errors: {sum(row['errors'] for row in rows)}")
+
+    if args.diagnostics:
+        report = memory_report(args, top=args.top)
+        stages = sorted(report.get('stages', {}).items(), key=lambda item: -item[1]['net_bytes'])
+        if stages:
+            print('\nNet traced allocation by stage:')
+            for name, stage in stages:
+                print(f"  {name:<22} {stage['net_bytes'] / 1024:10.1f} KB over {stage['calls']} calls "
+                      f"(max {stage['max_bytes'] / 1024:.1f} KB)")
+        if report.get('top_allocations'):
+            print('\nTop allocation sites since diagnostics started:')
+            for site in report['top_allocations']:
+                print(f"  {site['size_diff'] / 1024:+10.1f} KB {site['count_diff']:+8d} blocks  {site['site']}")
+                if site['code']:
+                    print(f"      {site['code']}")
+        request_json(f'{args.url}/admin/memory', {'action': 'stop'}, headers=args.headers)
+
+    if args.plot:
+        save_plot(rows, args.plot)
+    elif len(rows) > 1:
+        text_plot(rows)
+
+
+if __name__ == '__main__':
+    main()
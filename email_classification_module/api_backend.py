@@ -2,8 +2,24 @@ from flask import Flask, request, jsonify
 from flask_swagger_ui import get_swaggerui_blueprint
 from flask_cors import CORS
 from email_classifier import EmailClassifier
+from email_features import feature_tokens
+from content_policy import DEFAULT_MAX_CHARS, DEFAULT_MAX_QUOTED_CHARS, DEFAULT_MAX_TOKENS, ContentPolicy
+from serialization import (InvalidPayload, RESPONSE_FORMATS, columnar_results, json_response,
+                           read_json, validate_batch, validate_email)
+from columnar_input import EmailColumns, decode_columns, decode_upload, is_columnar_type, supported_types
+from result_cache import DEFAULT_CACHE_PATH, DEFAULT_MAX_BYTES, ResultCache, is_cacheable
+from near_duplicate import DEFAULT_CAPACITY, DEFAULT_THRESHOLD, NearDuplicateIndex
+from job_queue import DEFAULT_CHUNK_SIZE, DEFAULT_JOB_STORE_PATH, JobRunner, JobStore
+from overload import OverloadController, Overloaded
+from shadow import DEFAULT_MAX_QUEUE, DEFAULT_SAMPLE_RATE, ShadowCandidate, ShadowEvaluator
+from diagnostics import DEFAULT_FRAMES, DEFAULT_RSS_INTERVAL, DEFAULT_TOP, MemoryDiagnostics
+from execution import (DEFAULT_PROCESS_WORKERS, TASKS, ClassifierExecutor, load_policy, register_classifiers, run_columns,
+                       run_email)
+from model_registry import DEFAULT_MODEL, MODELS_DIR, ModelRegistry, UnknownModel, load_classifier_class
+import hmac
 import logging
 import os
+import time
 from datetime import datetime
 
 # Thiết lập logging
@@ -16,44 +32,485 @@ app = Flask(__name__)
 CORS(app, resources={
     r"/*": {
         "origins": ["*"],  # Cho phép tất cả origins trong development
-        "methods": ["GET", "POST", "OPTIONS"],
+        "methods": ["GET", "POST", "DELETE", "OPTIONS"],
         "allow_headers": ["Content-Type", "Authorization"]
     }
 })
 
 # Khởi tạo classifiers
 rule_classifier = None
-ml_classifier = None
+ml_classifier = None        # Model mặc định trong process này (None khi mọi tác vụ ML chạy trong worker process)
+ml_available = False        # Model mặc định dùng được (trong process này hoặc trong worker process)
+
+# Độ chính xác trọng số của ML model: 'float64' (gốc), 'float32' hoặc 'int8'
+ML_PRECISION = os.environ.get('EMAIL_ML_PRECISION', 'float64')
+# Thêm token đặc trưng URL/người gửi (email_features) vào input của ML model;
+# chỉ bật với model đã được train cùng các token này
+ML_URL_FEATURES = os.environ.get('EMAIL_ML_URL_FEATURES', '0') == '1'
+
+# ML models: model mặc định ở thư mục gốc, model theo khách hàng / ngôn ngữ ở thư mục con
+# (chọn bằng tham số "model"), load khi dùng lần đầu và giữ trong LRU giới hạn theo bộ nhớ.
+# EMAIL_MODEL_CACHE_MB là tổng cho mọi process giữ model (worker process, và process chính nếu có tác vụ ML chạy trên thread)
+MODELS_PATH = os.environ.get('EMAIL_MODELS_DIR', MODELS_DIR)
+DEFAULT_ML_MODEL = os.environ.get('EMAIL_DEFAULT_MODEL', DEFAULT_MODEL)
+MODEL_CACHE_MAX_BYTES = int(os.environ.get('EMAIL_MODEL_CACHE_MB', '512')) * 1024 * 1024
+model_registry = None
+preloaded_models = set()    # Model được load trước bằng /admin/models, load lại trong worker process mới
+
+# Mapping mặc định khi ML classifier chưa được load
+ID_TO_CATEGORY = {0: 'An toàn', 1: 'Nghi ngờ', 2: 'Spam', 3: 'Giả mạo'}
+
+# Chính sách nội dung áp dụng chung trước cả hai classifiers. Thu gọn phần trích dẫn
+# (EMAIL_CONTENT_STRIP_QUOTED=1) tắt mặc định: payload phishing có thể nằm dưới header
+# trả lời giả; chỉ bật khi benchmarks/content_policy_eval.py không cho thấy mất recall
+CONTENT_MAX_CHARS = int(os.environ.get('EMAIL_CONTENT_MAX_CHARS', str(DEFAULT_MAX_CHARS)))
+CONTENT_MAX_TOKENS = int(os.environ.get('EMAIL_CONTENT_MAX_TOKENS', str(DEFAULT_MAX_TOKENS)))
+CONTENT_STRIP_HTML = os.environ.get('EMAIL_CONTENT_STRIP_HTML', '1') == '1'
+CONTENT_STRIP_QUOTED = os.environ.get('EMAIL_CONTENT_STRIP_QUOTED', '0') == '1'
+CONTENT_MAX_QUOTED_CHARS = int(os.environ.get('EMAIL_CONTENT_MAX_QUOTED_CHARS', str(DEFAULT_MAX_QUOTED_CHARS)))
+content_policy = ContentPolicy(max_chars=CONTENT_MAX_CHARS, max_tokens=CONTENT_MAX_TOKENS,
+                               strip_html=CONTENT_STRIP_HTML, strip_quoted=CONTENT_STRIP_QUOTED,
+                               max_quoted_chars=CONTENT_MAX_QUOTED_CHARS)
+
+# Cache kết quả dùng chung giữa các worker (SQLite local)
+RESULT_CACHE_ENABLED = True
+RESULT_CACHE_PATH = os.environ.get('EMAIL_RESULT_CACHE_PATH', DEFAULT_CACHE_PATH)
+RESULT_CACHE_MAX_BYTES = DEFAULT_MAX_BYTES
+result_cache = None
+
+# Index email gần trùng (MinHash + LSH, trong bộ nhớ của từng worker)
+NEAR_DUPLICATE_ENABLED = os.environ.get('EMAIL_NEAR_DUPLICATE', '0') == '1'
+NEAR_DUPLICATE_THRESHOLD = DEFAULT_THRESHOLD
+NEAR_DUPLICATE_CAPACITY = DEFAULT_CAPACITY
+near_duplicate_index = None
+
+# Job phân loại batch lớn chạy nền (SQLite local + worker threads)
+JOBS_ENABLED = True
+JOB_STORE_PATH = os.environ.get('EMAIL_JOB_STORE_PATH', DEFAULT_JOB_STORE_PATH)
+JOB_WORKERS = int(os.environ.get('EMAIL_JOB_WORKERS', '1'))
+JOB_CHUNK_SIZE = DEFAULT_CHUNK_SIZE
+JOB_MAX_EMAILS = 1000000
+JOB_PAGE_SIZE = 1000
+JOB_MAX_PAGE_SIZE = 10000
+job_store = None
+job_runner = None
+
+# Kiểm soát quá tải: degraded (đổi sang classifier rẻ hơn, giới hạn batch) rồi 503 + Retry-After
+OVERLOAD_ENABLED = True
+OVERLOAD_SOFT_LIMIT = int(os.environ.get('EMAIL_OVERLOAD_SOFT_LIMIT', '8'))
+OVERLOAD_HARD_LIMIT = int(os.environ.get('EMAIL_OVERLOAD_HARD_LIMIT', '32'))
+OVERLOAD_LATENCY_TARGET_MS = float(os.environ.get('EMAIL_OVERLOAD_LATENCY_MS', '500'))
+overload_controller = None
+
+# Shadow evaluation: candidate (ruleset hoặc ML model mới) chạy nền trên một phần traffic thật
+SHADOW_ENABLED = True
+SHADOW_RULESET_PATH = os.environ.get('EMAIL_SHADOW_RULESET_PATH')
+SHADOW_MODEL_PATH = os.environ.get('EMAIL_SHADOW_MODEL_PATH')
+SHADOW_ML_PRECISION = os.environ.get('EMAIL_SHADOW_ML_PRECISION', 'float64')
+SHADOW_ML_URL_FEATURES = os.environ.get('EMAIL_SHADOW_ML_URL_FEATURES', '0') == '1'
+SHADOW_SAMPLE_RATE = float(os.environ.get('EMAIL_SHADOW_SAMPLE_RATE', str(DEFAULT_SAMPLE_RATE)))
+SHADOW_MAX_QUEUE = DEFAULT_MAX_QUEUE
+shadow_evaluator = None
+
+# Chẩn đoán bộ nhớ (tracemalloc + RSS), bật qua /admin/memory hoặc EMAIL_DIAGNOSTICS=1 khi khởi động
+DIAGNOSTICS_AT_STARTUP = os.environ.get('EMAIL_DIAGNOSTICS', '0') == '1'
+# Các endpoint /admin/* yêu cầu header X-Admin-Token bằng giá trị này; không đặt thì /admin/* bị tắt (404)
+ADMIN_TOKEN = os.environ.get('EMAIL_ADMIN_TOKEN') or None
+diagnostics = MemoryDiagnostics()
+
+# Chạy phân loại trên thread của request hay trong process pool, theo từng tác vụ
+# (mặc định theo số CPU; EMAIL_EXECUTION_POLICY: file JSON từ benchmarks/concurrency_bench.py)
+EXECUTION_ENABLED = True
+EXECUTION_PREWARM = True        # Khởi động worker process lúc init (spawn + load model mất vài giây)
+EXECUTION_POLICY_PATH = os.environ.get('EMAIL_EXECUTION_POLICY')
+EXECUTION_MODE = None           # 'thread' / 'process': dùng cho mọi tác vụ thay cho policy (server ASGI)
+PROCESS_WORKERS = int(os.environ.get('EMAIL_PROCESS_WORKERS', str(DEFAULT_PROCESS_WORKERS)))
+executor = None
 
 def init_classifiers():
     """Khởi tạo các classifiers"""
-    global rule_classifier, ml_classifier
+    global rule_classifier, ml_classifier, ml_available, model_registry
+    
+    # Bật trước khi load model để đo được bộ nhớ của ruleset / pipeline đã unpickle
+    if DIAGNOSTICS_AT_STARTUP:
+        diagnostics.start()
     
     # Initialize rule-based classifier
     try:
-        rule_classifier = EmailClassifier()
+        with diagnostics.stage('load_rule_classifier'):
+            rule_classifier = EmailClassifier()
+            rule_classifier.warm_up()
         logger.info("✅ Rule-based classifier loaded successfully")
     except Exception as e:
         logger.error(f"❌ Failed to load rule-based classifier: {e}")
         rule_classifier = None
     
-    # Initialize ML classifier
+    # Execution policy trước ML model: process chính chỉ load model khi có tác vụ ML chạy trên thread
+    init_executor()
+    
+    # Initialize ML classifier (model mặc định; các model khác được load khi có request)
+    ml_classifier = None
     try:
-        import sys
-        import os
-        # Add the models directory to Python path
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        models_path = os.path.join(current_dir, '..', 'models')
-        sys.path.append(models_path)
-        
-        from lightweight_email_classifier import LightweightEmailClassifier
-        ml_classifier = LightweightEmailClassifier(model_path=models_path)
-        logger.info("✅ ML classifier (TF-IDF + LR) loaded successfully")
+        model_registry = ModelRegistry(**registry_options())
+        if ml_in_process():
+            with diagnostics.stage('load_ml_classifier'):
+                ml_classifier = model_registry.get()
+            logger.info(f"✅ ML classifier (TF-IDF + LR, {ml_classifier.precision}) loaded successfully")
+        else:
+            # Chỉ kiểm tra model mặc định tồn tại và đọc được; worker process load model
+            logger.info(f"✅ ML classifier {model_registry.version()} available to worker processes")
+        ml_available = True
     except Exception as e:
         logger.error(f"❌ Failed to load ML classifier: {e}")
-        ml_classifier = None
+        ml_available = False
+    
+    register_classifiers(rule_classifier, ml_classifier, model_registry)
+    if executor is not None and EXECUTION_PREWARM:
+        executor.start()
+    init_result_cache()
+    init_near_duplicate_index()
+    init_job_runner()
+    init_overload_controller()
+    init_shadow_evaluator()
+    
+    return rule_classifier is not None or ml_available
+
+def ml_in_process():
+    """Có tác vụ ML chạy trên thread của process chính không (khi đó process chính giữ model)"""
+    return executor is None or not all(executor.mode(task) == 'process' for task in ('ml', 'batch_ml'))
+
+def model_processes():
+    """Số process giữ ML model, để chia EMAIL_MODEL_CACHE_MB"""
+    count = 1 if ml_in_process() else 0
+    if executor is not None and executor.uses_processes('ml', 'batch_ml'):
+        count += executor.process_workers
+    return max(1, count)
+
+def registry_options():
+    """Tham số ModelRegistry, dùng chung cho process chính và worker process"""
+    return {
+        'models_dir': MODELS_PATH,
+        'max_bytes': MODEL_CACHE_MAX_BYTES // model_processes(),
+        'default_model': DEFAULT_ML_MODEL,
+        'precision': ML_PRECISION,
+        'feature_tokens': feature_tokens,
+        'url_features': ML_URL_FEATURES
+    }
+
+def worker_config():
+    """
+    Cấu hình worker process (execution.init_worker): chỉ các classifier mà tác vụ
+    chạy bằng process cần đến, gọi mỗi lần process pool được tạo
+    """
+    return {
+        'rule': rule_classifier is not None and executor.uses_processes('rule', 'batch_rule'),
+        'registry': registry_options()
+        if ml_available and executor.uses_processes('ml', 'batch_ml') else None,
+        'preload': sorted(name for name in preloaded_models if name in model_registry)
+    }
+
+def restart_workers():
+    """Tạo lại worker process để chúng thấy thay đổi của model registry (không làm gì nếu không dùng process)"""
+    if executor is not None and executor.uses_processes('ml', 'batch_ml') and executor.restart():
+        logger.info("♻️ Restarted classifier worker processes")
+
+def init_executor():
+    """Chọn thread/process cho từng tác vụ phân loại theo execution policy"""
+    global executor
+    
+    if not EXECUTION_ENABLED:
+        executor = None
+        return
+    try:
+        policy = load_policy(EXECUTION_POLICY_PATH)
+    except (OSError, ValueError) as e:
+        logger.error(f"❌ Invalid execution policy {EXECUTION_POLICY_PATH}: {e}")
+        policy = load_policy()
+    if EXECUTION_MODE is not None:
+        policy = {task: EXECUTION_MODE for task in TASKS}
+    executor = ClassifierExecutor(policy, process_workers=PROCESS_WORKERS, worker_config=worker_config)
+    logger.info(f"🧵 Execution policy: {', '.join(f'{task}={mode}' for task, mode in policy.items())}")
+
+def run_classifier(task, func, *args):
+    """Chạy tác vụ phân loại theo execution policy (trực tiếp nếu không có executor)"""
+    if executor is None:
+        return func(*args)
+    return executor.call(task, func, *args)
+
+def init_result_cache():
+    """Mở cache kết quả dùng chung (lỗi cache không làm dừng API)"""
+    global result_cache
+    
+    if not RESULT_CACHE_ENABLED:
+        result_cache = None
+        return
+    try:
+        result_cache = ResultCache(RESULT_CACHE_PATH, RESULT_CACHE_MAX_BYTES)
+        logger.info(f"✅ Result cache ready at {RESULT_CACHE_PATH}")
+    except Exception as e:
+        logger.error(f"❌ Failed to open result cache: {e}")
+        result_cache = None
+
+def init_near_duplicate_index():
+    """Tạo index email gần trùng"""
+    global near_duplicate_index
+    
+    if NEAR_DUPLICATE_ENABLED:
+        near_duplicate_index = NearDuplicateIndex(NEAR_DUPLICATE_THRESHOLD, NEAR_DUPLICATE_CAPACITY)
+    else:
+        near_duplicate_index = None
+
+def init_job_runner():
+    """Mở job store và khởi động worker xử lý job nền (tiếp tục job bị gián đoạn)"""
+    global job_store, job_runner
+    
+    if job_runner is not None:
+        job_runner.stop()
+        job_runner = None
+    if not JOBS_ENABLED:
+        job_store = None
+        return
+    try:
+        job_store = JobStore(JOB_STORE_PATH, JOB_CHUNK_SIZE)
+        job_runner = JobRunner(job_store, classify_job_chunk, JOB_WORKERS)
+        job_runner.start()
+        logger.info(f"✅ Job store ready at {JOB_STORE_PATH} ({JOB_WORKERS} worker(s))")
+    except Exception as e:
+        logger.error(f"❌ Failed to start job runner: {e}")
+        job_store = None
+        job_runner = None
+
+def init_overload_controller():
+    """Tạo overload controller (giới hạn tính theo từng worker process)"""
+    global overload_controller
+    
+    if OVERLOAD_ENABLED:
+        overload_controller = OverloadController(OVERLOAD_SOFT_LIMIT, OVERLOAD_HARD_LIMIT, OVERLOAD_LATENCY_TARGET_MS)
+    else:
+        overload_controller = None
+
+def init_shadow_evaluator():
+    """
+    Load candidate từ EMAIL_SHADOW_RULESET_PATH / EMAIL_SHADOW_MODEL_PATH
+    và khởi động thread đánh giá (không làm gì nếu không có candidate)
+    """
+    global shadow_evaluator
+    
+    if shadow_evaluator is not None:
+        shadow_evaluator.stop()
+        shadow_evaluator = None
+    if not SHADOW_ENABLED or not (SHADOW_RULESET_PATH or SHADOW_MODEL_PATH):
+        return
+    
+    candidates = []
+    try:
+        if SHADOW_RULESET_PATH and rule_classifier is not None:
+            candidate = EmailClassifier(ruleset_path=SHADOW_RULESET_PATH)
+            candidates.append(ShadowCandidate(
+                'rule', candidate.classify_email,
+                f'ruleset {candidate.ruleset.name} ({SHADOW_RULESET_PATH})',
+                candidate.version, rule_classifier.version
+            ))
+        if SHADOW_MODEL_PATH and ml_available:
+            LightweightEmailClassifier = load_classifier_class()
+            candidate = LightweightEmailClassifier(model_path=SHADOW_MODEL_PATH, precision=SHADOW_ML_PRECISION,
+                                                   feature_tokens=feature_tokens if SHADOW_ML_URL_FEATURES else None)
+            candidates.append(ShadowCandidate(
+                'ml', lambda email, model=candidate: model.predict(
+                    title=email['title'], content=email['content'], from_email=email['from_email']),
+                f'ml model {SHADOW_MODEL_PATH} ({SHADOW_ML_PRECISION})',
+                candidate.version, model_registry.version()
+            ))
+    except Exception as e:
+        logger.error(f"❌ Failed to load shadow candidate: {e}")
+        return
+    if not candidates:
+        return
+    
+    shadow_evaluator = ShadowEvaluator(candidates, SHADOW_SAMPLE_RATE, SHADOW_MAX_QUEUE, prepare=content_policy.apply)
+    shadow_evaluator.start()
+    logger.info(f"👥 Shadow evaluation enabled for {', '.join(c.description for c in candidates)} "
+                f"(sample rate {SHADOW_SAMPLE_RATE})")
+
+def classify_job_chunk(method, titles, contents, from_emails, model=None):
+    """Phân loại một chunk của job (cùng pipeline cache / gần trùng với /predict/batch)"""
+    return classify_columns(method, EmailColumns(titles, contents, from_emails, model=model))
+
+def method_available(method):
+    """Classifier cho method đã được load chưa"""
+    return (method == 'rule' and rule_classifier is not None) or (method == 'ml' and ml_available)
+
+def get_id_to_category(model=None):
+    """Mapping category id -> tên category (ưu tiên mapping của ML model)"""
+    if ml_available:
+        return model_registry.id_to_category(model)
+    return ID_TO_CATEGORY
+
+def unknown_model(model):
+    """Tên model không hợp lệ hoặc không có trong thư mục models"""
+    return model is not None and (not isinstance(model, str) or model not in model_registry)
+
+def read_batch(req):
+    """
+    Đọc batch email từ request: JSON {"emails": [...]} hoặc payload cột nhị phân
+    
+    Returns:
+        tuple: (EmailColumns, error) - error là None nếu hợp lệ
+    """
+    if is_columnar_type(req.mimetype):
+        columns = decode_columns(req.get_data(cache=False), req.mimetype)
+    else:
+        data = read_json(req)
+        emails, method, response_format, error = validate_batch(data)
+        if error:
+            return None, error
+        columns = EmailColumns.from_records(emails, method, response_format, data.get('model'))
+    
+    # Query string (?method=ml&format=columnar&model=acme/vi) được ưu tiên
+    columns.method = req.args.get('method', columns.method)
+    columns.format = req.args.get('format', columns.format)
+    columns.model = req.args.get('model', columns.model)
+    if columns.format is not None and columns.format not in RESPONSE_FORMATS:
+        return None, f'format must be one of: {", ".join(RESPONSE_FORMATS)}'
+    return columns, None
+
+def classify_columns(method, columns):
+    """
+    Áp dụng content policy, tra cache / index gần trùng và phân loại batch dạng cột
+    (ML: bằng model columns.model, mặc định là model mặc định)
+    
+    Returns:
+        tuple: (kết quả theo thứ tự đầu vào, thống kê reuse),
+               hoặc (None, None) nếu method không khả dụng
+    """
+    if method == 'rule' and rule_classifier:
+        version = rule_classifier.version
+        fields = ('category', 'confidence', 'indicators', 'level')
+    elif method == 'ml' and ml_available:
+        model = model_registry.resolve(columns.model)
+        version = model_registry.version(model)
+        fields = ('category', 'confidence', 'probabilities')
+    else:
+        return None, None
+    
+    with diagnostics.stage('content_policy'):
+        titles, contents, from_emails = content_policy.apply_columns(
+            columns.titles, columns.contents, columns.from_emails)
+    n = len(titles)
+    reuse = {'cache_hits': 0, 'near_duplicate_hits': 0}
+    
+    # 1. Cache kết quả dùng chung (khớp chính xác)
+    keys = None
+    results = [None] * n
+    if result_cache is not None:
+        with diagnostics.stage('cache_lookup'):
+            keys = [
+                result_cache.make_key(method, version, title, content, from_email)
+                for title, content, from_email in zip(titles, contents, from_emails)
+            ]
+            results = result_cache.get_many(keys)
+        reuse['cache_hits'] = n - results.count(None)
+    
+    # Email trùng lặp trong cùng batch (cùng chiến dịch) chỉ phân loại một lần
+    pending = {}
+    for i, result in enumerate(results):
+        if result is None:
+            dedupe_key = keys[i] if keys is not None else (titles[i], contents[i], from_emails[i])
+            pending.setdefault(dedupe_key, []).append(i)
+    
+    # 2. Index email gần trùng (biến thể của cùng chiến dịch)
+    namespace = f'{method}:{version}'
+    fingerprints = {}
+    if near_duplicate_index is not None:
+        for dedupe_key, indices in list(pending.items()):
+            i = indices[0]
+            fingerprint = near_duplicate_index.fingerprint(titles[i], contents[i], from_emails[i])
+            verdict, similarity = near_duplicate_index.lookup(namespace, fingerprint)
+            if verdict is None:
+                fingerprints[dedupe_key] = fingerprint
+                continue
+            for j in indices:
+                results[j] = dict(verdict, near_duplicate=True, similarity=similarity)
+            reuse['near_duplicate_hits'] += len(indices)
+            del pending[dedupe_key]
+    
+    # 3. Phân loại phần còn lại trong một lần gọi vectorized
+    if pending:
+        firsts = [indices[0] for indices in pending.values()]
+        start_time = time.perf_counter()
+        with diagnostics.stage(f'classify_{method}'):
+            computed = run_classifier(
+                f'batch_{method}', run_columns, method,
+                [titles[i] for i in firsts],
+                [contents[i] for i in firsts],
+                [from_emails[i] for i in firsts],
+                model if method == 'ml' else None
+            )
+        elapsed = (time.perf_counter() - start_time) * 1000
+        record_cost(method, elapsed, len(firsts))
+        if method == 'ml':
+            model_registry.record(model, elapsed, len(firsts))
+        
+        for (dedupe_key, indices), result in zip(pending.items(), computed):
+            for j in indices:
+                results[j] = result
+            if near_duplicate_index is not None and is_cacheable(result):
+                near_duplicate_index.add(namespace, fingerprints.get(dedupe_key), result)
+        if near_duplicate_index is not None:
+            near_duplicate_index.record_cost(namespace, elapsed, len(firsts))
+        if result_cache is not None:
+            result_cache.set_many(list(zip(pending.keys(), computed)))
+    
+    projected = []
+    for result in results:
+        row = {field: result[field] for field in fields}
+        if result.get('near_duplicate'):
+            row['near_duplicate'] = True
+            row['similarity'] = result['similarity']
+        projected.append(row)
+    return projected, reuse
+
+def cached_classify(method, version, email, classify):
+    """
+    Tra cache dùng chung rồi tới index email gần trùng trước khi phân loại
+    một email (đã qua content policy)
+    
+    Returns:
+        tuple: (kết quả, thông tin reuse: cached / near_duplicate / similarity)
+    """
+    reuse = {'cached': False, 'near_duplicate': False}
+    title, content, from_email = email['title'], email['content'], email['from_email']
+    
+    key = None
+    if result_cache is not None:
+        key = result_cache.make_key(method, version, title, content, from_email)
+        result = result_cache.get(key)
+        if result is not None:
+            reuse['cached'] = True
+            return result, reuse
+    
+    namespace = f'{method}:{version}'
+    fingerprint = None
+    if near_duplicate_index is not None:
+        fingerprint = near_duplicate_index.fingerprint(title, content, from_email)
+        verdict, similarity = near_duplicate_index.lookup(namespace, fingerprint)
+        if verdict is not None:
+            reuse['near_duplicate'] = True
+            reuse['similarity'] = similarity
+            return verdict, reuse
+    
+    start_time = time.perf_counter()
+    result = classify()
+    elapsed = (time.perf_counter() - start_time) * 1000
     
-    return rule_classifier is not None or ml_classifier is not None
+    # Kết quả lỗi / fallback không được dùng lại cho email khác (result_cache tự bỏ qua)
+    if near_duplicate_index is not None:
+        near_duplicate_index.record_cost(namespace, elapsed)
+        if is_cacheable(result):
+            near_duplicate_index.add(namespace, fingerprint, result)
+    if result_cache is not None:
+        result_cache.set(key, result)
+    return result, reuse
 
 # Swagger configuration
 SWAGGER_URL = '/swagger'
@@ -76,7 +533,7 @@ def home():
         'version': '1.0.0',
         'classifiers': {
             'rule_based': rule_classifier is not None,
-            'ml_classifier': ml_classifier is not None
+            'ml_classifier': ml_available
         },
         'endpoints': {
             'health': '/health',
@@ -84,21 +541,41 @@ def home():
             'predict_rule': '/predict/rule',
             'predict_ml': '/predict/ml',
             'predict_batch': '/predict/batch',
-            'model_info': '/model_info'
+            'model_info': '/model_info',
+            'cache_stats': '/cache/stats',
+            'near_duplicate_stats': '/near_duplicate/stats',
+            'jobs': '/jobs',
+            'shadow_report': '/shadow/report',
+            'models': '/models',
+            'admin_memory': '/admin/memory',
+            'admin_models': '/admin/models'
         }
     })
 
 @app.route('/health')
 def health_check():
-    """Kiểm tra trạng thái API"""
-    return jsonify({
-        'status': 'healthy',
+    """
+    Kiểm tra trạng thái API
+
+    status: healthy / degraded (đang đổi classifier, giới hạn batch) /
+    overloaded (đang trả 503, HTTP 503 để load balancer tạm bỏ qua worker này)
+    """
+    load = overload_controller.stats() if overload_controller is not None else None
+    state = load['state'] if load is not None else 'normal'
+    response = jsonify({
+        'status': 'healthy' if state == 'normal' else state,
         'timestamp': datetime.now().isoformat(),
         'classifiers': {
             'rule_based': rule_classifier is not None,
-            'ml_classifier': ml_classifier is not None
-        }
+            'ml_classifier': ml_available
+        },
+        'load': load,
+        'execution': executor.stats() if executor is not None else None
     })
+    if state == 'overloaded':
+        response.status_code = 503
+        response.headers['Retry-After'] = str(load['retry_after'])
+    return response
 
 @app.route('/model_info')
 def model_info():
@@ -109,6 +586,12 @@ def model_info():
                 'type': 'Rule-based Email Classifier',
                 'version': '1.0.0',
                 'algorithm': 'Pattern-based classification with regex',
+                'ruleset': {
+                    'name': rule_classifier.ruleset.name,
+                    'version': rule_classifier.ruleset.version,
+                    'patterns': len(rule_classifier.ruleset.patterns),
+                    'warnings': rule_classifier.ruleset.warnings
+                } if rule_classifier is not None else None,
                 'loaded': rule_classifier is not None
             },
             'ml_classifier': {
@@ -117,7 +600,11 @@ def model_info():
                 'algorithm': 'TF-IDF vectorization + Logistic Regression',
                 'accuracy': '99.92%',
                 'training_time': '3.62 seconds',
-                'loaded': ml_classifier is not None
+                'precision': ml_classifier.precision if ml_classifier is not None else ML_PRECISION,
+                'url_features': ML_URL_FEATURES,
+                'default_model': DEFAULT_ML_MODEL,
+                'available_models': model_registry.names() if model_registry is not None else [],
+                'loaded': ml_available
             }
         },
         'categories': {
@@ -126,230 +613,802 @@ def model_info():
             '2': 'Spam',
             '3': 'Giả mạo'
         },
-        'features': ['title', 'content', 'from_email']
+        'features': ['title', 'content', 'from_email'],
+        'content_policy': content_policy.to_dict(),
+        'batch_input_formats': ['application/json'] + supported_types()
     })
 
-@app.route('/predict/rule', methods=['POST', 'OPTIONS'])
-def predict_rule():
+@app.route('/cache/stats')
+def cache_stats():
+    """Thống kê cache kết quả dùng chung (hit ratio, độ trễ, dung lượng)"""
+    if result_cache is None:
+        return jsonify({
+            'enabled': False
+        })
+    return jsonify(dict(result_cache.stats(), enabled=True))
+
+@app.route('/near_duplicate/stats')
+def near_duplicate_stats():
+    """Thống kê index email gần trùng (tỉ lệ reuse, thời gian tiết kiệm)"""
+    if near_duplicate_index is None:
+        return jsonify({
+            'enabled': False
+        })
+    return jsonify(dict(near_duplicate_index.stats(), enabled=True))
+
+def overload_result(error):
+    """(status, payload, headers) 503 + Retry-After khi server quá tải"""
+    return 503, {
+        'success': False,
+        'error': str(error),
+        'retry_after': error.retry_after
+    }, {'Retry-After': str(error.retry_after)}
+
+def overload_response(error):
+    """503 + Retry-After khi server quá tải"""
+    status, payload, headers = overload_result(error)
+    return json_response(payload, status, headers=headers)
+
+def admit_request(size=1):
+    """Nhận request qua overload controller (None nếu controller bị tắt)"""
+    if overload_controller is None:
+        return None
+    return overload_controller.admit(size)
+
+def release_request(admission, count=1):
+    if admission is not None:
+        overload_controller.release(admission, count)
+
+def record_cost(method, elapsed_ms, count=1):
+    """Chi phí/email của classifier cho overload controller (chỉ gọi khi classifier thực sự chạy)"""
+    if overload_controller is not None:
+        overload_controller.record_cost(method, elapsed_ms, count)
+
+def route_method(method, admission):
+    """Classifier thực sự dùng cho request (có thể đổi sang classifier rẻ hơn khi degraded)"""
+    if overload_controller is None:
+        return method
+    available = [m for m in ('rule', 'ml') if method_available(m)]
+    return overload_controller.route(method, admission, available)
+
+def rule_payload(email):
+    """Phân loại một email (đã qua content policy) bằng rule-based"""
+    def classify():
+        start_time = time.perf_counter()
+        result = run_classifier('rule', run_email, 'rule', email)
+        record_cost('rule', (time.perf_counter() - start_time) * 1000)
+        return result
+    
+    result, reuse = cached_classify('rule', rule_classifier.version, email, classify)
+    return {
+        'success': True,
+        'method': 'rule_based',
+        'category': result['category'],
+        'confidence': result['confidence'],
+        'indicators': result['indicators'],
+        'level': result['level'],
+        **reuse
+    }
+
+def ml_payload(email, model=None):
+    """Phân loại một email (đã qua content policy) bằng ML model (mặc định hoặc theo tên)"""
+    model = model_registry.resolve(model)
+    version = model_registry.version(model)
+    
+    def classify():
+        start_time = time.perf_counter()
+        result = run_classifier('ml', run_email, 'ml', email, model)
+        elapsed = (time.perf_counter() - start_time) * 1000
+        model_registry.record(model, elapsed)
+        record_cost('ml', elapsed)
+        return result
+    
+    result, reuse = cached_classify('ml', version, email, classify)
+    return {
+        'success': True,
+        'method': 'ml_classifier',
+        'model': model,
+        'category': result['category'],
+        'confidence': result['confidence'],
+        'probabilities': result['probabilities'],
+        'text_length': result.get('text_length', 0),
+        **reuse
+    }
+
+def predict_single(method):
+    """Xử lý chung cho /predict/rule và /predict/ml (xem classify_single)"""
+    # Lấy dữ liệu từ request
+    with diagnostics.stage('parse'):
+        data = read_json(request)
+    
+    status, response, headers = classify_single(method, data)
+    with diagnostics.stage('serialize'):
+        return json_response(response, status, headers=headers)
+
+def classify_single(method, data):
     """
-    Phân loại email sử dụng rule-based approach
+    Phân loại một email đã parse: validate, kiểm soát quá tải (có thể chuyển sang
+    classifier rẻ hơn khi degraded), cache / index gần trùng và shadow evaluation.
+    Dùng chung cho server Flask và ASGI.
+    
+    Returns:
+        tuple: (HTTP status, payload, headers hoặc None)
     """
-    # Handle preflight OPTIONS request
-    if request.method == 'OPTIONS':
-        return jsonify({'message': 'OK'}), 200
+    if not method_available(method):
+        return 500, {
+            'success': False,
+            'error': 'Rule-based classifier not loaded' if method == 'rule' else 'ML classifier not loaded'
+        }, None
+    
+    if not data:
+        return 400, {
+            'success': False,
+            'error': 'No JSON data provided'
+        }, None
+    
+    # Validate required fields
+    error = validate_email(data)
+    if error:
+        return 400, {
+            'success': False,
+            'error': error
+        }, None
+    model = data.get('model') if method == 'ml' else None
+    if unknown_model(model):
+        return 400, {
+            'success': False,
+            'error': f'Unknown model: {model}'
+        }, None
+    
+    try:
+        admission = admit_request()
+    except Overloaded as e:
+        return overload_result(e)
     
     try:
-        if rule_classifier is None:
-            return jsonify({
-                'success': False,
-                'error': 'Rule-based classifier not loaded'
-            }), 500
-        
-        # Lấy dữ liệu từ request
-        data = request.get_json()
-        
-        if not data:
-            return jsonify({
-                'success': False,
-                'error': 'No JSON data provided'
-            }), 400
-        
-        # Validate required fields
-        required_fields = ['title', 'content', 'from_email']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    'success': False,
-                    'error': f'Missing required field: {field}'
-                }), 400
-        
         # Phân loại email
-        import time
         start_time = time.time()
         
-        result = rule_classifier.classify_email(data)
+        served = route_method(method, admission)
+        with diagnostics.stage('content_policy'):
+            email = content_policy.apply(data)
+        with diagnostics.stage(f'classify_{served}'):
+            response = ml_payload(email, model) if served == 'ml' else rule_payload(email)
         
         processing_time = (time.time() - start_time) * 1000  # Convert to ms
+        response['processing_time'] = round(processing_time, 2)
+        response['degraded'] = admission is not None and admission.degraded
+        if served != method:
+            response['requested_method'] = method
         
+        if not response['degraded']:
+            submit_shadow(served, data, response, processing_time)
+        return 200, response, None
+    finally:
+        release_request(admission)
+
+def submit_shadow(method, data, response, processing_time):
+    """Sao chép mẫu sang candidate (không chặn; bỏ qua khi không dùng model mặc định)"""
+    if shadow_evaluator is not None and response.get('model', DEFAULT_ML_MODEL) == DEFAULT_ML_MODEL:
+        reused = response.get('cached') or response.get('near_duplicate')
+        shadow_evaluator.submit(method, data, response, None if reused else processing_time)
+
+def begin_combined(data):
+    """
+    Phần chung của /predict/combined (server ASGI), chạy một lần cho cả hai classifier:
+    validate, nhận request qua overload controller và áp dụng content policy.
+    Sau đó từng classifier chạy bằng classify_combined (có thể đồng thời) và
+    request kết thúc bằng end_combined.
+    
+    Returns:
+        tuple: (error, context) - error là (HTTP status, payload, headers) khi không
+               phục vụ được request, context là dict dùng cho các bước sau
+    """
+    methods = [method for method in ('rule', 'ml') if method_available(method)]
+    if not methods:
+        return (500, {
+            'success': False,
+            'error': 'No classifier loaded'
+        }, None), None
+    
+    if not data:
+        return (400, {
+            'success': False,
+            'error': 'No JSON data provided'
+        }, None), None
+    
+    error = validate_email(data)
+    if error:
+        return (400, {
+            'success': False,
+            'error': error
+        }, None), None
+    model = data.get('model')
+    if unknown_model(model):
+        return (400, {
+            'success': False,
+            'error': f'Unknown model: {model}'
+        }, None), None
+    
+    try:
+        admission = admit_request()
+    except Overloaded as e:
+        return overload_result(e), None
+    
+    try:
+        # Khi degraded: bỏ ML nếu overload controller chuyển ML sang classifier rẻ hơn
+        if 'ml' in methods and len(methods) > 1 and route_method('ml', admission) != 'ml':
+            methods.remove('ml')
+        with diagnostics.stage('content_policy'):
+            email = content_policy.apply(data)
+    except BaseException:
+        release_request(admission)
+        raise
+    return None, {
+        'admission': admission,
+        'degraded': admission is not None and admission.degraded,
+        'methods': methods,
+        'model': model,
+        'email': email
+    }
+
+def classify_combined(context, method):
+    """Một classifier của /predict/combined trên email đã qua content policy"""
+    start_time = time.time()
+    with diagnostics.stage(f'classify_{method}'):
+        response = ml_payload(context['email'], context['model']) if method == 'ml' else rule_payload(context['email'])
+    response['processing_time'] = round((time.time() - start_time) * 1000, 2)
+    return response
+
+def end_combined(context, data, responses):
+    """Shadow evaluation cho các kết quả của /predict/combined rồi trả request cho overload controller"""
+    try:
+        if not context['degraded']:
+            for method, response in responses.items():
+                submit_shadow(method, data, response, response['processing_time'])
+    finally:
+        release_request(context['admission'])
+
+@app.route('/shadow/report')
+def shadow_report():
+    """Báo cáo shadow evaluation: độ khớp verdict, ma trận nhầm lẫn, độ trễ production vs candidate"""
+    if shadow_evaluator is None:
         return jsonify({
+            'enabled': False
+        })
+    return json_response(dict(shadow_evaluator.report(), enabled=True))
+
+def admin_error(req):
+    """
+    Kiểm tra token admin
+
+    Returns:
+        Response lỗi (404 khi chưa đặt EMAIL_ADMIN_TOKEN, 403 khi sai token), hoặc None nếu hợp lệ
+    """
+    if ADMIN_TOKEN is None:
+        # Server lắng nghe 0.0.0.0 với CORS *: không có token thì không mở endpoint quản trị
+        return json_response({
+            'success': False,
+            'error': 'Admin endpoints are disabled (set EMAIL_ADMIN_TOKEN to enable them)'
+        }, 404)
+    token = req.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+        return json_response({
+            'success': False,
+            'error': 'Invalid or missing X-Admin-Token'
+        }, 403)
+    return None
+
+@app.route('/admin/memory', methods=['GET', 'POST', 'OPTIONS'])
+def admin_memory():
+    """
+    Chẩn đoán bộ nhớ của worker: RSS theo thời gian, chênh lệch bộ nhớ theo
+    từng bước xử lý và top allocation sites (tracemalloc)
+
+    GET ?top=N: báo cáo (top=0 để bỏ qua snapshot tracemalloc, vốn tốn thời gian)
+    POST {"action": "start" | "stop" | "reset", "frames": N, "rss_interval": giây}
+    """
+    # Handle preflight OPTIONS request
+    if request.method == 'OPTIONS':
+        return jsonify({'message': 'OK'}), 200
+    
+    error = admin_error(request)
+    if error is not None:
+        return error
+    
+    try:
+        if request.method == 'GET':
+            top = request.args.get('top', DEFAULT_TOP, type=int)
+            return json_response(dict(diagnostics.report(top=max(0, top)), success=True))
+        
+        data = read_json(request) or {}
+        action = data.get('action')
+        if action == 'start':
+            frames = data.get('frames', DEFAULT_FRAMES)
+            rss_interval = data.get('rss_interval', DEFAULT_RSS_INTERVAL)
+            if not isinstance(frames, int) or isinstance(frames, bool) or not 1 <= frames <= 100:
+                raise InvalidPayload('frames must be an integer between 1 and 100')
+            if not isinstance(rss_interval, (int, float)) or isinstance(rss_interval, bool) or rss_interval <= 0:
+                raise InvalidPayload('rss_interval must be a positive number')
+            changed = diagnostics.start(frames=frames, rss_interval=rss_interval)
+            logger.info(f"🩺 Memory diagnostics started (frames={frames})" if changed else
+                        "🩺 Memory diagnostics already running")
+        elif action == 'stop':
+            changed = diagnostics.stop()
+            logger.info("🩺 Memory diagnostics stopped")
+        elif action == 'reset':
+            changed = diagnostics.reset()
+        else:
+            raise InvalidPayload('action must be one of: start, stop, reset')
+        
+        return json_response({
             'success': True,
-            'method': 'rule_based',
-            'category': result['category'],
-            'confidence': result['confidence'],
-            'indicators': result['indicators'],
-            'level': result['level'],
-            'processing_time': round(processing_time, 2)
+            'action': action,
+            'changed': changed,
+            'enabled': diagnostics.enabled
         })
+    
+    except InvalidPayload as e:
+        return json_response({
+            'success': False,
+            'error': str(e)
+        }, 400)
+    except Exception as e:
+        logger.error(f"Error in admin_memory: {e}")
+        return json_response({
+            'success': False,
+            'error': str(e)
+        }, 500)
+
+@app.route('/models')
+def list_models():
+    """Các ML model trong thư mục models: đã load chưa, bộ nhớ, thời gian load, độ trễ theo model"""
+    if model_registry is None:
+        return jsonify({
+            'enabled': False
+        })
+    return json_response(dict(model_registry.stats(), enabled=True))
+
+@app.route('/admin/models', methods=['POST', 'OPTIONS'])
+def admin_models():
+    """
+    Quản lý model registry của worker (và các worker process của execution policy)
+
+    POST {"action": "refresh"}: quét lại thư mục models (model mới / bị xóa)
+    POST {"action": "load" | "unload", "model": tên}: load trước / bỏ model khỏi bộ nhớ
+    """
+    # Handle preflight OPTIONS request
+    if request.method == 'OPTIONS':
+        return jsonify({'message': 'OK'}), 200
+    
+    error = admin_error(request)
+    if error is not None:
+        return error
+    if model_registry is None:
+        return json_response({
+            'success': False,
+            'error': 'Model registry not available'
+        }, 503)
+    
+    try:
+        data = read_json(request) or {}
+        action = data.get('action')
+        model = data.get('model')
+        if action == 'refresh':
+            models = model_registry.discover()
+            preloaded_models.intersection_update(models)
+            restart_workers()
+            return json_response({
+                'success': True,
+                'action': action,
+                'models': models
+            })
+        if action not in ('load', 'unload'):
+            raise InvalidPayload('action must be one of: refresh, load, unload')
+        if model is None or unknown_model(model):
+            raise InvalidPayload(f'Unknown model: {model}')
         
+        if action == 'load':
+            if ml_in_process():
+                model_registry.get(model)
+            preloaded_models.add(model)
+            changed = True
+        elif model == model_registry.default_model:
+            raise InvalidPayload('The default model cannot be unloaded')
+        else:
+            changed = model in preloaded_models
+            preloaded_models.discard(model)
+            changed = model_registry.unload(model) or changed
+        # Worker process giữ registry riêng: tạo lại để chúng load / bỏ model theo registry này
+        restart_workers()
+        logger.info(f"📦 Model {model}: {action}")
+        return json_response({
+            'success': True,
+            'action': action,
+            'model': model,
+            'changed': changed
+        })
+    
+    except InvalidPayload as e:
+        return json_response({
+            'success': False,
+            'error': str(e)
+        }, 400)
+    except Exception as e:
+        logger.error(f"Error in admin_models: {e}")
+        return json_response({
+            'success': False,
+            'error': str(e)
+        }, 500)
+
+@app.route('/predict/rule', methods=['POST', 'OPTIONS'])
+def predict_rule():
+    """
+    Phân loại email sử dụng rule-based approach
+    """
+    # Handle preflight OPTIONS request
+    if request.method == 'OPTIONS':
+        return jsonify({'message': 'OK'}), 200
+    
+    try:
+        return predict_single('rule')
+    
+    except InvalidPayload as e:
+        return json_response({
+            'success': False,
+            'error': str(e)
+        }, 400)
     except Exception as e:
         logger.error(f"Error in predict_rule: {e}")
-        return jsonify({
+        return json_response({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
 
 @app.route('/predict/ml', methods=['POST', 'OPTIONS'])
 def predict_ml():
     """
     Phân loại email sử dụng ML model (TF-IDF + Logistic Regression)
+    
+    "model" trong body chọn model theo tên (xem GET /models), mặc định là model mặc định.
+    Khi server quá tải, request có thể được phục vụ bằng rule-based (rẻ hơn):
+    response khi đó có "degraded": true và "requested_method": "ml".
+    """
+    # Handle preflight OPTIONS request
+    if request.method == 'OPTIONS':
+        return jsonify({'message': 'OK'}), 200
+    
+    try:
+        return predict_single('ml')
+    
+    except InvalidPayload as e:
+        return json_response({
+            'success': False,
+            'error': str(e)
+        }, 400)
+    except Exception as e:
+        logger.error(f"Error in predict_ml: {e}")
+        return json_response({
+            'success': False,
+            'error': str(e)
+        }, 500)
+
+@app.route('/predict/batch', methods=['POST', 'OPTIONS'])
+def predict_batch():
+    """
+    Phân loại nhiều email cùng lúc
+    
+    Body có thể chứa "format": "columnar" để nhận kết quả dạng cột gọn
+    (category ids + ma trận xác suất, mapping id_to_category gửi một lần)
+    và "model" để chọn ML model theo tên (method ml).
+    Ngoài JSON, endpoint nhận Arrow IPC hoặc msgpack dạng cột
+    (xem columnar_input.py); method/format/model khi đó lấy từ query string.
+    Khi server quá tải, batch lớn bị từ chối (503) và method có thể bị đổi.
     """
     # Handle preflight OPTIONS request
     if request.method == 'OPTIONS':
         return jsonify({'message': 'OK'}), 200
     
     try:
-        if ml_classifier is None:
-            return jsonify({
+        if rule_classifier is None and not ml_available:
+            return json_response({
                 'success': False,
-                'error': 'ML classifier not loaded'
-            }), 500
-        
-        # Lấy dữ liệu từ request
-        data = request.get_json()
+                'error': 'No classifiers loaded'
+            }, 500)
         
-        if not data:
-            return jsonify({
+        # Lấy dữ liệu từ request (JSON hoặc Arrow/msgpack dạng cột)
+        with diagnostics.stage('parse_batch'):
+            columns, error = read_batch(request)
+        if error:
+            return json_response({
                 'success': False,
-                'error': 'No JSON data provided'
-            }), 400
-        
-        # Validate required fields
-        required_fields = ['title', 'content', 'from_email']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({
-                    'success': False,
-                    'error': f'Missing required field: {field}'
-                }), 400
-        
-        # Phân loại email
-        import time
-        start_time = time.time()
+                'error': error
+            }, 400)
+        requested_method = columns.method or 'rule'  # Default to rule-based
+        response_format = columns.format or 'records'
+        if not method_available(requested_method):
+            return json_response({
+                'success': False,
+                'error': f'Method {requested_method} not available'
+            }, 400)
+        if requested_method == 'ml' and unknown_model(columns.model):
+            return json_response({
+                'success': False,
+                'error': f'Unknown model: {columns.model}'
+            }, 400)
         
-        result = ml_classifier.predict(
-            title=data['title'],
-            content=data['content'],
-            from_email=data['from_email']
-        )
+        try:
+            admission = admit_request(len(columns))
+        except Overloaded as e:
+            return overload_response(e)
         
-        processing_time = (time.time() - start_time) * 1000  # Convert to ms
+        try:
+            # Phân loại batch
+            start_time = time.time()
+            
+            method = route_method(requested_method, admission)
+            results, reuse = classify_columns(method, columns)
+            
+            processing_time = (time.time() - start_time) * 1000  # Convert to ms
+        finally:
+            release_request(admission, len(columns))
         
-        return jsonify({
+        response = {
             'success': True,
-            'method': 'ml_classifier',
-            'category': result['category'],
-            'confidence': result['confidence'],
-            'probabilities': result['probabilities'],
+            'method': method,
+            'format': response_format,
+            'total_processed': len(results),
+            'cache_hits': reuse['cache_hits'],
+            'near_duplicate_hits': reuse['near_duplicate_hits'],
             'processing_time': round(processing_time, 2),
-            'text_length': result.get('text_length', 0)
-        })
+            'degraded': admission is not None and admission.degraded
+        }
+        if method == 'ml':
+            response['model'] = model_registry.resolve(columns.model)
+        if method != requested_method:
+            response['requested_method'] = requested_method
         
+        # Sao chép mẫu sang candidate (không chặn; bỏ qua khi đang degraded hoặc không dùng model mặc định)
+        if (shadow_evaluator is not None and not response['degraded']
+                and response.get('model', DEFAULT_ML_MODEL) == DEFAULT_ML_MODEL):
+            reused = reuse['cache_hits'] or reuse['near_duplicate_hits']
+            shadow_evaluator.submit_batch(method, columns.titles, columns.contents, columns.from_emails, results,
+                                          None if reused else processing_time / len(results))
+        if response_format == 'columnar':
+            with diagnostics.stage('columnar_results'):
+                response.update(columnar_results(method, results, get_id_to_category(response.get('model'))))
+        else:
+            response['results'] = results
+        
+        with diagnostics.stage('serialize_batch'):
+            return json_response(response)
+    
+    except InvalidPayload as e:
+        return json_response({
+            'success': False,
+            'error': str(e)
+        }, 400)
     except Exception as e:
-        logger.error(f"Error in predict_ml: {e}")
-        return jsonify({
+        logger.error(f"Error in predict_batch: {e}")
+        return json_response({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
 
-@app.route('/predict/batch', methods=['POST', 'OPTIONS'])
-def predict_batch():
+def jobs_unavailable():
+    """Response khi job API bị tắt hoặc không mở được job store"""
+    return json_response({
+        'success': False,
+        'error': 'Job API not available'
+    }, 503)
+
+def job_links(job_id):
+    return {
+        'status': f'/jobs/{job_id}',
+        'results': f'/jobs/{job_id}/results'
+    }
+
+@app.route('/jobs', methods=['GET', 'POST', 'OPTIONS'])
+def jobs():
     """
-    Phân loại nhiều email cùng lúc
+    Tạo job phân loại batch lớn chạy nền, hoặc liệt kê các job gần đây
+
+    POST nhận cùng payload với /predict/batch (JSON, Arrow, msgpack) hoặc
+    multipart/form-data với field "file" (.csv, .jsonl, .json, .arrow, .msgpack)
+    và "method" / "model" trong form/query string. Trả về 202 cùng job id; tiến độ ở
+    GET /jobs/<job_id>, kết quả theo trang ở GET /jobs/<job_id>/results.
     """
     # Handle preflight OPTIONS request
     if request.method == 'OPTIONS':
         return jsonify({'message': 'OK'}), 200
     
+    if job_store is None:
+        return jobs_unavailable()
+    
     try:
-        if rule_classifier is None and ml_classifier is None:
-            return jsonify({
-                'success': False,
-                'error': 'No classifiers loaded'
-            }), 500
+        if request.method == 'GET':
+            limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+            return json_response({
+                'success': True,
+                'counts': job_store.stats(),
+                'jobs': job_store.list(limit)
+            })
         
-        # Lấy dữ liệu từ request
-        data = request.get_json()
+        # Lấy dữ liệu từ file upload hoặc body (JSON / Arrow / msgpack)
+        upload = request.files.get('file')
+        if upload is not None:
+            columns = decode_upload(upload.read(), upload.filename)
+            columns.method = request.form.get('method', request.args.get('method'))
+            columns.model = request.form.get('model', request.args.get('model'))
+            source = upload.filename
+        else:
+            columns, error = read_batch(request)
+            if error:
+                return json_response({
+                    'success': False,
+                    'error': error
+                }, 400)
+            source = None
+        method = columns.method or 'rule'  # Default to rule-based
         
-        if not data or 'emails' not in data:
-            return jsonify({
+        if not method_available(method):
+            return json_response({
                 'success': False,
-                'error': 'No emails array provided'
-            }), 400
-        
-        emails = data['emails']
-        method = data.get('method', 'rule')  # Default to rule-based
-        
-        if not isinstance(emails, list):
-            return jsonify({
+                'error': f'Method {method} not available'
+            }, 400)
+        if method == 'ml' and unknown_model(columns.model):
+            return json_response({
                 'success': False,
-                'error': 'emails must be an array'
-            }), 400
-        
-        if len(emails) == 0:
-            return jsonify({
+                'error': f'Unknown model: {columns.model}'
+            }, 400)
+        if len(columns) > JOB_MAX_EMAILS:
+            return json_response({
                 'success': False,
-                'error': 'emails array cannot be empty'
-            }), 400
+                'error': f'Too many emails: {len(columns)} (max {JOB_MAX_EMAILS})'
+            }, 413)
         
-        # Validate each email (both methods require same 3 fields)
-        required_fields = ['title', 'content', 'from_email']
-        for i, email in enumerate(emails):
-            for field in required_fields:
-                if field not in email:
-                    return jsonify({
-                        'success': False,
-                        'error': f'Email {i+1} missing required field: {field}'
-                    }), 400
-        
-        # Phân loại batch
-        import time
-        start_time = time.time()
+        # Model được chốt lúc tạo job (đổi model mặc định sau đó không ảnh hưởng job đang chờ)
+        model = model_registry.resolve(columns.model) if method == 'ml' else None
+        job = job_store.create(method, columns.titles, columns.contents, columns.from_emails, source, model)
+        job_runner.notify()
         
-        results = []
+        return json_response({
+            'success': True,
+            'job_id': job['id'],
+            'status': job['status'],
+            'total': job['total'],
+            'links': job_links(job['id'])
+        }, 202, headers={'Location': f'/jobs/{job["id"]}'})
         
-        if method == 'rule' and rule_classifier:
-            for email in emails:
-                result = rule_classifier.classify_email(email)
-                results.append({
-                    'category': result['category'],
-                    'confidence': result['confidence'],
-                    'indicators': result['indicators'],
-                    'level': result['level']
-                })
-        elif method == 'ml' and ml_classifier:
-            for email in emails:
-                result = ml_classifier.predict(
-                    title=email['title'],
-                    content=email['content'],
-                    from_email=email['from_email']
-                )
-                results.append({
-                    'category': result['category'],
-                    'confidence': result['confidence'],
-                    'probabilities': result['probabilities']
+    except InvalidPayload as e:
+        return json_response({
+            'success': False,
+            'error': str(e)
+        }, 400)
+    except Exception as e:
+        logger.error(f"Error in jobs: {e}")
+        return json_response({
+            'success': False,
+            'error': str(e)
+        }, 500)
+
+@app.route('/jobs/<job_id>', methods=['GET', 'DELETE', 'OPTIONS'])
+def job_status(job_id):
+    """
+    Trạng thái và tiến độ của job (GET), hoặc hủy job (DELETE)
+
+    DELETE hủy job đang chờ/đang chạy; với ?purge=true, job và kết quả bị xóa hẳn.
+    """
+    # Handle preflight OPTIONS request
+    if request.method == 'OPTIONS':
+        return jsonify({'message': 'OK'}), 200
+    
+    if job_store is None:
+        return jobs_unavailable()
+    
+    try:
+        if request.method == 'DELETE':
+            if request.args.get('purge', 'false').lower() == 'true':
+                if not job_store.delete(job_id):
+                    return json_response({
+                        'success': False,
+                        'error': 'Job not found'
+                    }, 404)
+                return json_response({
+                    'success': True,
+                    'job_id': job_id,
+                    'status': 'deleted'
                 })
-        else:
-            return jsonify({
+            status = job_store.cancel(job_id)
+            if status is None:
+                return json_response({
+                    'success': False,
+                    'error': 'Job not found'
+                }, 404)
+            return json_response({
+                'success': True,
+                'job_id': job_id,
+                'status': status
+            })
+        
+        job = job_store.get(job_id)
+        if job is None:
+            return json_response({
                 'success': False,
-                'error': f'Method {method} not available'
-            }), 400
+                'error': 'Job not found'
+            }, 404)
+        return json_response(dict(job, success=True, links=job_links(job_id)))
         
-        processing_time = (time.time() - start_time) * 1000  # Convert to ms
+    except Exception as e:
+        logger.error(f"Error in job_status: {e}")
+        return json_response({
+            'success': False,
+            'error': str(e)
+        }, 500)
+
+@app.route('/jobs/<job_id>/results')
+def job_results(job_id):
+    """
+    Kết quả của job theo trang: ?offset=0&limit=1000&format=records|columnar
+
+    Kết quả có sẵn ngay khi từng chunk xong, không cần chờ cả job; trang có
+    thể ngắn hơn limit khi job vẫn đang chạy. next_offset là None khi đã hết.
+    """
+    if job_store is None:
+        return jobs_unavailable()
+    
+    try:
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = min(max(request.args.get('limit', JOB_PAGE_SIZE, type=int), 1), JOB_MAX_PAGE_SIZE)
+        response_format = request.args.get('format', 'records')
+        if response_format not in RESPONSE_FORMATS:
+            return json_response({
+                'success': False,
+                'error': f'format must be one of: {", ".join(RESPONSE_FORMATS)}'
+            }, 400)
         
-        return jsonify({
+        job = job_store.get(job_id)
+        if job is None:
+            return json_response({
+                'success': False,
+                'error': 'Job not found'
+            }, 404)
+        results = job_store.results(job_id, offset, limit)
+        next_offset = offset + len(results)
+        
+        response = {
             'success': True,
-            'method': method,
-            'results': results,
-            'total_processed': len(results),
-            'processing_time': round(processing_time, 2)
-        })
+            'job_id': job_id,
+            'method': job['method'],
+            'status': job['status'],
+            'format': response_format,
+            'total': job['total'],
+            'processed': job['processed'],
+            'offset': offset,
+            'count': len(results),
+            'next_offset': next_offset if next_offset < job['total'] else None
+        }
+        if response_format == 'columnar':
+            # Category id theo model đã chốt lúc tạo job
+            try:
+                id_to_category = get_id_to_category(job['model'])
+            except UnknownModel:
+                return json_response({
+                    'success': False,
+                    'error': f"Model {job['model']} is no longer available; use format=records"
+                }, 409)
+            response.update(columnar_results(job['method'], results, id_to_category))
+        else:
+            response['results'] = results
+        
+        return json_response(response)
         
     except Exception as e:
-        logger.error(f"Error in predict_batch: {e}")
-        return jsonify({
+        logger.error(f"Error in job_results: {e}")
+        return json_response({
             'success': False,
             'error': str(e)
-        }), 500
+        }, 500)
 
 @app.errorhandler(404)
 def not_found(error):
@@ -364,7 +1423,16 @@ def not_found(error):
             '/predict/rule',
             '/predict/ml',
             '/predict/batch',
-            '/model_info'
+            '/model_info',
+            '/cache/stats',
+            '/near_duplicate/stats',
+            '/jobs',
+            '/jobs/<job_id>',
+            '/jobs/<job_id>/results',
+            '/shadow/report',
+            '/models',
+            '/admin/memory',
+            '/admin/models'
         ]
     }), 404
 
@@ -377,9 +1445,12 @@ def internal_error(error):
     }), 500
 
 if __name__ == '__main__':
+    # Process cha của reloader (debug) không phục vụ request, không cần worker process
+    EXECUTION_PREWARM = os.environ.get('WERKZEUG_RUN_MAIN') == 'true'
     # Khởi tạo classifiers
     if init_classifiers():
         logger.info("🚀 Starting Email Classification API...")
-        app.run(host='0.0.0.0', port=5001, debug=True)
+        # Mỗi request một thread; tác vụ giới hạn bởi GIL được chuyển sang process pool (xem execution.py)
+        app.run(host='0.0.0.0', port=5001, debug=True, threaded=True)
     else:
         logger.error("❌ Failed to start API due to classifier initialization error") 
\ No newline at end of file
@@ -0,0 +1,308 @@
+"""
+Biến thể ASGI (async) của Email Classification API
+
+Các endpoint phân loại đi qua cùng pipeline với server Flask
+(api_backend.classify_single: content policy, cache kết quả, index gần trùng,
+overload controller, shadow evaluation, execution policy thread/process), chạy
+trên thread pool để không chặn event loop. /predict/combined validate, kiểm soát
+quá tải và áp dụng content policy một lần, rồi chạy rule-based và ML đồng thời
+và gộp kết quả trong một round trip. Số request đang xử lý được
+giới hạn: khi hàng đợi đầy, server trả về 429 thay vì xếp hàng vô hạn.
+
+Server ASGI không có các endpoint batch, job, cache/stats... của server Flask.
+
+Chạy server:
+    cd email_classification_module
+    uvicorn asgi_backend:app --host 0.0.0.0 --port 5002
+"""
+
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import api_backend
+from execution import TASKS
+from serialization import InvalidPayload, dumps, loads, validate_email
+
+# Thiết lập logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cấu hình executor và backpressure
+EXECUTOR_KIND = None            # None: theo execution policy; 'thread' / 'process': dùng cho mọi tác vụ
+EXECUTOR_WORKERS = 4            # Số thread chạy pipeline phân loại (process pool: api_backend.PROCESS_WORKERS)
+MAX_CONCURRENCY = 8             # Số request được xử lý cùng lúc
+MAX_QUEUE = 64                  # Số request được phép chờ thêm trước khi trả 429
+MAX_BODY_BYTES = 10 * 1024 * 1024
+RETRY_AFTER_SECONDS = 1
+
+COMBINED_KEYS = {'rule': 'rule_based', 'ml': 'ml_classifier'}
+
+
+class Backpressure:
+    """
+    Giới hạn số request đang xử lý (semaphore) và số request đang chờ (hàng đợi)
+
+    Chỉ được dùng trong event loop nên các bộ đếm không cần lock.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self.accepted = 0
+        self.rejected = 0
+        self._semaphore = None
+
+    def try_enter(self):
+        """Nhận request nếu còn chỗ trong hàng đợi, ngược lại trả về False"""
+        if self.in_flight + self.waiting >= self.max_concurrency + self.max_queue:
+            self.rejected += 1
+            return False
+        self.waiting += 1
+        self.accepted += 1
+        return True
+
+    async def __aenter__(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self._semaphore.release()
+        return False
+
+    def stats(self):
+        return {
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'accepted': self.accepted,
+            'rejected': self.rejected
+        }
+
+
+class AsyncEmailClassificationApp:
+    """ASGI application phục vụ các endpoint phân loại"""
+
+    def __init__(self, executor_kind=EXECUTOR_KIND, workers=EXECUTOR_WORKERS,
+                 max_concurrency=MAX_CONCURRENCY, max_queue=MAX_QUEUE):
+        self.executor_kind = executor_kind
+        self.workers = workers
+        self.backpressure = Backpressure(max_concurrency, max_queue)
+        self.executor = None
+        self._startup_lock = threading.Lock()
+        self.routes = {
+            ('GET', '/health'): self.health,
+            ('POST', '/predict/rule'): self.predict_rule,
+            ('POST', '/predict/ml'): self.predict_ml,
+            ('POST', '/predict/combined'): self.predict_combined
+        }
+
+    def startup(self):
+        """
+        Load classifiers (như server Flask, trừ job nền) và tạo thread pool
+
+        Chạy một lần: qua lifespan, hoặc ở request đầu tiên nếu server không gửi
+        lifespan (các request đến cùng lúc chờ lock thay vì load song song).
+        """
+        with self._startup_lock:
+            if self.executor is not None:
+                return
+            if api_backend.rule_classifier is None and not api_backend.ml_available:
+                # Server ASGI không có endpoint /jobs; chọn executor trước khi load để process chính
+                # không giữ ML model khi mọi tác vụ chạy trong process pool
+                api_backend.JOBS_ENABLED = False
+                api_backend.EXECUTION_MODE = self.executor_kind
+                api_backend.init_classifiers()
+            elif self.executor_kind is not None and api_backend.executor is not None:
+                api_backend.executor.policy.update({task: self.executor_kind for task in TASKS})
+                api_backend.executor.start()
+            policy = api_backend.executor.policy if api_backend.executor is not None else {}
+            # Gán cuối cùng: executor khác None nghĩa là đã khởi động xong
+            self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='asgi-classify')
+        logger.info(f"🚀 ASGI backend ready ({', '.join(f'{task}={mode}' for task, mode in policy.items())})")
+
+    def shutdown(self):
+        with self._startup_lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False, cancel_futures=True)
+                self.executor = None
+            if api_backend.executor is not None:
+                api_backend.executor.shutdown()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        if self.executor is None:
+            # Không chặn event loop trong lúc load classifiers
+            await asyncio.get_running_loop().run_in_executor(None, self.startup)
+
+        handler = self.routes.get((scope['method'], scope['path']))
+        if scope['method'] == 'OPTIONS':
+            await self._send(send, 200, {'message': 'OK'})
+            return
+        if handler is None:
+            await self._send(send, 404, {'success': False, 'error': 'Endpoint not found'})
+            return
+
+        if scope['method'] == 'GET':
+            await self._send(send, *await handler(None))
+            return
+
+        # Backpressure: từ chối ngay khi hàng đợi đầy
+        if not self.backpressure.try_enter():
+            await self._send(send, 429, {
+                'success': False,
+                'error': 'Server is busy, please retry later'
+            }, {'Retry-After': str(RETRY_AFTER_SECONDS)})
+            return
+
+        headers = None
+        async with self.backpressure:
+            try:
+                body = await self._read_body(receive)
+                data = loads(body) if body else None
+                if not data:
+                    status, payload = 400, {'success': False, 'error': 'No JSON data provided'}
+                else:
+                    error = validate_email(data)
+                    if error:
+                        status, payload = 400, {'success': False, 'error': error}
+                    else:
+                        status, payload, headers = await handler(data)
+            except InvalidPayload as e:
+                status, payload = 400, {'success': False, 'error': str(e)}
+            except Exception as e:
+                logger.error(f"Error in {scope['path']}: {e}")
+                status, payload = 500, {'success': False, 'error': str(e)}
+
+        await self._send(send, status, payload, headers)
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, func, *args)
+
+    async def health(self, _):
+        """Trạng thái như GET /health của server Flask, kèm trạng thái hàng đợi"""
+        controller = api_backend.overload_controller
+        load = controller.stats() if controller is not None else None
+        state = load['state'] if load is not None else 'normal'
+        payload = {
+            'status': 'healthy' if state == 'normal' else state,
+            'timestamp': datetime.now().isoformat(),
+            'classifiers': {
+                'rule_based': api_backend.rule_classifier is not None,
+                'ml_classifier': api_backend.ml_available
+            },
+            'load': load,
+            'execution': api_backend.executor.stats() if api_backend.executor is not None else None,
+            'backpressure': self.backpressure.stats()
+        }
+        if state == 'overloaded':
+            return 503, payload, {'Retry-After': str(load['retry_after'])}
+        return 200, payload, None
+
+    async def predict_rule(self, data):
+        return await self._run(api_backend.classify_single, 'rule', data)
+
+    async def predict_ml(self, data):
+        return await self._run(api_backend.classify_single, 'ml', data)
+
+    async def predict_combined(self, data):
+        """Validate / overload / content policy một lần, rồi chạy rule-based và ML đồng thời và gộp kết quả"""
+        start_time = time.perf_counter()
+        error, context = await self._run(api_backend.begin_combined, data)
+        if error is not None:
+            return error
+
+        methods = context['methods']
+        responses = {}
+        try:
+            results = await asyncio.gather(
+                *(self._run(api_backend.classify_combined, context, method) for method in methods),
+                return_exceptions=True
+            )
+            for method, result in zip(methods, results):
+                if isinstance(result, BaseException):
+                    raise result
+                responses[method] = result
+        finally:
+            api_backend.end_combined(context, data, responses)
+
+        response = {'success': True, 'method': 'combined', 'degraded': context['degraded']}
+        for method, payload in responses.items():
+            payload.pop('success', None)
+            response[COMBINED_KEYS[method]] = payload
+        if len(responses) == 2:
+            response['agreement'] = responses['rule']['category'] == responses['ml']['category']
+        response['processing_time'] = round((time.perf_counter() - start_time) * 1000, 2)
+        return 200, response, None
+
+    async def _read_body(self, receive):
+        chunks = []
+        size = 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                raise InvalidPayload('Client disconnected')
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_BODY_BYTES:
+                raise InvalidPayload(f'Request body exceeds {MAX_BODY_BYTES} bytes')
+            chunks.append(chunk)
+            if not message.get('more_body', False):
+                return b''.join(chunks)
+
+    async def _send(self, send, status, payload, extra_headers=None):
+        body = dumps(payload)
+        headers = [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            (b'access-control-allow-origin', b'*')
+        ]
+        if extra_headers:
+            headers.extend((name.lower().encode(), value.encode()) for name, value in extra_headers.items())
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    self.startup()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = AsyncEmailClassificationApp()
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        logger.error("❌ uvicorn is required to run the ASGI backend: pip install uvicorn")
+    else:
+        uvicorn.run(app, host='0.0.0.0', port=5002)
@@ -0,0 +1,246 @@
+import csv
+import io
+import os
+
+from serialization import InvalidPayload, REQUIRED_FIELDS, RESPONSE_FORMATS, loads, validate_email
+
+# Các định dạng nhị phân là tùy chọn: chỉ bật nếu thư viện đã được cài đặt
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.ipc
+except ImportError:  # pragma: no cover - phụ thuộc môi trường
+    pyarrow = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - phụ thuộc môi trường
+    msgpack = None
+
+ARROW_STREAM_TYPE = 'application/vnd.apache.arrow.stream'
+ARROW_FILE_TYPE = 'application/vnd.apache.arrow.file'
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+
+# File upload (job API): định dạng theo phần mở rộng của tên file
+UPLOAD_EXTENSIONS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.json': 'json',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.msgpack': 'msgpack',
+    '.mpk': 'msgpack'
+}
+
+
+class EmailColumns:
+    """
+    Batch email ở dạng cột: ba danh sách title, content, from_email cùng độ dài
+
+    Dùng chung cho JSON (mảng dict), Arrow IPC và msgpack để các bước sau
+    (content policy, rule engine, ML) không phải duyệt lại từng dict.
+    """
+
+    __slots__ = ('titles', 'contents', 'from_emails', 'method', 'format', 'model')
+
+    def __init__(self, titles, contents, from_emails, method=None, format=None, model=None):
+        self.titles = titles
+        self.contents = contents
+        self.from_emails = from_emails
+        self.method = method
+        self.format = format
+        self.model = model
+
+    def __len__(self):
+        return len(self.titles)
+
+    @classmethod
+    def from_records(cls, emails, method=None, format=None, model=None):
+        """Tạo từ danh sách dict đã được validate (payload JSON)"""
+        return cls(
+            [email['title'] for email in emails],
+            [email['content'] for email in emails],
+            [email['from_email'] for email in emails],
+            method,
+            format,
+            model
+        )
+
+
+def supported_types():
+    """Các Content-Type nhị phân mà server hiện hỗ trợ"""
+    types = []
+    if pyarrow is not None:
+        types.extend([ARROW_STREAM_TYPE, ARROW_FILE_TYPE])
+    if msgpack is not None:
+        types.extend(MSGPACK_TYPES)
+    return types
+
+
+def is_columnar_type(mimetype):
+    """Request có dùng định dạng cột nhị phân (Arrow/msgpack) hay không"""
+    return mimetype in (ARROW_STREAM_TYPE, ARROW_FILE_TYPE) or mimetype in MSGPACK_TYPES
+
+
+def decode_columns(body, mimetype):
+    """
+    Giải mã payload nhị phân thành EmailColumns
+
+    Args:
+        body (bytes): Request body
+        mimetype (str): Content-Type của request (không kèm tham số)
+
+    Returns:
+        EmailColumns
+    """
+    if not body:
+        raise InvalidPayload('Empty request body')
+    if mimetype in (ARROW_STREAM_TYPE, ARROW_FILE_TYPE):
+        return _decode_arrow(body, mimetype == ARROW_FILE_TYPE)
+    if mimetype in MSGPACK_TYPES:
+        return _decode_msgpack(body)
+    raise InvalidPayload(f'Unsupported content type: {mimetype}')
+
+
+def _decode_arrow(body, file_format):
+    """
+    Đọc Arrow IPC (stream hoặc file) trực tiếp trên buffer của request: bước đọc IPC
+    không sao chép, các cột chuỗi vẫn trỏ vào buffer gốc.
+
+    Mỗi cột được sao chép đúng một lần khi chuyển sang list str Python ở bước cuối,
+    vì regex và TF-IDF đều cần str; không tạo thêm dict hay list trung gian cho từng email.
+    """
+    if pyarrow is None:
+        raise InvalidPayload('Arrow input requires pyarrow to be installed')
+
+    buffer = pyarrow.py_buffer(body)
+    try:
+        if file_format:
+            table = pyarrow.ipc.open_file(buffer).read_all()
+        else:
+            table = pyarrow.ipc.open_stream(buffer).read_all()
+    except pyarrow.ArrowInvalid as e:
+        raise InvalidPayload(f'Invalid Arrow payload: {e}')
+
+    columns = []
+    for field in REQUIRED_FIELDS:
+        if field not in table.column_names:
+            raise InvalidPayload(f'Missing required column: {field}')
+        column = table.column(field)
+        if not (pyarrow.types.is_string(column.type) or pyarrow.types.is_large_string(column.type)):
+            raise InvalidPayload(f'Column {field} must be a string column')
+        # fill_null + to_numpy chuyển cả cột trong C (có sao chép), nhanh hơn to_pylist() khoảng 4 lần
+        column = pyarrow.compute.fill_null(column, '')
+        columns.append(column.to_numpy(zero_copy_only=False).tolist())
+
+    metadata = table.schema.metadata or {}
+    method = metadata.get(b'method')
+    format = metadata.get(b'format')
+    model = metadata.get(b'model')
+    return _checked(EmailColumns(
+        columns[0], columns[1], columns[2],
+        method.decode('utf-8') if method else None,
+        format.decode('utf-8') if format else None,
+        model.decode('utf-8') if model else None
+    ))
+
+
+def _decode_msgpack(body):
+    """Đọc msgpack map {"title": [...], "content": [...], "from_email": [...], "method": ..., "model": ...}"""
+    if msgpack is None:
+        raise InvalidPayload('msgpack input requires msgpack to be installed')
+
+    try:
+        data = msgpack.unpackb(body, raw=False)
+    except (ValueError, msgpack.ExtraData, msgpack.FormatError, msgpack.StackError) as e:
+        raise InvalidPayload(f'Invalid msgpack payload: {e}')
+    if not isinstance(data, dict):
+        raise InvalidPayload('msgpack payload must be a map of columns')
+
+    columns = []
+    for field in REQUIRED_FIELDS:
+        column = data.get(field)
+        if not isinstance(column, list):
+            raise InvalidPayload(f'Missing required column: {field}')
+        if not all(isinstance(value, str) for value in column):
+            column = [value if isinstance(value, str) else str(value or '') for value in column]
+        columns.append(column)
+
+    return _checked(EmailColumns(
+        columns[0], columns[1], columns[2],
+        data.get('method'), data.get('format'), data.get('model')
+    ))
+
+
+def _checked(columns):
+    """Kiểm tra các cột có cùng độ dài và không rỗng"""
+    n = len(columns.titles)
+    if len(columns.contents) != n or len(columns.from_emails) != n:
+        raise InvalidPayload('Columns title, content and from_email must have the same length')
+    if n == 0:
+        raise InvalidPayload('emails array cannot be empty')
+    if columns.format is not None and columns.format not in RESPONSE_FORMATS:
+        raise InvalidPayload(f'format must be one of: {", ".join(RESPONSE_FORMATS)}')
+    return columns
+
+
+def decode_upload(data, filename):
+    """
+    Giải mã file email được upload thành EmailColumns
+
+    Hỗ trợ CSV (có header title,content,from_email), JSON Lines, JSON
+    ({"emails": [...]} hoặc mảng), Arrow IPC và msgpack dạng cột.
+
+    Args:
+        data (bytes): Nội dung file
+        filename (str): Tên file (dùng phần mở rộng để chọn định dạng)
+
+    Returns:
+        EmailColumns
+    """
+    kind = UPLOAD_EXTENSIONS.get(os.path.splitext(filename or '')[1].lower())
+    if kind is None:
+        raise InvalidPayload(f'Unsupported file type: {filename} (supported: {", ".join(sorted(UPLOAD_EXTENSIONS))})')
+    if not data:
+        raise InvalidPayload('Uploaded file is empty')
+
+    if kind == 'arrow':
+        # .arrow có thể là IPC file hoặc IPC stream
+        try:
+            return _decode_arrow(data, True)
+        except InvalidPayload:
+            return _decode_arrow(data, False)
+    if kind == 'msgpack':
+        return _decode_msgpack(data)
+
+    try:
+        text = data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise InvalidPayload('Uploaded file must be UTF-8 encoded')
+
+    if kind == 'csv':
+        reader = csv.DictReader(io.StringIO(text, newline=''))
+        missing = [field for field in REQUIRED_FIELDS if field not in (reader.fieldnames or ())]
+        if missing:
+            raise InvalidPayload(f'Missing required column: {missing[0]}')
+        columns = ([], [], [])
+        for row in reader:
+            for column, field in zip(columns, REQUIRED_FIELDS):
+                column.append(row[field] or '')
+        return _checked(EmailColumns(*columns))
+
+    if kind == 'jsonl':
+        emails = [loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        emails = loads(text)
+        if isinstance(emails, dict):
+            emails = emails.get('emails')
+        if not isinstance(emails, list):
+            raise InvalidPayload('JSON file must be an array of emails or {"emails": [...]}')
+
+    for i, email in enumerate(emails):
+        error = validate_email(email)
+        if error:
+            raise InvalidPayload(f'Email {i+1}: {error}')
+    return _checked(EmailColumns.from_records(emails))
@@ -0,0 +1,274 @@
+import html
+import re
+
+# Giới hạn mặc định cho nội dung email trước khi phân loại
+DEFAULT_MAX_CHARS = 20000       # Kích thước cửa sổ head + tail (ký tự)
+DEFAULT_HEAD_RATIO = 0.75       # Tỉ lệ dành cho phần đầu email
+DEFAULT_MAX_TOKENS = 3000       # Số token tối đa sau khi cắt cửa sổ
+DEFAULT_MAX_TITLE_CHARS = 1000
+DEFAULT_MAX_FROM_CHARS = 320    # Độ dài tối đa của một địa chỉ email (RFC 3696)
+DEFAULT_MAX_QUOTED_CHARS = 4000 # Ngân sách cho phần trích dẫn khi bật strip_quoted
+
+# Nội dung HTML thường dài gấp nhiều lần phần text thực sự, nên cắt thô
+# trước với hệ số này để việc bỏ thẻ HTML không phải xử lý cả email 5MB
+RAW_WINDOW_FACTOR = 4
+
+# Phần đầu và phần cuối được nối bằng xuống dòng để các pattern dạng `a.*b`
+# (không có DOTALL) không khớp "xuyên" qua đoạn đã bị cắt bỏ
+WINDOW_SEPARATOR = '\n'
+
+# Chỉ bỏ HTML khi có thẻ thật ("<p>", "<a href=...>", "<!--", "<!DOCTYPE"): văn bản thường
+# như "Tên <a@b.com>" giữ nguyên. Mỗi lần thử chỉ quét tới '<' tiếp theo nên tổng thời gian tuyến tính
+HTML_TAG_HINT = re.compile(r'<(?:!--|!doctype\b|/?[a-zA-Z][a-zA-Z0-9]*(?:\s[^<>]*)?/?>)', re.IGNORECASE)
+TAG_START = re.compile(r'[a-zA-Z/!]')
+HTML_TAG_NAME = re.compile(r'(/?)([a-zA-Z][a-zA-Z0-9]*)')
+HTML_HREF = re.compile(r'\bhref\s*=\s*["\']?([^"\'\s<>]+)', re.IGNORECASE)
+HTML_DROP_BLOCKS = frozenset(('script', 'style', 'head'))     # Bỏ cả nội dung giữa thẻ mở và thẻ đóng
+HTML_BLOCK_BREAKS = frozenset(('br',))                        # Thẻ mở thành xuống dòng
+HTML_CLOSING_BREAKS = frozenset(('p', 'div', 'tr', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'))  # Thẻ đóng thành xuống dòng
+ASCII_LOWER = str.maketrans('ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')
+BLANK_LINES = re.compile(r'\n\s*\n+')
+
+# Dòng trích dẫn ("> ...") và phần header của email trả lời/chuyển tiếp
+QUOTED_LINE = re.compile(r'^[ \t]*>.*(?:\n|$)', re.MULTILINE)
+REPLY_HEADER = re.compile(
+    r'^[ \t]*(?:On .{1,200}wrote:|Vào .{1,200}đã viết:'
+    r'|-{2,}\s*(?:Original Message|Forwarded message|Thư gốc|Tin nhắn gốc)\s*-{2,}'
+    r'|From: .{1,200}\n[ \t]*(?:Sent|Date): )',
+    re.MULTILINE | re.IGNORECASE
+)
+
+TOKEN = re.compile(r'\S+')
+
+
+class ContentPolicy:
+    """
+    Chuẩn hóa và giới hạn kích thước email trước khi phân loại
+
+    Áp dụng một lần cho mọi classifier (rule-based và ML) theo thứ tự:
+    cắt thô -> bỏ HTML -> thu gọn phần trích dẫn -> cửa sổ head + tail -> giới hạn token
+
+    strip_quoted mặc định tắt: payload phishing có thể nằm ngay dưới một header
+    trả lời giả ("On ... wrote:"). Khi bật, phần trích dẫn không bị xóa mà được
+    chuyển xuống cuối và giới hạn ở max_quoted_chars ký tự.
+    """
+
+    def __init__(self, max_chars=DEFAULT_MAX_CHARS, head_ratio=DEFAULT_HEAD_RATIO,
+                 max_tokens=DEFAULT_MAX_TOKENS, strip_html=True, strip_quoted=False,
+                 max_quoted_chars=DEFAULT_MAX_QUOTED_CHARS,
+                 max_title_chars=DEFAULT_MAX_TITLE_CHARS, max_from_chars=DEFAULT_MAX_FROM_CHARS):
+        if max_chars is not None and max_chars <= 0:
+            raise ValueError('max_chars must be positive')
+        if not 0 < head_ratio <= 1:
+            raise ValueError('head_ratio must be in (0, 1]')
+        if max_tokens is not None and max_tokens <= 0:
+            raise ValueError('max_tokens must be positive')
+        if max_quoted_chars < 0:
+            raise ValueError('max_quoted_chars must not be negative')
+
+        self.max_chars = max_chars
+        self.head_ratio = head_ratio
+        self.max_tokens = max_tokens
+        self.strip_html = strip_html
+        self.strip_quoted = strip_quoted
+        self.max_quoted_chars = max_quoted_chars
+        self.max_title_chars = max_title_chars
+        self.max_from_chars = max_from_chars
+
+    def apply(self, email_data):
+        """
+        Trả về bản sao của email_data với title, content, from_email đã được chuẩn hóa
+        """
+        title, content, from_email = self.apply_fields(
+            email_data.get('title', ''),
+            email_data.get('content', ''),
+            email_data.get('from_email', '')
+        )
+        result = dict(email_data)
+        result['title'] = title
+        result['content'] = content
+        result['from_email'] = from_email
+        return result
+
+    def apply_fields(self, title, content, from_email):
+        """Chuẩn hóa từng trường của email, trả về tuple (title, content, from_email)"""
+        title = _window(str(title or ''), self.max_title_chars, 1.0)
+        from_email = str(from_email or '')[:self.max_from_chars].strip()
+        return title, self.clean_content(content), from_email
+
+    def apply_columns(self, titles, contents, from_emails):
+        """Chuẩn hóa batch email ở dạng cột, trả về tuple 3 danh sách"""
+        title_limit = self.max_title_chars
+        from_limit = self.max_from_chars
+        return (
+            [_window(str(title or ''), title_limit, 1.0) for title in titles],
+            [self.clean_content(content) for content in contents],
+            [str(from_email or '')[:from_limit].strip() for from_email in from_emails]
+        )
+
+    def clean_content(self, content):
+        """Áp dụng toàn bộ chính sách cho nội dung email"""
+        content = str(content or '')
+        if not content:
+            return content
+
+        if self.max_chars is not None:
+            content = _window(content, self.max_chars * RAW_WINDOW_FACTOR, self.head_ratio)
+
+        if self.strip_html and HTML_TAG_HINT.search(content):
+            content = strip_html(content)
+
+        if self.strip_quoted:
+            content = strip_quoted_reply(content, self.max_quoted_chars, self.head_ratio)
+
+        if self.max_chars is not None:
+            content = _window(content, self.max_chars, self.head_ratio)
+
+        if self.max_tokens is not None:
+            content = _cap_tokens(content, self.max_tokens, self.head_ratio)
+
+        return content
+
+    def to_dict(self):
+        """Cấu hình hiện tại (dùng cho /model_info)"""
+        return {
+            'max_chars': self.max_chars,
+            'head_ratio': self.head_ratio,
+            'max_tokens': self.max_tokens,
+            'strip_html': self.strip_html,
+            'strip_quoted': self.strip_quoted,
+            'max_quoted_chars': self.max_quoted_chars,
+            'max_title_chars': self.max_title_chars,
+            'max_from_chars': self.max_from_chars
+        }
+
+
+class _Finder:
+    """
+    str.find với vị trí bắt đầu không giảm: kết quả của mỗi chuỗi cần tìm được
+    giữ lại tới khi vượt qua, nên tổng thời gian tìm là tuyến tính theo độ dài text
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self._found = {}
+
+    def find(self, needle, start):
+        found = self._found.get(needle)
+        if found is not None and (found[1] == -1 or found[1] >= start) and found[0] <= start:
+            return found[1]
+        position = self.text.find(needle, start)
+        self._found[needle] = (start, position)
+        return position
+
+
+def strip_html(content):
+    """
+    Bỏ thẻ HTML nhưng giữ lại địa chỉ link (tín hiệu quan trọng cho spam/phishing)
+
+    Quét một lượt bằng str.find (không dùng regex có backtracking trên cả email):
+    khối script/style/head và comment bị bỏ, <a href=...> thành địa chỉ link,
+    <br> và thẻ đóng của khối thành xuống dòng, thẻ khác thành khoảng trắng.
+    '<' không mở thẻ ("a < b") hoặc không có '>' phía sau được giữ nguyên như văn bản.
+    """
+    lower = _Finder(content.translate(ASCII_LOWER))
+    finder = _Finder(content)
+    parts = []
+    position = 0
+    while True:
+        start = content.find('<', position)
+        if start < 0:
+            parts.append(content[position:])
+            break
+        parts.append(content[position:start])
+
+        if content.startswith('<!--', start):
+            end = finder.find('-->', start + 4)
+            if end >= 0:
+                parts.append(' ')
+                position = end + 3
+                continue
+
+        close = finder.find('>', start + 1) if TAG_START.match(content, start + 1) else -1
+        if close < 0:
+            # Không phải thẻ: "a < b", '<' không có '>' phía sau
+            parts.append('<')
+            position = start + 1
+            continue
+
+        replacement = ' '
+        position = close + 1
+        tag = HTML_TAG_NAME.match(content, start + 1, close)
+        if tag is not None:
+            closing, name = tag.group(1), tag.group(2).lower()
+            if not closing and name in HTML_DROP_BLOCKS:
+                end = lower.find(f'</{name}', close + 1)
+                end_close = finder.find('>', end) if end >= 0 else -1
+                if end_close >= 0:
+                    position = end_close + 1
+            elif not closing and name == 'a':
+                href = HTML_HREF.search(content, tag.end(), close)
+                if href is not None:
+                    replacement = f' {href.group(1)} '
+            elif name in (HTML_CLOSING_BREAKS if closing else HTML_BLOCK_BREAKS):
+                replacement = '\n'
+        parts.append(replacement)
+
+    content = html.unescape(''.join(parts))
+    return BLANK_LINES.sub('\n', content).strip()
+
+
+def split_quoted_reply(content):
+    """Tách phần mới viết và phần trích dẫn (dòng "> ..." và email gốc sau header trả lời)"""
+    written, quoted = content, ''
+    header = REPLY_HEADER.search(content)
+    if header:
+        written, quoted = content[:header.start()], content[header.start():]
+    if '>' in written:
+        quoted_lines = QUOTED_LINE.findall(written)
+        if quoted_lines:
+            written = QUOTED_LINE.sub('', written)
+            quoted = ''.join(quoted_lines) + quoted
+    return written, quoted
+
+
+def strip_quoted_reply(content, max_quoted_chars=DEFAULT_MAX_QUOTED_CHARS, head_ratio=DEFAULT_HEAD_RATIO):
+    """
+    Thu gọn phần trích dẫn: phần mới viết giữ nguyên, phần trích dẫn được chuyển
+    xuống cuối và giới hạn ở max_quoted_chars ký tự (0: bỏ hẳn)
+    """
+    written, quoted = split_quoted_reply(content)
+    # Không có trích dẫn, hoặc email chỉ gồm phần trích dẫn: giữ nguyên để vẫn có gì đó để phân loại
+    if not quoted.strip() or not written.strip():
+        return content
+    quoted = _window(quoted.strip(), max_quoted_chars, head_ratio) if max_quoted_chars else ''
+    if not quoted:
+        return written.rstrip()
+    return written.rstrip() + WINDOW_SEPARATOR + quoted
+
+
+def _window(text, max_chars, head_ratio):
+    """Giữ phần đầu và phần cuối của text nếu vượt quá max_chars"""
+    if max_chars is None or len(text) <= max_chars:
+        return text
+    head = int(max_chars * head_ratio)
+    tail = max_chars - head
+    if tail <= 0:
+        return text[:head]
+    return text[:head] + WINDOW_SEPARATOR + text[-tail:]
+
+
+def _cap_tokens(text, max_tokens, head_ratio):
+    """Giới hạn số token, cắt theo vị trí trong text gốc để giữ nguyên xuống dòng"""
+    spans = [m.span() for m in TOKEN.finditer(text)]
+    if len(spans) <= max_tokens:
+        return text
+    head = int(max_tokens * head_ratio)
+    tail = max_tokens - head
+    head_text = text[:spans[head - 1][1]] if head > 0 else ''
+    if tail <= 0:
+        return head_text
+    tail_text = text[spans[-tail][0]:]
+    if not head_text:
+        return tail_text
+    return head_text + WINDOW_SEPARATOR + tail_text
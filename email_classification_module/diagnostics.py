@@ -0,0 +1,240 @@
+import collections
+import contextlib
+import gc
+import linecache
+import os
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None
+
+DEFAULT_FRAMES = 10             # Số frame lưu cho mỗi allocation (nhiều hơn = chính xác hơn nhưng tốn bộ nhớ hơn)
+DEFAULT_RSS_INTERVAL = 10.0     # Giây giữa hai lần lấy mẫu RSS
+MAX_RSS_SAMPLES = 8640          # Một ngày với chu kỳ 10 giây
+DEFAULT_TOP = 10
+
+_NULL_STAGE = contextlib.nullcontext()
+
+# Allocation của chính tracemalloc / module này không được tính trong top allocation sites
+_IGNORED_FILES = (tracemalloc.__file__, os.path.abspath(__file__), '<frozen importlib._bootstrap>',
+                  '<frozen importlib._bootstrap_external>', '<unknown>')
+
+
+def rss_bytes():
+    """RSS hiện tại của process (Linux: /proc/self/statm), ngược lại RSS đỉnh từ getrusage"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is not None:
+        # ru_maxrss: KB trên Linux, bytes trên macOS
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if os.uname().sysname == 'Darwin' else maxrss * 1024
+    return None
+
+
+class _StageStats:
+    __slots__ = ('calls', 'net_bytes', 'max_bytes', 'min_bytes')
+
+    def __init__(self):
+        self.calls = 0
+        self.net_bytes = 0
+        self.max_bytes = None
+        self.min_bytes = None
+
+    def add(self, delta):
+        self.calls += 1
+        self.net_bytes += delta
+        self.max_bytes = delta if self.max_bytes is None else max(self.max_bytes, delta)
+        self.min_bytes = delta if self.min_bytes is None else min(self.min_bytes, delta)
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'net_bytes': self.net_bytes,
+            'mean_bytes': round(self.net_bytes / self.calls, 1) if self.calls else None,
+            'max_bytes': self.max_bytes,
+            'min_bytes': self.min_bytes
+        }
+
+
+class _Stage:
+    """Đo chênh lệch bộ nhớ được trace trước/sau một đoạn xử lý"""
+
+    __slots__ = ('diagnostics', 'name', 'start')
+
+    def __init__(self, diagnostics, name):
+        self.diagnostics = diagnostics
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = tracemalloc.get_traced_memory()[0]
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if tracemalloc.is_tracing():
+            self.diagnostics._record(self.name, tracemalloc.get_traced_memory()[0] - self.start)
+        return False
+
+
+class MemoryDiagnostics:
+    """
+    Chẩn đoán bộ nhớ cho worker chạy lâu (opt-in)
+
+    - stage(name): chênh lệch bộ nhớ được trace (tracemalloc) theo từng bước xử lý
+      (parse, content policy, phân loại, serialize...). Khi tắt, stage() trả về
+      context rỗng dùng chung nên gần như không tốn chi phí.
+    - top_allocations(): các vị trí cấp phát lớn nhất từ snapshot tracemalloc,
+      so với snapshot gốc lấy lúc bật (bộ nhớ tăng thêm kể từ đó).
+    - RSS được lấy mẫu định kỳ trong thread nền.
+
+    Số liệu theo từng process; các request chạy song song trong cùng process được
+    tính chồng lên nhau nên chênh lệch theo stage chỉ chính xác khi tải thấp.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.frames = None
+        self.started_at = None
+        self.rss_interval = None
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._baseline = None
+        self._rss = collections.deque(maxlen=MAX_RSS_SAMPLES)
+        self._stop = threading.Event()
+        self._thread = None
+        self._started_tracemalloc = False
+
+    def start(self, frames=DEFAULT_FRAMES, rss_interval=DEFAULT_RSS_INTERVAL):
+        """Bật tracemalloc, lấy snapshot gốc và bắt đầu lấy mẫu RSS"""
+        with self._lock:
+            if self.enabled:
+                return False
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                self._started_tracemalloc = True
+            self.frames = tracemalloc.get_traceback_limit()
+            self.rss_interval = rss_interval
+            self.started_at = time.time()
+            self._stages = {}
+            self._rss.clear()
+            self._stop.clear()
+            self.enabled = True
+        self._baseline = self._snapshot()
+        self._thread = threading.Thread(target=self._sample_rss, name='memory-diagnostics', daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        """Tắt tracemalloc (nếu do diagnostics bật) và giải phóng snapshot gốc"""
+        with self._lock:
+            if not self.enabled:
+                return False
+            self.enabled = False
+            self._stop.set()
+            self._baseline = None
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+                self._started_tracemalloc = False
+        if self._thread is not None:
+            self._thread.join(self.rss_interval)
+            self._thread = None
+        return True
+
+    def reset(self):
+        """Xóa số liệu stage và lấy lại snapshot gốc (bắt đầu đo lại từ thời điểm này)"""
+        if not self.enabled:
+            return False
+        with self._lock:
+            self._stages = {}
+        self._baseline = self._snapshot()
+        return True
+
+    def stage(self, name):
+        """Context manager đo một bước xử lý (không làm gì khi diagnostics tắt)"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def _record(self, name, delta):
+        with self._lock:
+            stats = self._stages.get(name)
+            if stats is None:
+                stats = self._stages[name] = _StageStats()
+            stats.add(delta)
+
+    def _sample_rss(self):
+        while True:
+            self._rss.append((round(time.time() - self.started_at, 1), rss_bytes()))
+            if self._stop.wait(self.rss_interval):
+                return
+
+    @staticmethod
+    def _snapshot():
+        snapshot = tracemalloc.take_snapshot()
+        return snapshot.filter_traces([tracemalloc.Filter(False, filename) for filename in _IGNORED_FILES])
+
+    def top_allocations(self, limit=DEFAULT_TOP, key_type='lineno'):
+        """
+        Các vị trí cấp phát lớn nhất (theo bộ nhớ tăng thêm so với snapshot gốc)
+
+        Returns:
+            list: [{'site', 'code', 'size', 'size_diff', 'count', 'count_diff'}]
+        """
+        if not self.enabled:
+            return []
+        snapshot = self._snapshot()
+        baseline = self._baseline
+        if baseline is not None:
+            stats = snapshot.compare_to(baseline, key_type)
+        else:
+            stats = snapshot.statistics(key_type)
+        top = []
+        for stat in stats[:limit]:
+            frame = stat.traceback[0]
+            top.append({
+                'site': f'{frame.filename}:{frame.lineno}',
+                'code': linecache.getline(frame.filename, frame.lineno).strip(),
+                'size': stat.size,
+                'size_diff': getattr(stat, 'size_diff', None),
+                'count': stat.count,
+                'count_diff': getattr(stat, 'count_diff', None)
+            })
+        return top
+
+    def report(self, top=DEFAULT_TOP):
+        """Trạng thái, bộ nhớ được trace, RSS theo thời gian, số liệu theo stage và top allocation"""
+        rss_samples = list(self._rss)
+        report = {
+            'enabled': self.enabled,
+            'pid': os.getpid(),
+            'rss_bytes': rss_bytes(),
+            'gc_counts': gc.get_count()
+        }
+        if not self.enabled:
+            return report
+        current, peak = tracemalloc.get_traced_memory()
+        with self._lock:
+            stages = {name: stats.to_dict() for name, stats in sorted(self._stages.items())}
+        report.update({
+            'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started_at)),
+            'frames': self.frames,
+            'traced_bytes': current,
+            'traced_peak_bytes': peak,
+            'tracemalloc_overhead_bytes': tracemalloc.get_tracemalloc_memory(),
+            'rss': {
+                'interval_seconds': self.rss_interval,
+                'first_bytes': rss_samples[0][1] if rss_samples else None,
+                'max_bytes': max((sample[1] or 0 for sample in rss_samples), default=None),
+                'samples': rss_samples
+            },
+            'stages': stages,
+            'top_allocations': self.top_allocations(top) if top else []
+        })
+        return report
@@ -1,20 +1,64 @@
-import re
-from email_patterns import EMAIL_PATTERNS
+import hashlib
+import os
+import email_features
+import prefilter
+from email_features import derived_fields
+from prefilter import DIRECT_SCAN, LiteralPrefilter
+from ruleset_compiler import DEFAULT_CACHE_DIR, DEFAULT_RULESET_PATH, load_ruleset
 import logging
 
 # Thiết lập logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Ruleset mặc định có thể thay bằng biến môi trường (file .json hoặc .yaml)
+RULESET_PATH = os.environ.get('EMAIL_RULESET_PATH', DEFAULT_RULESET_PATH)
+RULESET_CACHE_DIR = os.environ.get('EMAIL_RULESET_CACHE_DIR', DEFAULT_CACHE_DIR)
+
+# Code quyết định kết quả rule-based ngoài ruleset: chấm điểm, trường dẫn xuất và prefilter
+VERSION_SOURCES = tuple(os.path.abspath(path) for path in (__file__, email_features.__file__, prefilter.__file__))
+
+
 class EmailClassifier:
     """
     Phân loại email dựa trên rule-based approach
     Categories: An toàn (0), Nghi ngờ (1), Spam (2), Giả mạo (3)
+    
+    Các rule được khai báo trong ruleset (rules/default.json) và compile bởi
+    ruleset_compiler; class này chỉ chấm điểm theo ruleset đã compile.
+    
+    Reentrant: classify() không thay đổi trạng thái dùng chung (trạng thái quét
+    literal được tạo mới cho mỗi email), nên một instance có thể được gọi đồng
+    thời từ nhiều thread. Gọi warm_up() trước khi phục vụ để regex không phải
+    compile trong request đầu tiên.
     """
     
-    def __init__(self):
-        self.patterns = EMAIL_PATTERNS
-        logger.info("✅ Email classifier initialized successfully")
+    def __init__(self, use_prefilter=True, ruleset_path=None, cache_dir=RULESET_CACHE_DIR):
+        self.ruleset = load_ruleset(ruleset_path or RULESET_PATH, cache_dir=cache_dir)
+        self.version = self._compute_version()
+        # Prefilter literal: chỉ chạy regex khi các từ khóa bắt buộc của nó xuất hiện
+        self.prefilter = LiteralPrefilter(
+            self.ruleset.patterns, literals=self.ruleset.literals
+        ) if use_prefilter else None
+        logger.info(f"✅ Email classifier initialized successfully (ruleset {self.ruleset.name} "
+                    f"{self.ruleset.version})")
+    
+    def warm_up(self):
+        """Compile trước mọi regex của ruleset (bình thường được compile khi dùng lần đầu)"""
+        for pattern in self.ruleset.patterns:
+            pattern.compile()
+    
+    def _compute_version(self):
+        """
+        Fingerprint của ruleset + code chấm điểm / trường dẫn xuất / prefilter, dùng
+        làm version cho cache kết quả: thay đổi bất kỳ rule hay file nào trong số đó
+        sẽ tạo version mới
+        """
+        digest = hashlib.blake2b(self.ruleset.version.encode('utf-8'), digest_size=8)
+        for path in VERSION_SOURCES:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        return digest.hexdigest()
     
     def classify_email(self, email_data):
         """
@@ -23,270 +67,128 @@ class EmailClassifier:
         Args:
             email_data (dict): Email cần phân loại với keys:
                 - title: Tiêu đề email
-                - content: Nội dung email  
+                - content: Nội dung email
                 - from_email: Email người gửi
-                
+        
         Returns:
             dict: Kết quả phân loại với category, confidence, indicators, level
         """
-        title = email_data.get('title', '')
-        content = email_data.get('content', '')
-        from_email = email_data.get('from_email', '')
+        return self.classify(
+            email_data.get('title', ''),
+            email_data.get('content', ''),
+            email_data.get('from_email', '')
+        )
+    
+    def classify_columns(self, titles, contents, from_emails):
+        """
+        Phân loại nhiều email ở dạng cột (danh sách title, content, from_email
+        cùng độ dài) mà không cần tạo dict cho từng email
         
-        # Khởi tạo kết quả với giá trị mặc định
-        result = {
-            'category': 'An toàn',
-            'confidence': 0,
-            'indicators': [],
-            'level': 'basic'
+        Returns:
+            list: Kết quả phân loại theo đúng thứ tự đầu vào
+        """
+        classify = self.classify
+        return [
+            classify(title, content, from_email)
+            for title, content, from_email in zip(titles, contents, from_emails)
+        ]
+    
+    def classify(self, title, content, from_email):
+        """Phân loại email từ các trường đã tách sẵn (xem classify_email)"""
+        fields = {
+            'title': title,
+            'content': content,
+            'from_email': from_email,
+            'domain': from_email.split('@')[1] if '@' in from_email else ''
         }
+        # Trường dẫn xuất được tính một lần cho mọi rule dùng đến
+        if self.ruleset.uses_features:
+            fields.update(derived_fields(title, content, from_email, self.ruleset.feature_fields))
         
-        # Kiểm tra từng loại email theo thứ tự ưu tiên
-        # 1. Kiểm tra Phishing trước (nguy hiểm nhất)
-        phishing_check = self._check_phishing(title, content, from_email)
-        if phishing_check['isPhishing']:
-            return {
-                'category': 'Giả mạo',
-                'confidence': phishing_check['confidence'],
-                'indicators': phishing_check['indicators'],
-                'level': phishing_check['level']
-            }
-        
-        # 2. Kiểm tra Spam
-        spam_check = self._check_spam(title, content, from_email)
-        if spam_check['isSpam']:
-            return {
-                'category': 'Spam',
-                'confidence': spam_check['confidence'],
-                'indicators': spam_check['indicators'],
-                'level': spam_check['level']
-            }
+        # Mỗi trường chỉ được quét literal một lần cho mọi regex
+        scan = self.prefilter.scan() if self.prefilter is not None else DIRECT_SCAN
         
-        # 3. Kiểm tra Nghi ngờ
-        suspicious_check = self._check_suspicious(title, content, from_email)
-        if suspicious_check['isSuspicious']:
-            return {
-                'category': 'Nghi ngờ',
-                'confidence': suspicious_check['confidence'],
-                'indicators': suspicious_check['indicators'],
-                'level': suspicious_check['level']
-            }
+        # Kiểm tra từng category theo thứ tự ưu tiên của ruleset (Giả mạo trước: nguy hiểm nhất)
+        for category in self.ruleset.categories:
+            result = self._check_category(category, fields, scan)
+            if result is not None:
+                return result
         
-        # 4. Kiểm tra An toàn
-        safe_check = self._check_safe(title, content, from_email)
-        if safe_check['isSafe']:
-            return {
-                'category': 'An toàn',
-                'confidence': safe_check['confidence'],
-                'indicators': ['Email từ nguồn tin cậy', 'Không có dấu hiệu đáng ngờ'],
-                'level': 'basic'
-            }
-        
-        # Nếu không rõ ràng, mặc định là Nghi ngờ với confidence thấp
+        # Nếu không rõ ràng, dùng kết quả mặc định của ruleset (Nghi ngờ với confidence thấp)
+        fallback = self.ruleset.fallback
         return {
-            'category': 'Nghi ngờ',
-            'confidence': 0.3,
-            'indicators': ['Không thể xác định rõ ràng'],
-            'level': 'basic'
+            'category': fallback['category'],
+            'confidence': fallback['confidence'],
+            'indicators': list(fallback['indicators']),
+            'level': fallback['level']
         }
     
-    def _check_phishing(self, title, content, from_email):
-        """Kiểm tra email Phishing (Giả mạo)"""
-        patterns = self.patterns['phishing']
-        indicators = []
-        match_count = 0
-        level = 'basic'
-        
-        # Kiểm tra domain giả mạo trong email gửi
-        domain = from_email.split('@')[1] if '@' in from_email else ''
-        
-        # Kiểm tra brand spoofing (ví dụ: Amaz0n, G00gle)
-        for brand_pattern in patterns['basic']['brandSpoofing']:
-            if brand_pattern.search(from_email) or brand_pattern.search(content):
-                indicators.append('Giả mạo thương hiệu với ký tự số thay chữ')
-                match_count += 2  # Trọng số cao cho brand spoofing
-        
-        # Kiểm tra phishing domains (.tk, .ml, .ga, .cf)
-        for phish_domain in patterns['basic']['fromDomainPatterns']:
-            if phish_domain.search(domain):
-                indicators.append(f'Domain đáng ngờ: {domain}')
-                match_count += 2
-        
-        # Kiểm tra title patterns
-        for pattern in patterns['basic']['titlePatterns']:
-            if pattern.search(title):
-                indicators.append('Tiêu đề có dấu hiệu phishing')
-                match_count += 1
-        
-        # Kiểm tra content patterns
-        for pattern in patterns['basic']['contentPatterns']:
-            if pattern.search(content):
-                indicators.append('Nội dung yêu cầu xác minh khẩn cấp')
-                match_count += 1
-        
-        # Kiểm tra advanced patterns nếu có
-        if 'advanced' in patterns and match_count < 3:
-            level = 'advanced'
-            # Kiểm tra các dấu hiệu tinh vi hơn
-            if re.search(r'phòng.*kế.*toán', from_email, re.IGNORECASE) or \
-               re.search(r'accounting', from_email, re.IGNORECASE):
-                indicators.append('Giả danh phòng ban nội bộ')
-                match_count += 1
-        
-        confidence = min(match_count * 0.25, 1)
-        
-        return {
-            'isPhishing': match_count >= 2,
-            'confidence': confidence,
-            'indicators': indicators,
-            'level': level
-        }
+    @staticmethod
+    def _matches(pattern, field_names, fields, scan):
+        """Pattern có khớp ít nhất một trong các trường không"""
+        for name in field_names:
+            if name == 'title_content':
+                # title + ' ' + content: dùng lại kết quả quét của title và content
+                if scan.search_joined(pattern, fields['title'], ' ', fields['content']):
+                    return True
+            elif scan.search(pattern, fields[name]):
+                return True
+        return False
     
-    def _check_spam(self, title, content, from_email):
-        """Kiểm tra email Spam"""
-        patterns = self.patterns['spam']
-        indicators = []
-        match_count = 0
-        level = 'basic'
-        
-        # Kiểm tra basic spam patterns
-        # 1. Title với giảm giá, viết hoa, emoji
-        for pattern in patterns['basic']['titlePatterns']:
-            if pattern.search(title):
-                if re.search(r'[0-9]{2,}%', title, re.IGNORECASE):
-                    indicators.append('Quảng cáo giảm giá lớn')
-                elif re.search(r'!!!', title):
-                    indicators.append('Sử dụng nhiều dấu chấm than')
-                elif re.search(r'💰|🎉|🔥', title):
-                    indicators.append('Sử dụng emoji spam')
-                match_count += 1
-        
-        # 2. Content patterns
-        for pattern in patterns['basic']['contentPatterns']:
-            if pattern.search(content):
-                if re.search(r'bit\.ly|tinyurl', content):
-                    indicators.append('Chứa link rút gọn đáng ngờ')
-                    match_count += 2  # Trọng số cao cho shortened links
-                else:
-                    indicators.append('Nội dung spam điển hình')
-                    match_count += 1
-        
-        # 3. From domain patterns
-        domain = from_email.split('@')[1] if '@' in from_email else ''
-        for pattern in patterns['basic']['fromDomainPatterns']:
-            if pattern.search(domain):
-                indicators.append('Domain spam thương mại')
-                match_count += 1
-        
-        # Kiểm tra advanced spam (marketing tinh vi)
-        if 'advanced' in patterns and match_count < 2:
-            level = 'advanced'
-            for pattern in patterns['advanced']['contentPatterns']:
-                if pattern.search(content):
-                    indicators.append('Marketing email với trigger tâm lý')
-                    match_count += 1
-        
-        confidence = min(match_count * 0.3, 1)
-        
-        return {
-            'isSpam': match_count >= 2,
-            'confidence': confidence,
-            'indicators': indicators,
-            'level': level
-        }
+    def _score_group(self, group, fields, scan, indicators):
+        """Cộng điểm của một nhóm pattern, trả về số điểm"""
+        matches = self._matches
+        score = 0
+        for pattern in group.patterns:
+            if not matches(pattern, group.fields, fields, scan):
+                continue
+            indicator, weight = group.indicator, group.weight
+            # Biến thể đầu tiên khớp quyết định indicator/trọng số (ví dụ link rút gọn)
+            for variant, variant_fields, variant_indicator, variant_weight in group.variants:
+                if matches(variant, variant_fields, fields, scan):
+                    indicator, weight = variant_indicator, variant_weight
+                    break
+            if indicator is not None:
+                indicators.append(indicator.format_map(fields) if '{' in indicator else indicator)
+            score += weight
+            if group.first_only:
+                break
+        return score
     
-    def _check_suspicious(self, title, content, from_email):
-        """Kiểm tra email Nghi ngờ"""
-        patterns = self.patterns['suspicious']
+    def _check_category(self, category, fields, scan=DIRECT_SCAN):
+        """
+        Chấm điểm email theo một category
+        
+        Returns:
+            dict: Kết quả phân loại nếu email thuộc category, ngược lại None
+        """
         indicators = []
-        match_count = 0
         level = 'basic'
+        score = 0
+        for group in category.groups:
+            score += self._score_group(group, fields, scan, indicators)
         
-        # 1. Kiểm tra title patterns (khẩn, gấp, urgent)
-        for pattern in patterns['basic']['titlePatterns']:
-            if pattern.search(title):
-                indicators.append('Tạo áp lực thời gian trong tiêu đề')
-                match_count += 1
-        
-        # 2. Kiểm tra content patterns
-        for pattern in patterns['basic']['contentPatterns']:
-            if pattern.search(content):
-                if re.search(r'trong vòng.*[0-9]+.*giờ', content, re.IGNORECASE):
-                    indicators.append('Yêu cầu hành động trong thời gian ngắn')
-                elif re.search(r'vui lòng.*cung cấp', content, re.IGNORECASE):
-                    indicators.append('Yêu cầu cung cấp thông tin')
-                else:
-                    indicators.append('Nội dung có dấu hiệu đáng ngờ')
-                match_count += 1
-        
-        # 3. Kiểm tra domain patterns
-        domain = from_email.split('@')[1] if '@' in from_email else ''
-        for pattern in patterns['basic']['fromDomainPatterns']:
-            if pattern.search(domain):
-                indicators.append(f'Domain không chính thức: {domain}')
-                match_count += 1
-        
-        # 4. Kiểm tra lỗi chính tả (spelling errors)
-        if 'spellingErrors' in patterns['basic']:
-            full_text = title + ' ' + content
-            for error_pattern in patterns['basic']['spellingErrors']:
-                if error_pattern.search(full_text):
-                    indicators.append('Có lỗi chính tả đáng ngờ')
-                    match_count += 1
-                    break
+        # Kiểm tra các dấu hiệu tinh vi hơn khi điểm cơ bản còn thấp
+        if category.advanced_below is not None and score < category.advanced_below:
+            level = 'advanced'
+            for group in category.advanced_groups:
+                score += self._score_group(group, fields, scan, indicators)
         
-        confidence = min(match_count * 0.35, 1)
+        if score < category.threshold:
+            return None
+        # Pattern phủ quyết (ví dụ email "an toàn" nhưng chứa từ nghi ngờ)
+        for group in category.veto:
+            for pattern in group.patterns:
+                if self._matches(pattern, group.fields, fields, scan):
+                    return None
         
         return {
-            'isSuspicious': match_count >= 2,
-            'confidence': confidence,
-            'indicators': indicators,
+            'category': category.label,
+            'confidence': min(score * category.confidence_per_point, 1),
+            'indicators': list(category.result_indicators) if category.result_indicators is not None else indicators,
             'level': level
         }
     
-    def _check_safe(self, title, content, from_email):
-        """Kiểm tra email An toàn"""
-        patterns = self.patterns['safe']
-        safe_score = 0
-        
-        # 1. Kiểm tra domain tin cậy
-        domain = from_email.split('@')[1] if '@' in from_email else ''
-        for pattern in patterns['requiredPatterns']['fromDomainPatterns']:
-            if pattern.search(from_email):
-                safe_score += 2  # Domain tin cậy có trọng số cao
-                break
-        
-        # 2. Kiểm tra lời chào chuyên nghiệp
-        for pattern in patterns['requiredPatterns']['professionalGreetings']:
-            if pattern.search(content):
-                safe_score += 1
-                break
-        
-        # 3. Kiểm tra lời kết chuyên nghiệp
-        for pattern in patterns['requiredPatterns']['professionalClosings']:
-            if pattern.search(content):
-                safe_score += 1
-                break
-        
-        # 4. Đảm bảo KHÔNG có các từ nghi ngờ
-        has_suspicious_words = False
-        for pattern in patterns['mustNotHave']['suspiciousWords']:
-            if pattern.search(content) or pattern.search(title):
-                has_suspicious_words = True
-                break
-        
-        # Email an toàn nếu:
-        # - Có domain tin cậy (score >= 2) VÀ
-        # - Không có từ nghi ngờ VÀ
-        # - Có ít nhất 1 yếu tố chuyên nghiệp khác
-        is_safe = safe_score >= 3 and not has_suspicious_words
-        confidence = min(safe_score * 0.25, 1) if is_safe else 0
-        
-        return {
-            'isSafe': is_safe,
-            'confidence': confidence
-        }
-    
     def analyze_email(self, email_data):
         """Phân tích chi tiết một email và in kết quả"""
         title = email_data.get('title', '')
@@ -308,4 +210,4 @@ class EmailClassifier:
             logger.info(f'  • {indicator}')
         logger.info('======================\n')
         
-        return result 
\ No newline at end of file
+        return result
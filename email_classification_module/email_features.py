@@ -0,0 +1,192 @@
+import re
+
+# Dịch vụ rút gọn link thường gặp (so sánh với host đã chuẩn hóa chữ thường, bỏ "www.")
+SHORTENER_HOSTS = frozenset({
+    'bit.ly', 'tinyurl.com', 'short.link', 'goo.gl', 't.co', 'ow.ly', 'is.gd', 'buff.ly',
+    'cutt.ly', 'rebrand.ly', 'shorturl.at', 'rb.gy', 'tiny.cc', 'v.gd'
+})
+
+# URL có scheme, URL bắt đầu bằng "www." hoặc dạng host/path không có scheme (bit.ly/abc)
+URL_PATTERN = re.compile(
+    r'(?:https?://|www\.)[^\s<>"\']+'
+    r'|\b(?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+[a-z]{2,}/[^\s<>"\']*',
+    re.IGNORECASE
+)
+# Host rút gọn được nhắc tới không kèm path/scheme ("tinyurl.com", "www.bit.ly")
+SHORTENER_MENTION_PATTERN = re.compile(
+    r'(?<![\w.-])(?:www\.)?(' + '|'.join(re.escape(host) for host in sorted(SHORTENER_HOSTS)) + r')(?![\w-])',
+    re.IGNORECASE
+)
+# Dòng có nhắc tới "link": mọi rule về cụm từ "link" chạy trên các dòng này thay vì cả nội dung
+LINK_PHRASE_PATTERN = re.compile('link', re.IGNORECASE)
+HOST_PATTERN = re.compile(r'^(?:https?://)?([^/?#:\s]+)', re.IGNORECASE)
+IP_HOST_PATTERN = re.compile(r'^\d{1,3}(?:\.\d{1,3}){3}$')
+TRAILING_PUNCTUATION = '.,;:!?)]}'
+
+MAX_URLS = 20               # Số URL tối đa giữ lại cho mỗi email (record gọn, chi phí cố định)
+
+# Trường dẫn xuất mà ruleset có thể dùng (xem ruleset_compiler.FIELDS)
+URL_FEATURE_FIELDS = ('urls', 'url_hosts', 'shorteners', 'sender_local', 'sender_tld')
+FEATURE_FIELDS = URL_FEATURE_FIELDS + ('link_lines',)
+
+
+class EmailFeatures:
+    """
+    Đặc trưng URL và người gửi của một email, trích xuất một lần và dùng chung
+    cho rule-based (các trường dẫn xuất) và ML (token bổ sung)
+    """
+
+    __slots__ = ('urls', 'url_hosts', 'shortener_hosts', 'ip_hosts', 'sender_local', 'sender_domain', 'sender_tld')
+
+    def __init__(self, urls, url_hosts, shortener_hosts, ip_hosts, sender_local, sender_domain, sender_tld):
+        self.urls = urls
+        self.url_hosts = url_hosts
+        self.shortener_hosts = shortener_hosts
+        self.ip_hosts = ip_hosts
+        self.sender_local = sender_local
+        self.sender_domain = sender_domain
+        self.sender_tld = sender_tld
+
+    def fields(self):
+        """Các trường dẫn xuất dạng text cho rule (danh sách nối bằng khoảng trắng)"""
+        return {
+            'urls': ' '.join(self.urls),
+            'url_hosts': ' '.join(self.url_hosts),
+            'shorteners': ' '.join(self.shortener_hosts),
+            'sender_local': self.sender_local,
+            'sender_tld': self.sender_tld
+        }
+
+    def tokens(self):
+        """
+        Token đặc trưng cho ML (chữ thường, chỉ gồm ký tự \\w để vectorizer
+        giữ nguyên thành một token), ví dụ urlhost_bit_ly, url_shortener
+        """
+        tokens = []
+        if self.urls:
+            tokens.append('url_present')
+            tokens.append('url_count_many' if len(self.urls) > 2 else f'url_count_{len(self.urls)}')
+        for host in self.url_hosts:
+            tokens.append('urlhost_' + _token(host))
+        if self.shortener_hosts:
+            tokens.append('url_shortener')
+        if self.ip_hosts:
+            tokens.append('url_ip_host')
+        if self.sender_tld:
+            tokens.append('sender_tld_' + _token(self.sender_tld))
+        if any(char.isdigit() for char in self.sender_domain):
+            tokens.append('sender_domain_digits')
+        return tokens
+
+    def to_dict(self):
+        return {
+            'urls': list(self.urls),
+            'url_hosts': list(self.url_hosts),
+            'shortener_hosts': list(self.shortener_hosts),
+            'ip_hosts': list(self.ip_hosts),
+            'sender_local': self.sender_local,
+            'sender_domain': self.sender_domain,
+            'sender_tld': self.sender_tld
+        }
+
+
+def _token(value):
+    return re.sub(r'\W+', '_', value.lower()).strip('_')
+
+
+def extract_urls(text):
+    """Các URL trong text theo thứ tự xuất hiện (bỏ dấu câu dính ở cuối)"""
+    # Mọi dạng URL được nhận diện đều chứa '/' hoặc 'www.': bỏ qua regex cho text thường
+    if not text or ('/' not in text and 'www.' not in text.lower()):
+        return []
+    urls = []
+    for match in URL_PATTERN.finditer(text):
+        url = match.group(0).rstrip(TRAILING_PUNCTUATION)
+        if url:
+            urls.append(url)
+            if len(urls) >= MAX_URLS:
+                break
+    return urls
+
+
+def link_lines(text):
+    """
+    Các dòng của text có chứa "link" (không phân biệt hoa thường), nối bằng '\n'
+
+    Regex không có anchor và có literal "link" (không phân biệt hoa thường) khớp
+    trên kết quả khi và chỉ khi khớp trên cả text, vì '.' không vượt qua '\n':
+    các rule "click ... link ..." của nhiều category dùng chung một lần tìm "link"
+    và chỉ quét những dòng này.
+    """
+    if not text or not LINK_PHRASE_PATTERN.search(text):
+        return ''
+    return '\n'.join(line for line in text.split('\n') if LINK_PHRASE_PATTERN.search(line))
+
+
+def url_host(url):
+    """Host chữ thường của URL, bỏ tiền tố "www." và cổng"""
+    match = HOST_PATTERN.match(url)
+    if not match:
+        return ''
+    host = match.group(1).lower().rstrip('.')
+    return host[4:] if host.startswith('www.') else host
+
+
+def extract_features(title, content, from_email):
+    """
+    Trích xuất đặc trưng URL (từ title và content) và người gửi trong một lượt
+
+    Returns:
+        EmailFeatures
+    """
+    urls = extract_urls(title) + extract_urls(content)
+    hosts = []
+    for url in urls:
+        host = url_host(url)
+        if host and host not in hosts:
+            hosts.append(host)
+    shorteners = [host for host in hosts if host in SHORTENER_HOSTS]
+    # Host rút gọn nhắc tới không có path ("tinyurl.com") không phải URL nhưng vẫn là link rút gọn
+    for text in (title, content):
+        for match in SHORTENER_MENTION_PATTERN.finditer(text):
+            host = match.group(1).lower()
+            if host not in shorteners:
+                shorteners.append(host)
+
+    # Cùng cách tách với trường 'domain' của rule: phần sau '@' đầu tiên
+    if '@' in from_email:
+        sender_local, sender_domain = from_email.split('@')[:2]
+    else:
+        sender_local, sender_domain = from_email, ''
+    # Bỏ phần tên hiển thị nếu có ("Tên <user@domain>")
+    sender_local = sender_local.rsplit('<', 1)[-1].strip()
+    sender_domain = sender_domain.strip(' <>').lower()
+    sender_tld = sender_domain.rsplit('.', 1)[1] if '.' in sender_domain else ''
+
+    return EmailFeatures(
+        urls,
+        hosts,
+        shorteners,
+        [host for host in hosts if IP_HOST_PATTERN.match(host)],
+        sender_local,
+        sender_domain,
+        sender_tld
+    )
+
+
+def derived_fields(title, content, from_email, names):
+    """
+    Các trường dẫn xuất mà ruleset dùng (names), chỉ tính phần cần thiết:
+    URL/người gửi được trích xuất một lần khi có rule dùng đến
+    """
+    fields = {}
+    if not names.isdisjoint(URL_FEATURE_FIELDS):
+        fields.update(extract_features(title, content, from_email).fields())
+    if 'link_lines' in names:
+        fields['link_lines'] = link_lines(content)
+    return fields
+
+
+def feature_tokens(title, content, from_email):
+    """Token đặc trưng URL/người gửi cho ML (xem EmailFeatures.tokens)"""
+    return extract_features(title or '', content or '', from_email or '').tokens()
@@ -0,0 +1,338 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from model_registry import UnknownModel
+
+logger = logging.getLogger(__name__)
+
+# Loại tác vụ phân loại: email đơn lẻ (/predict/rule, /predict/ml) và batch (/predict/batch, /jobs)
+TASKS = ('rule', 'ml', 'batch_rule', 'batch_ml')
+MODES = ('thread', 'process')
+
+# Chính sách mặc định trên máy nhiều CPU, theo benchmarks/concurrency_bench.py
+# (chi phí gửi một request sang process - pickle + IPC - khoảng 0.2-0.4 ms):
+# - rule: ~0.06 ms/email, nhỏ hơn nhiều so với chi phí gửi sang process, nên chạy luôn
+#   trên thread của request
+# - ml: ~0.7 ms/email, gần như toàn bộ là tokenize/n-gram trong Python (giữ GIL), thêm
+#   thread không tăng throughput; process pool mở rộng theo số CPU
+# - batch: chi phí gửi < 10% thời gian phân loại batch 100 email, dùng process pool
+# Máy một CPU: process không có lợi, mọi tác vụ chạy trên thread.
+#
+# Mỗi worker process giữ một bản ML model riêng, và mỗi server process (ví dụ mỗi worker
+# gunicorn) có process pool riêng. Số CPU được chia cho số server process trên máy
+# (WEB_CONCURRENCY, biến gunicorn dùng cho --workers): tổng số worker process không vượt
+# quá số CPU, và khi mỗi server process chỉ còn một CPU thì mọi tác vụ chạy trên thread
+# (song song đã có nhờ các server process).
+DEFAULT_POLICY = {'rule': 'thread', 'ml': 'process', 'batch_rule': 'process', 'batch_ml': 'process'}
+SERVER_PROCESSES_ENV = 'WEB_CONCURRENCY'
+MAX_PROCESS_WORKERS = 8
+DEFAULT_THREAD_WORKERS = 4
+
+# Process pool hỏng (worker bị kill, lỗi khi khởi tạo): tác vụ chạy trên thread trong
+# POOL_RETRY_SECONDS (tăng gấp đôi sau mỗi lần hỏng liên tiếp) trước khi tạo lại pool;
+# hỏng MAX_POOL_FAILURES lần liên tiếp thì dừng dùng process cho tới restart()
+POOL_RETRY_SECONDS = 5.0
+MAX_POOL_FAILURES = 3
+
+# Classifiers dùng bởi run_email / run_columns trong process hiện tại
+_classifiers = {}
+
+
+def cpus_per_server():
+    """Số CPU dành cho mỗi server process (số CPU chia cho WEB_CONCURRENCY, ít nhất 1)"""
+    try:
+        servers = int(os.environ.get(SERVER_PROCESSES_ENV) or 1)
+    except ValueError:
+        servers = 1
+    return max(1, (os.cpu_count() or 1) // max(1, servers))
+
+
+def default_process_workers():
+    """Số worker process mặc định của mỗi server process"""
+    return min(cpus_per_server(), MAX_PROCESS_WORKERS)
+
+
+DEFAULT_PROCESS_WORKERS = default_process_workers()
+
+
+def load_policy(path=None):
+    """
+    Chính sách thread/process cho từng tác vụ: mặc định theo số CPU của mỗi server
+    process (cpus_per_server), ghi đè bởi file JSON (ví dụ do
+    benchmarks/concurrency_bench.py --write-policy tạo ra)
+
+    Raises:
+        ValueError: file chứa tác vụ hoặc chế độ không hợp lệ
+    """
+    if cpus_per_server() > 1:
+        policy = dict(DEFAULT_POLICY)
+    else:
+        policy = {task: 'thread' for task in TASKS}
+    if path:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        for task, mode in data.get('policy', data).items():
+            if task not in TASKS:
+                raise ValueError(f'Unknown task "{task}" in execution policy (allowed: {", ".join(TASKS)})')
+            if mode not in MODES:
+                raise ValueError(f'Unknown mode "{mode}" for {task} (allowed: {", ".join(MODES)})')
+            policy[task] = mode
+    return policy
+
+
+def register_classifiers(rule_classifier, ml_classifier, model_registry=None):
+    """Classifiers của process hiện tại (gọi sau khi load); model_registry cho các model khác mặc định"""
+    _classifiers['rule'] = rule_classifier
+    _classifiers['ml'] = ml_classifier
+    _classifiers['models'] = model_registry
+
+
+def init_worker(config=None):
+    """
+    Khởi tạo classifiers trong mỗi worker process
+
+    Worker chỉ load các classifier mà tác vụ chạy bằng process cần đến (không import
+    api_backend: không có cache kết quả, index gần trùng, job nền, shadow hay process
+    pool lồng nhau). config do ClassifierExecutor gửi sang (xem api_backend.worker_config):
+        rule (bool): load rule-based classifier
+        ruleset_path (str): ruleset của rule-based (None: mặc định)
+        registry (dict): tham số ModelRegistry (None: không load ML model)
+        preload (list): các model load sẵn ngoài model mặc định
+    """
+    logging.disable(logging.INFO)
+    config = config or {}
+    rule_classifier = ml_classifier = model_registry = None
+    if config.get('rule'):
+        from email_classifier import EmailClassifier
+        rule_classifier = EmailClassifier(ruleset_path=config.get('ruleset_path'))
+        rule_classifier.warm_up()
+    if config.get('registry') is not None:
+        from model_registry import ModelRegistry
+        model_registry = ModelRegistry(**config['registry'])
+        ml_classifier = model_registry.get()
+        for name in config.get('preload', ()):
+            try:
+                model_registry.get(name)
+            except Exception as e:
+                # Model lỗi không làm hỏng cả pool: request dùng model đó sẽ báo lỗi
+                logger.error(f"❌ Failed to preload model {name}: {e}")
+    register_classifiers(rule_classifier, ml_classifier, model_registry)
+
+
+def _ready():
+    return os.getpid()
+
+
+def _ml_classifier(model):
+    registry = _classifiers.get('models')
+    if registry is None:
+        return _classifiers['ml']
+    try:
+        return registry.get(model)
+    except UnknownModel:
+        # Model mới được thêm sau khi worker khởi động: quét lại thư mục models một lần
+        registry.discover()
+        return registry.get(model)
+
+
+def run_email(method, email, model=None):
+    """Phân loại một email (đã qua content policy) bằng classifier của process hiện tại"""
+    if method == 'rule':
+        return _classifiers['rule'].classify_email(email)
+    return _ml_classifier(model).predict(
+        title=email['title'],
+        content=email['content'],
+        from_email=email['from_email']
+    )
+
+
+def run_columns(method, titles, contents, from_emails, model=None):
+    """Phân loại batch dạng cột bằng classifier của process hiện tại"""
+    if method == 'rule':
+        return _classifiers['rule'].classify_columns(titles, contents, from_emails)
+    return _ml_classifier(model).predict_many(titles, contents, from_emails)
+
+
+class ClassifierExecutor:
+    """
+    Chạy tác vụ phân loại trên thread hoặc process theo chính sách của từng tác vụ
+
+    EmailClassifier và LightweightEmailClassifier không giữ trạng thái thay đổi
+    giữa các lần gọi nên gọi đồng thời từ nhiều thread là an toàn; process pool
+    chỉ dùng cho tác vụ mà GIL giới hạn throughput và thời gian phân loại đủ lớn
+    so với chi phí gửi dữ liệu sang process.
+
+    Process pool dùng 'spawn' (server đã có thread nền: fork có thể sao chép lock
+    đang bị giữ) và được tạo khi cần; mỗi worker chỉ load các classifier trong
+    worker_config (dict, hoặc hàm trả về dict được gọi mỗi lần tạo pool).
+    restart() thay pool bằng worker mới với worker_config hiện tại (ví dụ sau
+    khi danh sách model thay đổi).
+
+    Khi pool hỏng, tác vụ chạy trên thread và pool chỉ được tạo lại sau thời gian
+    chờ (backoff) thay vì ở mỗi request; sau MAX_POOL_FAILURES lần hỏng liên tiếp
+    (thường là worker không khởi tạo được) process pool bị tắt cho tới restart().
+    """
+
+    def __init__(self, policy=None, process_workers=DEFAULT_PROCESS_WORKERS,
+                 thread_workers=DEFAULT_THREAD_WORKERS, initializer=init_worker, worker_config=None):
+        self.policy = dict(policy or load_policy())
+        self.process_workers = process_workers
+        self.thread_workers = thread_workers
+        self.initializer = initializer
+        self.worker_config = worker_config
+        self._threads = None
+        self._processes = None
+        self._started = False
+        self._restarts = 0
+        self._failures = 0
+        self._retry_at = 0.0
+        self._disabled = False
+        self._lock = threading.Lock()
+        self._stats = {task: {'thread': 0, 'process': 0, 'fallback': 0} for task in TASKS}
+
+    def mode(self, task):
+        return self.policy.get(task, 'thread')
+
+    def uses_processes(self, *tasks):
+        """Có tác vụ nào (mặc định: mọi tác vụ) chạy bằng process pool không"""
+        return any(self.mode(task) == 'process' for task in tasks or TASKS)
+
+    def thread_pool(self):
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix='classifier')
+            return self._threads
+
+    def process_pool(self):
+        with self._lock:
+            if self._processes is None:
+                config = self.worker_config() if callable(self.worker_config) else self.worker_config
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.process_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=self.initializer,
+                    initargs=(config,) if config is not None else ()
+                )
+            return self._processes
+
+    def processes_available(self):
+        """Process pool có được dùng không (không bị tắt, không trong thời gian chờ sau khi hỏng)"""
+        return not self._disabled and time.monotonic() >= self._retry_at
+
+    def executor(self, task):
+        """Executor cho run_in_executor của server async"""
+        if self.mode(task) != 'process':
+            self._count(task, 'thread')
+            return self.thread_pool()
+        if not self.processes_available():
+            self._count(task, 'fallback')
+            return self.thread_pool()
+        self._count(task, 'process')
+        return self.process_pool()
+
+    def start(self):
+        """Khởi động trước các worker process (spawn + load model mất vài giây) nếu chính sách cần"""
+        if not self.uses_processes() or not self.processes_available():
+            return
+        self._started = True
+        pool = self.process_pool()
+        for _ in range(self.process_workers):
+            pool.submit(_ready)
+
+    def restart(self):
+        """
+        Thay process pool bằng các worker mới (load lại theo worker_config hiện tại)
+
+        Tác vụ đang chạy trên pool cũ vẫn chạy xong; tác vụ mới dùng pool mới.
+        Process pool đã bị tắt vì hỏng liên tiếp được bật lại.
+        """
+        with self._lock:
+            pool, self._processes = self._processes, None
+            disabled = self._disabled or self._failures > 0
+            self._failures, self._retry_at, self._disabled = 0, 0.0, False
+            if pool is not None:
+                self._restarts += 1
+        if pool is None:
+            if disabled and self._started:
+                self.start()
+            return disabled
+        pool.shutdown(wait=False)
+        if self._started:
+            self.start()
+        return True
+
+    def call(self, task, func, *args):
+        """
+        Chạy đồng bộ: 'thread' chạy ngay trên thread hiện tại (thread của request),
+        'process' gửi sang process pool và chờ kết quả. Nếu process pool hỏng (worker
+        bị kill), tác vụ chạy trên thread hiện tại và pool được tạo lại sau backoff.
+        """
+        if self.mode(task) != 'process':
+            self._count(task, 'thread')
+            return func(*args)
+        if not self.processes_available():
+            self._count(task, 'fallback')
+            return func(*args)
+        pool = self.process_pool()
+        try:
+            result = pool.submit(func, *args).result()
+        except BrokenProcessPool:
+            self._pool_broken(pool, task)
+            self._count(task, 'fallback')
+            return func(*args)
+        if self._failures:
+            with self._lock:
+                self._failures = 0
+        self._count(task, 'process')
+        return result
+
+    def _pool_broken(self, pool, task):
+        """Bỏ pool hỏng và tính thời gian chờ trước khi tạo lại (một lần cho mỗi pool)"""
+        with self._lock:
+            if self._processes is not pool:
+                # Request khác đã xử lý pool này
+                return
+            self._processes = None
+            self._failures += 1
+            failures = self._failures
+            delay = POOL_RETRY_SECONDS * 2 ** (failures - 1)
+            if failures >= MAX_POOL_FAILURES:
+                self._disabled = True
+            else:
+                self._retry_at = time.monotonic() + delay
+        pool.shutdown(wait=False)
+        if failures >= MAX_POOL_FAILURES:
+            logger.error(f"❌ Process pool broke {failures} times in a row (last while running {task}); "
+                         f"running every task on threads until restart")
+        else:
+            logger.warning(f"⚠️ Process pool broken while running {task}, "
+                           f"falling back to thread for {delay:.0f}s")
+
+    def _count(self, task, mode):
+        with self._lock:
+            self._stats[task][mode] += 1
+
+    def shutdown(self):
+        with self._lock:
+            pools, self._threads, self._processes = (self._threads, self._processes), None, None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'policy': dict(self.policy),
+                'process_workers': self.process_workers,
+                'process_pool_started': self._processes is not None,
+                'process_pool_restarts': self._restarts,
+                'process_pool_failures': self._failures,
+                'process_pool_disabled': self._disabled,
+                'calls': {task: dict(counts) for task, counts in self._stats.items()}
+            }
@@ -0,0 +1,453 @@
+import contextlib
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from local_storage import data_path, ensure_private_file
+from serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# Job store là file SQLite trên máy local: không cần broker, dùng chung giữa các worker process.
+# File chứa email gốc nên nằm trong thư mục dữ liệu riêng của user (0700, file 0600)
+DEFAULT_JOB_STORE_PATH = data_path('jobs.sqlite3')
+DEFAULT_CHUNK_SIZE = 1000           # Số email mỗi lần gọi classify vectorized (và mỗi lần ghi kết quả)
+DEFAULT_WORKERS = 1
+MAX_ATTEMPTS = 3                    # Job làm chết worker quá N lần thì bị đánh dấu failed
+LEASE_TIMEOUT = 300.0               # Job 'running' không có heartbeat quá N giây được worker khác nhận lại
+HEARTBEAT_INTERVAL = 30.0           # Heartbeat được gia hạn mỗi N giây cả khi đang phân loại một chunk
+POLL_INTERVAL = 1.0                 # Worker kiểm tra job mới (kể cả job do process khác tạo) mỗi N giây
+RETENTION_SECONDS = 24 * 3600       # Job đã xong được giữ lại N giây để client lấy kết quả
+PURGE_INTERVAL = 600.0
+BUSY_TIMEOUT_MS = 5000
+
+JOB_STATUSES = ('queued', 'running', 'completed', 'failed', 'cancelled')
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+_JOB_COLUMNS = ('id', 'method', 'model', 'status', 'total', 'processed', 'chunk_size', 'attempts', 'cache_hits',
+                'near_duplicate_hits', 'source', 'error', 'created', 'started', 'finished')
+
+
+def _iso(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(timestamp)) if timestamp else None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class JobStore:
+    """
+    Lưu job phân loại batch lớn trong SQLite
+
+    Email đầu vào được chia thành các chunk; kết quả của mỗi chunk được ghi
+    trong cùng transaction với tiến độ, nên sau khi worker bị crash, job được
+    tiếp tục từ chunk chưa xong thay vì làm lại từ đầu. Việc nhận job dùng
+    BEGIN IMMEDIATE nên nhiều process có thể dùng chung một file an toàn.
+    """
+
+    def __init__(self, path=DEFAULT_JOB_STORE_PATH, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._local = threading.local()
+
+        ensure_private_file(self.path)
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, method TEXT NOT NULL, model TEXT, status TEXT NOT NULL, '
+                'total INTEGER NOT NULL, processed INTEGER NOT NULL DEFAULT 0, chunk_size INTEGER NOT NULL, '
+                'attempts INTEGER NOT NULL DEFAULT 0, cache_hits INTEGER NOT NULL DEFAULT 0, '
+                'near_duplicate_hits INTEGER NOT NULL DEFAULT 0, source TEXT, error TEXT, owner TEXT, '
+                'heartbeat REAL, created REAL NOT NULL, started REAL, finished REAL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS job_chunks ('
+                'job_id TEXT NOT NULL, chunk INTEGER NOT NULL, input BLOB, result BLOB, '
+                'PRIMARY KEY (job_id, chunk)) WITHOUT ROWID'
+            )
+            # Job store tạo trước khi job có model
+            columns = [row[1] for row in connection.execute('PRAGMA table_info(jobs)')]
+            if 'model' not in columns:
+                connection.execute('ALTER TABLE jobs ADD COLUMN model TEXT')
+
+    def _connection(self):
+        """Mỗi thread một connection; mở lại sau fork (giống ResultCache)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000.0, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            # Kết quả job phải còn sau khi process bị kill (khác với cache kết quả)
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def create(self, method, titles, contents, from_emails, source=None, model=None):
+        """
+        Tạo job mới ở trạng thái 'queued' (model: tên ML model, None là model mặc định)
+
+        Returns:
+            dict: Thông tin job (xem get)
+        """
+        job_id = uuid.uuid4().hex
+        total = len(titles)
+        size = self.chunk_size
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'INSERT INTO jobs (id, method, model, status, total, chunk_size, source, created) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (job_id, method, model, 'queued', total, size, source, now)
+            )
+            connection.executemany(
+                'INSERT INTO job_chunks (job_id, chunk, input) VALUES (?, ?, ?)',
+                (
+                    (job_id, chunk, dumps([titles[start:start + size], contents[start:start + size],
+                                           from_emails[start:start + size]]))
+                    for chunk, start in enumerate(range(0, total, size))
+                )
+            )
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """Trạng thái và tiến độ của job, hoặc None nếu không tồn tại"""
+        row = self._connection().execute(
+            f'SELECT {", ".join(_JOB_COLUMNS)} FROM jobs WHERE id = ?', (job_id,)
+        ).fetchone()
+        return self._describe(row) if row is not None else None
+
+    def list(self, limit=50):
+        """Các job gần đây nhất"""
+        rows = self._connection().execute(
+            f'SELECT {", ".join(_JOB_COLUMNS)} FROM jobs ORDER BY created DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [self._describe(row) for row in rows]
+
+    @staticmethod
+    def _describe(row):
+        job = dict(zip(_JOB_COLUMNS, row))
+        job['progress'] = round(job['processed'] / job['total'], 4) if job['total'] else 1.0
+        for key in ('created', 'started', 'finished'):
+            job[key] = _iso(job[key])
+        return job
+
+    def results(self, job_id, offset=0, limit=DEFAULT_CHUNK_SIZE):
+        """
+        Một trang kết quả [offset, offset + limit)
+
+        Chỉ trả về phần liên tục đã có kết quả; trang có thể ngắn hơn limit
+        khi job vẫn đang chạy.
+        """
+        job = self._connection().execute('SELECT total, chunk_size FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if job is None:
+            return None
+        total, size = job
+        end = min(offset + limit, total)
+        results = []
+        if offset < end:
+            rows = self._connection().execute(
+                'SELECT chunk, result FROM job_chunks WHERE job_id = ? AND chunk BETWEEN ? AND ? ORDER BY chunk',
+                (job_id, offset // size, (end - 1) // size)
+            ).fetchall()
+            position = (offset // size) * size
+            for chunk, data in rows:
+                if data is None or chunk * size != position:
+                    break
+                chunk_results = loads(data)
+                results.extend(chunk_results[max(offset - position, 0):end - position])
+                position += len(chunk_results)
+        return results
+
+    def claim(self, owner):
+        """
+        Nhận job cũ nhất đang chờ (hoặc job 'running' đã mất heartbeat)
+
+        Returns:
+            dict: {'id', 'method', 'model'} hoặc None nếu không có job nào
+        """
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute(
+                "SELECT id, method, model, attempts FROM jobs WHERE status = 'queued' "
+                "OR (status = 'running' AND heartbeat < ?) ORDER BY created LIMIT 1",
+                (now - LEASE_TIMEOUT,)
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, method, model, attempts = row
+            if attempts >= MAX_ATTEMPTS:
+                connection.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished = ?, owner = NULL WHERE id = ?",
+                    (f'Job failed after {attempts} attempts (worker crashed or timed out)', now, job_id)
+                )
+                return None
+            connection.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, heartbeat = ?, attempts = attempts + 1, "
+                "started = COALESCE(started, ?) WHERE id = ?",
+                (owner, now, now, job_id)
+            )
+        return {'id': job_id, 'method': method, 'model': model}
+
+    def next_chunk(self, job_id, owner):
+        """
+        Chunk tiếp theo chưa có kết quả của job mà owner đang giữ
+
+        Returns:
+            tuple: (chunk, titles, contents, from_emails), None nếu đã xong,
+                   hoặc False nếu job không còn thuộc owner (bị hủy/xóa/nhận lại)
+        """
+        connection = self._connection()
+        row = connection.execute('SELECT status, owner FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None or row[0] != 'running' or row[1] != owner:
+            return False
+        row = connection.execute(
+            'SELECT chunk, input FROM job_chunks WHERE job_id = ? AND result IS NULL ORDER BY chunk LIMIT 1',
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        titles, contents, from_emails = loads(row[1])
+        return row[0], titles, contents, from_emails
+
+    def save_chunk(self, job_id, owner, chunk, results, reuse):
+        """Ghi kết quả của một chunk cùng tiến độ và heartbeat trong một transaction"""
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            updated = connection.execute(
+                "UPDATE jobs SET processed = processed + ?, cache_hits = cache_hits + ?, "
+                "near_duplicate_hits = near_duplicate_hits + ?, heartbeat = ? "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (len(results), reuse['cache_hits'], reuse['near_duplicate_hits'], time.time(), job_id, owner)
+            ).rowcount
+            if updated:
+                # Input không còn cần sau khi đã có kết quả
+                connection.execute(
+                    'UPDATE job_chunks SET result = ?, input = NULL WHERE job_id = ? AND chunk = ?',
+                    (dumps(results), job_id, chunk)
+                )
+        return bool(updated)
+
+    def heartbeat(self, job_id, owner):
+        """Gia hạn lease của job mà owner đang giữ; False nếu job không còn thuộc owner"""
+        connection = self._connection()
+        with connection:
+            updated = connection.execute(
+                "UPDATE jobs SET heartbeat = ? WHERE id = ? AND owner = ? AND status = 'running'",
+                (time.time(), job_id, owner)
+            ).rowcount
+        return bool(updated)
+
+    def finish(self, job_id, owner, status, error=None):
+        """Kết thúc job (completed / failed) nếu owner vẫn đang giữ job"""
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished = ?, owner = NULL "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (status, error, time.time(), job_id, owner)
+            )
+
+    def cancel(self, job_id):
+        """Hủy job chưa xong; trả về trạng thái mới hoặc None nếu job không tồn tại"""
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute('SELECT status FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row[0] in FINISHED_STATUSES:
+                return row[0]
+            connection.execute(
+                "UPDATE jobs SET status = 'cancelled', finished = ?, owner = NULL WHERE id = ?",
+                (time.time(), job_id)
+            )
+            # Input của các chunk chưa chạy không còn cần
+            connection.execute('DELETE FROM job_chunks WHERE job_id = ? AND result IS NULL', (job_id,))
+        return 'cancelled'
+
+    def delete(self, job_id):
+        """Xóa job và toàn bộ kết quả"""
+        connection = self._connection()
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute('DELETE FROM job_chunks WHERE job_id = ?', (job_id,))
+            deleted = connection.execute('DELETE FROM jobs WHERE id = ?', (job_id,)).rowcount
+        return bool(deleted)
+
+    def recover(self, host):
+        """
+        Đưa các job 'running' của process đã chết trên máy này về 'queued'
+        ngay lập tức (không cần chờ hết LEASE_TIMEOUT)
+
+        Returns:
+            int: Số job được tiếp tục
+        """
+        connection = self._connection()
+        recovered = 0
+        rows = connection.execute("SELECT id, owner FROM jobs WHERE status = 'running'").fetchall()
+        for job_id, owner in rows:
+            owner_host, _, rest = (owner or '').partition(':')
+            pid = rest.partition(':')[0]
+            if owner_host != host or not pid.isdigit() or _pid_alive(int(pid)):
+                continue
+            with connection:
+                recovered += connection.execute(
+                    "UPDATE jobs SET status = 'queued', owner = NULL WHERE id = ? AND owner = ?", (job_id, owner)
+                ).rowcount
+        return recovered
+
+    def purge(self, older_than=RETENTION_SECONDS):
+        """Xóa các job đã kết thúc quá older_than giây"""
+        connection = self._connection()
+        cutoff = time.time() - older_than
+        with connection:
+            connection.execute('BEGIN IMMEDIATE')
+            connection.execute(
+                'DELETE FROM job_chunks WHERE job_id IN '
+                "(SELECT id FROM jobs WHERE status IN ('completed', 'failed', 'cancelled') AND finished < ?)",
+                (cutoff,)
+            )
+            purged = connection.execute(
+                "DELETE FROM jobs WHERE status IN ('completed', 'failed', 'cancelled') AND finished < ?", (cutoff,)
+            ).rowcount
+        return purged
+
+    def stats(self):
+        """Số job theo trạng thái"""
+        counts = dict(self._connection().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        return {status: counts.get(status, 0) for status in JOB_STATUSES}
+
+
+class JobRunner:
+    """
+    Pool worker thread xử lý job trong nền
+
+    classify(method, titles, contents, from_emails, model) phân loại một chunk và trả
+    về (results, reuse) như api_backend.classify_columns, hoặc (None, None)
+    nếu method không khả dụng.
+    """
+
+    def __init__(self, store, classify, workers=DEFAULT_WORKERS):
+        self.store = store
+        self.classify = classify
+        self.workers = workers
+        self.host = socket.gethostname()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._last_purge = 0.0
+
+    def start(self):
+        """Tiếp tục job của process đã chết rồi khởi động các worker thread"""
+        recovered = self.store.recover(self.host)
+        if recovered:
+            logger.info(f"♻️ Resuming {recovered} interrupted job(s)")
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._loop, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Đánh thức worker ngay khi có job mới"""
+        self._wakeup.set()
+
+    def _owner(self):
+        return f'{self.host}:{os.getpid()}:{threading.get_ident()}'
+
+    def _loop(self):
+        while not self._stopping.is_set():
+            try:
+                self._maybe_purge()
+                job = self.store.claim(self._owner())
+            except sqlite3.Error as e:
+                logger.warning(f"Job store error: {e}")
+                job = None
+            if job is None:
+                self._wakeup.wait(POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+            self.run(job['id'], job['method'], job['model'])
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge >= PURGE_INTERVAL:
+            self._last_purge = now
+            purged = self.store.purge()
+            if purged:
+                logger.info(f"🧹 Purged {purged} finished job(s)")
+
+    @contextlib.contextmanager
+    def _heartbeat(self, job_id, owner):
+        """Gia hạn lease trong lúc phân loại một chunk (chunk lớn có thể chạy lâu hơn LEASE_TIMEOUT)"""
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(HEARTBEAT_INTERVAL):
+                try:
+                    self.store.heartbeat(job_id, owner)
+                except sqlite3.Error as e:
+                    logger.warning(f"Job {job_id} heartbeat failed: {e}")
+
+        thread = threading.Thread(target=beat, name=f'job-heartbeat-{job_id}', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def run(self, job_id, method, model=None):
+        """Xử lý lần lượt các chunk chưa xong của một job đã nhận"""
+        owner = self._owner()
+        start_time = time.perf_counter()
+        try:
+            while not self._stopping.is_set():
+                chunk = self.store.next_chunk(job_id, owner)
+                if chunk is False:
+                    logger.info(f"Job {job_id} was cancelled or taken over")
+                    return
+                if chunk is None:
+                    self.store.finish(job_id, owner, 'completed')
+                    logger.info(f"✅ Job {job_id} completed in {time.perf_counter() - start_time:.1f}s")
+                    return
+                index, titles, contents, from_emails = chunk
+                with self._heartbeat(job_id, owner):
+                    results, reuse = self.classify(method, titles, contents, from_emails, model)
+                if results is None:
+                    self.store.finish(job_id, owner, 'failed', f'Method {method} not available')
+                    return
+                if not self.store.save_chunk(job_id, owner, index, results, reuse):
+                    return
+        except Exception as e:
+            logger.error(f"❌ Job {job_id} failed: {e}")
+            try:
+                self.store.finish(job_id, owner, 'failed', str(e))
+            except sqlite3.Error:
+                pass
@@ -0,0 +1,75 @@
+import logging
+import os
+import stat
+
+logger = logging.getLogger(__name__)
+
+# Thư mục dữ liệu riêng của user chạy service (cache kết quả, job store, artifact ruleset).
+# Không dùng thư mục tạm dùng chung: user khác có thể tạo trước file với tên đoán được
+APP_NAME = 'email_classification'
+DIR_MODE = 0o700
+FILE_MODE = 0o600
+
+
+class InsecureStorage(Exception):
+    """Thư mục / file dữ liệu không thuộc user hiện tại hoặc user khác truy cập được"""
+
+
+def default_data_dir():
+    """$EMAIL_DATA_DIR, mặc định $XDG_CACHE_HOME/email_classification (~/.cache/email_classification)"""
+    path = os.environ.get('EMAIL_DATA_DIR')
+    if path:
+        return path
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, APP_NAME)
+
+
+def data_path(name):
+    """Đường dẫn mặc định của một file / thư mục trong thư mục dữ liệu"""
+    return os.path.join(default_data_dir(), name)
+
+
+def _check_owner(path, info):
+    if hasattr(os, 'getuid') and info.st_uid not in (os.getuid(), 0):
+        raise InsecureStorage(f'{path} is owned by uid {info.st_uid}, not the current user')
+
+
+def ensure_private_dir(path):
+    """
+    Tạo thư mục với mode 0700 nếu chưa có
+
+    Thư mục đã có phải thuộc user hiện tại (hoặc root) và không cho user khác
+    ghi vào, để không ai thay được file dữ liệu bằng file của họ.
+
+    Raises:
+        InsecureStorage: thư mục thuộc user khác, user khác ghi được, hoặc không phải thư mục
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path, mode=DIR_MODE, exist_ok=True)
+        os.chmod(path, DIR_MODE)
+    info = os.lstat(path)
+    if stat.S_ISLNK(info.st_mode) or not stat.S_ISDIR(info.st_mode):
+        raise InsecureStorage(f'{path} is not a directory')
+    _check_owner(path, info)
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        raise InsecureStorage(f'{path} is writable by other users')
+    return path
+
+
+def ensure_private_file(path):
+    """
+    Tạo file rỗng (mode 0600) nếu chưa có, trong thư mục cha riêng tư
+
+    Raises:
+        InsecureStorage: file thuộc user khác, là symlink, hoặc thư mục cha không an toàn
+    """
+    ensure_private_dir(os.path.dirname(os.path.abspath(path)))
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_NOFOLLOW', 0), FILE_MODE)
+    try:
+        info = os.fstat(fd)
+        _check_owner(path, info)
+        if stat.S_IMODE(info.st_mode) & 0o077:
+            os.fchmod(fd, FILE_MODE)
+    finally:
+        os.close(fd)
+    return path
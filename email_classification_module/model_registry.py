@@ -0,0 +1,357 @@
+import collections
+import importlib.util
+import json
+import logging
+import os
+import pickle
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Thư mục chứa code của ML classifier và model mặc định
+MODELS_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'models'))
+CLASSIFIER_MODULE = 'lightweight_email_classifier'
+MODEL_FILE = 'lightweight_email_classifier.pkl'
+MODEL_CONFIG_FILE = 'model.json'    # Tùy chọn theo từng model: {"precision": "int8", "url_features": true}
+ID_TO_CATEGORY_FILE = 'id_to_category.pkl'
+
+DEFAULT_MODEL = 'default'           # Tên của model nằm ngay trong thư mục gốc
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+MAX_DEPTH = 3                       # Ví dụ: <khách hàng>/<ngôn ngữ>
+LATENCY_WINDOW = 1000               # Số mẫu độ trễ gần nhất của mỗi model dùng để tính percentile
+
+
+class UnknownModel(Exception):
+    """Model không có trong thư mục models"""
+
+
+def load_classifier_module():
+    """Module models/lightweight_email_classifier.py (không sửa sys.path)"""
+    module = sys.modules.get(CLASSIFIER_MODULE)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(
+            CLASSIFIER_MODULE, os.path.join(MODELS_DIR, f'{CLASSIFIER_MODULE}.py'))
+        module = importlib.util.module_from_spec(spec)
+        # Đăng ký trước khi chạy module để pickle tìm được các class của nó
+        sys.modules[CLASSIFIER_MODULE] = module
+        try:
+            spec.loader.exec_module(module)
+        except BaseException:
+            del sys.modules[CLASSIFIER_MODULE]
+            raise
+    return module
+
+
+def load_classifier_class():
+    """LightweightEmailClassifier từ models/lightweight_email_classifier.py"""
+    return load_classifier_module().LightweightEmailClassifier
+
+
+def _file_key(path):
+    info = os.stat(path)
+    return path, info.st_mtime_ns, info.st_size
+
+
+def discover_models(models_dir, max_depth=MAX_DEPTH):
+    """
+    Tìm các thư mục chứa model (có lightweight_email_classifier.pkl)
+
+    Returns:
+        dict: tên model -> đường dẫn; model trong thư mục gốc có tên DEFAULT_MODEL,
+              model trong thư mục con có tên theo đường dẫn tương đối ('acme/vi')
+    """
+    models = {}
+    root = os.path.abspath(models_dir)
+    for path, dirs, files in os.walk(root):
+        relative = os.path.relpath(path, root)
+        depth = 0 if relative == '.' else relative.count(os.sep) + 1
+        dirs[:] = sorted(d for d in dirs if not d.startswith(('.', '__'))) if depth < max_depth else []
+        if MODEL_FILE in files:
+            models[DEFAULT_MODEL if depth == 0 else relative.replace(os.sep, '/')] = path
+    return models
+
+
+def _latency_summary(values):
+    if not values:
+        return {'mean': None, 'p50': None, 'p95': None, 'samples': 0}
+    ordered = sorted(values)
+
+    def percentile(q):
+        return round(ordered[min(len(ordered) - 1, int(round(q / 100.0 * (len(ordered) - 1))))], 3)
+
+    return {
+        'mean': round(sum(ordered) / len(ordered), 3),
+        'p50': percentile(50),
+        'p95': percentile(95),
+        'samples': len(ordered)
+    }
+
+
+class _ModelStats:
+    __slots__ = ('loads', 'load_ms', 'load_ms_total', 'load_errors', 'evictions', 'requests', 'emails',
+                 'latency', 'last_used')
+
+    def __init__(self):
+        self.loads = 0
+        self.load_ms = None
+        self.load_ms_total = 0.0
+        self.load_errors = 0
+        self.evictions = 0
+        self.requests = 0
+        self.emails = 0
+        self.latency = collections.deque(maxlen=LATENCY_WINDOW)
+        self.last_used = None
+
+    def to_dict(self):
+        return {
+            'loads': self.loads,
+            'load_ms': self.load_ms,
+            'load_ms_total': round(self.load_ms_total, 2),
+            'load_errors': self.load_errors,
+            'evictions': self.evictions,
+            'requests': self.requests,
+            'emails': self.emails,
+            'latency_ms': _latency_summary(list(self.latency)),
+            'last_used': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.last_used))
+            if self.last_used else None
+        }
+
+
+class _LoadedModel:
+    __slots__ = ('classifier', 'nbytes')
+
+    def __init__(self, classifier, nbytes):
+        self.classifier = classifier
+        self.nbytes = nbytes
+
+
+class ModelRegistry:
+    """
+    Các ML model (theo khách hàng, ngôn ngữ...) trong một thư mục, load khi dùng lần đầu
+
+    Model đã load được giữ trong LRU giới hạn theo tổng bộ nhớ ước lượng
+    (classifier.memory_bytes()); model mặc định không bao giờ bị loại. Model bị
+    loại vẫn dùng được bởi request đang giữ nó và được load lại ở lần dùng sau.
+
+    Mỗi model được load một lần dù nhiều thread cùng yêu cầu (lock theo từng
+    model); các model khác vẫn phục vụ bình thường trong lúc load.
+
+    version() và id_to_category() đọc thẳng từ file model (cache theo mtime /
+    kích thước), không cần load model: process chỉ điều phối (model chạy trong
+    worker process) không phải giữ model trong bộ nhớ. max_bytes là giới hạn
+    của registry này, tức của một process.
+    """
+
+    def __init__(self, models_dir=MODELS_DIR, max_bytes=DEFAULT_MAX_BYTES, default_model=DEFAULT_MODEL,
+                 precision='float64', feature_tokens=None, url_features=False):
+        self.models_dir = models_dir
+        self.max_bytes = max_bytes
+        self.default_model = default_model
+        self.precision = precision
+        self.feature_tokens = feature_tokens
+        self.url_features = url_features
+        self._lock = threading.Lock()
+        self._load_locks = {}
+        self._paths = {}
+        self._loaded = collections.OrderedDict()
+        self._stats = {}
+        self._versions = {}
+        self._categories = {}
+        self.discover()
+
+    def discover(self):
+        """Quét lại thư mục models; model không còn tồn tại bị unload"""
+        paths = discover_models(self.models_dir)
+        with self._lock:
+            self._paths = paths
+            for name in [name for name in self._loaded if name not in paths]:
+                del self._loaded[name]
+            for cache in (self._versions, self._categories):
+                for name in [name for name in cache if name not in paths]:
+                    del cache[name]
+            for name in paths:
+                self._stats.setdefault(name, _ModelStats())
+        logger.info(f"📦 Found {len(paths)} model(s) in {self.models_dir}")
+        return sorted(paths)
+
+    def names(self):
+        with self._lock:
+            return sorted(self._paths)
+
+    def __contains__(self, name):
+        return name in self._paths
+
+    def resolve(self, name=None):
+        """Tên model thực sự dùng (None -> model mặc định)"""
+        name = name or self.default_model
+        if name not in self._paths:
+            raise UnknownModel(f'Unknown model: {name}')
+        return name
+
+    def get(self, name=None):
+        """
+        Classifier của model (load nếu chưa có)
+
+        Raises:
+            UnknownModel: model không có trong thư mục models
+        """
+        name = self.resolve(name)
+        with self._lock:
+            entry = self._loaded.get(name)
+            if entry is not None:
+                self._loaded.move_to_end(name)
+                return entry.classifier
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        with load_lock:
+            # Thread khác có thể đã load xong trong lúc chờ
+            with self._lock:
+                entry = self._loaded.get(name)
+                if entry is not None:
+                    self._loaded.move_to_end(name)
+                    return entry.classifier
+                path = self._paths.get(name)
+            if path is None:
+                raise UnknownModel(f'Unknown model: {name}')
+
+            start_time = time.perf_counter()
+            try:
+                classifier = self._load(path)
+                nbytes = classifier.memory_bytes()
+            except Exception:
+                with self._lock:
+                    self._stats[name].load_errors += 1
+                raise
+            elapsed = (time.perf_counter() - start_time) * 1000
+
+            with self._lock:
+                stats = self._stats[name]
+                stats.loads += 1
+                stats.load_ms = round(elapsed, 2)
+                stats.load_ms_total += elapsed
+                self._loaded[name] = _LoadedModel(classifier, nbytes)
+                evicted = self._evict(keep=name)
+        logger.info(f"📦 Model {name} loaded in {elapsed:.0f}ms (~{nbytes / 1024 / 1024:.1f}MB)"
+                    + (f", evicted {', '.join(evicted)}" if evicted else ''))
+        return classifier
+
+    def _options(self, path):
+        """(precision, feature_tokens) của model: model.json trong thư mục model, mặc định theo registry"""
+        options = {}
+        config_path = os.path.join(path, MODEL_CONFIG_FILE)
+        if os.path.exists(config_path):
+            with open(config_path, encoding='utf-8') as f:
+                options = json.load(f)
+        url_features = options.get('url_features', self.url_features)
+        return options.get('precision', self.precision), self.feature_tokens if url_features else None
+
+    def _load(self, path):
+        precision, feature_tokens = self._options(path)
+        classifier = load_classifier_class()(model_path=path, precision=precision, feature_tokens=feature_tokens)
+        classifier.warm_up()
+        return classifier
+
+    def _loaded_classifier(self, name):
+        with self._lock:
+            entry = self._loaded.get(name)
+            return (entry.classifier if entry is not None else None), self._paths.get(name)
+
+    def version(self, name=None):
+        """
+        Version của model (bằng classifier.version) mà không load model
+
+        Raises:
+            UnknownModel: model không có trong thư mục models
+        """
+        name = self.resolve(name)
+        classifier, path = self._loaded_classifier(name)
+        if classifier is not None:
+            return classifier.version
+        if path is None:
+            raise UnknownModel(f'Unknown model: {name}')
+        module = load_classifier_module()
+        precision, feature_tokens = self._options(path)
+        key = _file_key(module.model_file(path, precision)) + (precision, feature_tokens is not None)
+        cached = self._versions.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with open(key[0], 'rb') as f:
+            version = module.model_version(f.read(), precision, feature_tokens is not None)
+        with self._lock:
+            self._versions[name] = (key, version)
+        return version
+
+    def id_to_category(self, name=None):
+        """Mapping category id -> tên category của model mà không load model"""
+        name = self.resolve(name)
+        classifier, path = self._loaded_classifier(name)
+        if classifier is not None:
+            return classifier.id_to_category
+        if path is None:
+            raise UnknownModel(f'Unknown model: {name}')
+        key = _file_key(os.path.join(path, ID_TO_CATEGORY_FILE))
+        cached = self._categories.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        with open(key[0], 'rb') as f:
+            mapping = pickle.load(f)
+        with self._lock:
+            self._categories[name] = (key, mapping)
+        return mapping
+
+    def _evict(self, keep):
+        """Loại model ít dùng gần đây nhất tới khi tổng bộ nhớ <= max_bytes (gọi khi giữ lock)"""
+        evicted = []
+        total = sum(entry.nbytes for entry in self._loaded.values())
+        for name in list(self._loaded):
+            if total <= self.max_bytes:
+                break
+            if name in (keep, self.default_model):
+                continue
+            total -= self._loaded.pop(name).nbytes
+            self._stats[name].evictions += 1
+            evicted.append(name)
+        if total > self.max_bytes:
+            logger.warning(f"⚠️ Loaded models use {total} bytes, above the {self.max_bytes} byte limit")
+        return evicted
+
+    def unload(self, name):
+        """Bỏ model khỏi bộ nhớ (load lại ở lần dùng sau)"""
+        with self._lock:
+            return self._loaded.pop(name, None) is not None
+
+    def record(self, name, elapsed_ms, count=1):
+        """Ghi nhận một lần phân loại (count email) bằng model"""
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                return
+            stats.requests += 1
+            stats.emails += count
+            stats.latency.append(elapsed_ms)
+            stats.last_used = time.time()
+
+    def stats(self):
+        with self._lock:
+            models = {}
+            for name, path in sorted(self._paths.items()):
+                entry = self._loaded.get(name)
+                cached = self._versions.get(name)
+                models[name] = dict(
+                    self._stats[name].to_dict(),
+                    path=path,
+                    loaded=entry is not None,
+                    bytes=entry.nbytes if entry is not None else None,
+                    version=entry.classifier.version if entry is not None else (cached[1] if cached else None),
+                    precision=entry.classifier.precision if entry is not None else None
+                )
+            return {
+                'models_dir': self.models_dir,
+                'default_model': self.default_model,
+                'max_bytes': self.max_bytes,
+                'loaded_bytes': sum(entry.nbytes for entry in self._loaded.values()),
+                'loaded': list(self._loaded),
+                'models': models
+            }
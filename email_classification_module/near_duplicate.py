@@ -0,0 +1,225 @@
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from email_features import TRAILING_PUNCTUATION, URL_PATTERN, url_host
+
+# Cấu hình mặc định
+NUM_PERMUTATIONS = 64           # Số hàm hash MinHash
+DEFAULT_BANDS = 16              # LSH: 16 band x 4 hàng
+DEFAULT_THRESHOLD = 0.8         # Độ tương đồng Jaccard ước lượng tối thiểu để dùng lại verdict
+DEFAULT_CAPACITY = 50000        # Số fingerprint tối đa giữ trong bộ nhớ
+DEFAULT_MIN_TOKENS = 8          # Email quá ngắn cho fingerprint không đáng tin cậy
+MAX_BUCKET_SIZE = 32            # Số entry tối đa trong một bucket LSH
+COST_SMOOTHING = 0.1            # Hệ số EWMA cho thời gian phân loại
+
+# Chuẩn hóa: các phần thay đổi giữa các biến thể của cùng một chiến dịch
+URL_RE = re.compile(r'(?:https?://|www\.)\S+|\b[\w-]+(?:\.[\w-]+)*\.[a-z]{2,}/\S*', re.IGNORECASE)
+EMAIL_RE = re.compile(r'\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b')
+NUMBER_RE = re.compile(r'\d+')
+WORD_RE = re.compile(r'\w+')
+
+# Hàm hash multiply-shift: h_i(x) = (a_i * x + b_i) >> 32 (tràn số uint64 là có chủ ý)
+_rng = np.random.RandomState(20240719)
+_HASH_A = (_rng.randint(0, 2 ** 62, size=NUM_PERMUTATIONS, dtype=np.int64).astype(np.uint64) << np.uint64(1)) | np.uint64(1)
+_HASH_B = _rng.randint(0, 2 ** 62, size=NUM_PERMUTATIONS, dtype=np.int64).astype(np.uint64)
+_SHIFT = np.uint64(32)
+
+
+# Chữ ký của một email: identity phải khớp chính xác, minhash chỉ cần gần giống
+Fingerprint = namedtuple('Fingerprint', ['identity', 'signature'])
+
+
+def sender_domain(from_email):
+    """Domain người gửi chữ thường (bỏ tên hiển thị); không có '@' thì là cả địa chỉ"""
+    return from_email.rsplit('@', 1)[-1].strip(' <>').lower() if from_email else ''
+
+
+def link_hosts(*texts):
+    """Tập host (chữ thường, bỏ "www.") của mọi URL trong các text, không giới hạn số URL"""
+    hosts = set()
+    for text in texts:
+        if text:
+            for match in URL_PATTERN.finditer(text):
+                host = url_host(match.group(0).rstrip(TRAILING_PUNCTUATION))
+                if host:
+                    hosts.add(host)
+    return frozenset(hosts)
+
+
+def normalize_text(text):
+    """Thay URL, email, số bằng token cố định để các biến thể có cùng nội dung"""
+    text = URL_RE.sub(' _url_ ', text.lower())
+    text = EMAIL_RE.sub(' _email_ ', text)
+    text = NUMBER_RE.sub('0', text)
+    return WORD_RE.findall(text)
+
+
+def minhash(tokens):
+    """
+    Chữ ký MinHash (NUM_PERMUTATIONS giá trị uint32) trên tập shingle 1 + 2 từ
+
+    Hash của từng shingle dùng hash() built-in (nhanh, nhưng chỉ ổn định trong
+    một process) nên index chỉ sống trong bộ nhớ của process hiện tại.
+    """
+    shingles = set(tokens)
+    shingles.update(zip(tokens, tokens[1:]))
+    hashes = np.fromiter((hash(s) for s in shingles), dtype=np.int64, count=len(shingles)).view(np.uint64)
+    with np.errstate(over='ignore'):
+        permuted = (hashes[:, None] * _HASH_A + _HASH_B) >> _SHIFT
+    return permuted.min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    Index phát hiện email gần trùng (biến thể của cùng một chiến dịch spam/phishing)
+
+    Mỗi email được chuyển thành chữ ký MinHash từ title và content đã chuẩn hóa
+    (URL, email, số được thay bằng token cố định) cùng identity gồm domain người
+    gửi và tập host của các link. Chữ ký được chia thành các band (LSH): chỉ những
+    email có cùng identity và trùng ít nhất một band mới được so sánh, và verdict
+    chỉ được dùng lại khi độ tương đồng Jaccard ước lượng >= threshold. Nhờ đó bản
+    sao của một email hợp lệ nhưng đổi link hoặc người gửi (phishing) không bao giờ
+    nhận lại verdict của email gốc. Bộ nhớ bị giới hạn bởi capacity (LRU).
+    """
+
+    def __init__(self, threshold=DEFAULT_THRESHOLD, capacity=DEFAULT_CAPACITY,
+                 min_tokens=DEFAULT_MIN_TOKENS, bands=DEFAULT_BANDS):
+        if NUM_PERMUTATIONS % bands:
+            raise ValueError(f'bands must divide {NUM_PERMUTATIONS}')
+        self.threshold = threshold
+        self.capacity = capacity
+        self.min_tokens = min_tokens
+        self.bands = bands
+        self.rows = NUM_PERMUTATIONS // bands
+        self._entries = OrderedDict()   # entry_id -> (namespace, fingerprint, verdict)
+        self._buckets = {}              # (namespace, identity, band, band bytes) -> [entry_id]
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'lookups': 0,
+            'hits': 0,
+            'skipped_short': 0,
+            'fingerprint_time_ms': 0.0,
+            'saved_time_ms': 0.0
+        }
+        self._classify_cost = {}        # namespace -> EWMA thời gian phân loại (ms)
+
+    def fingerprint(self, title, content, from_email):
+        """Fingerprint (identity, chữ ký MinHash) của email, hoặc None nếu email quá ngắn"""
+        start_time = time.perf_counter()
+        tokens = normalize_text(title) + normalize_text(content)
+        if len(tokens) < self.min_tokens:
+            fingerprint = None
+        else:
+            identity = (sender_domain(from_email), link_hosts(title, content))
+            fingerprint = Fingerprint(identity, minhash(tokens))
+        elapsed = (time.perf_counter() - start_time) * 1000
+        with self._lock:
+            self._stats['fingerprint_time_ms'] += elapsed
+            if fingerprint is None:
+                self._stats['skipped_short'] += 1
+        return fingerprint
+
+    def _band_keys(self, namespace, fingerprint):
+        rows = self.rows
+        identity, signature = fingerprint
+        return [
+            (namespace, identity, band, signature[band * rows:(band + 1) * rows].tobytes())
+            for band in range(self.bands)
+        ]
+
+    def lookup(self, namespace, fingerprint):
+        """
+        Tìm verdict của một email gần trùng (cùng domain người gửi và host của link)
+        đã phân loại trước đó
+
+        Returns:
+            tuple: (verdict, similarity) hoặc (None, 0.0)
+        """
+        if fingerprint is None:
+            return None, 0.0
+        identity, signature = fingerprint
+        with self._lock:
+            self._stats['lookups'] += 1
+            candidates = set()
+            for key in self._band_keys(namespace, fingerprint):
+                candidates.update(self._buckets.get(key, ()))
+
+            best_id, best_similarity = None, 0.0
+            for entry_id in candidates:
+                candidate = self._entries[entry_id][1]
+                if candidate.identity != identity:
+                    continue
+                similarity = float(np.count_nonzero(candidate.signature == signature)) / NUM_PERMUTATIONS
+                if similarity > best_similarity:
+                    best_id, best_similarity = entry_id, similarity
+            if best_id is None or best_similarity < self.threshold:
+                return None, 0.0
+
+            self._entries.move_to_end(best_id)
+            self._stats['hits'] += 1
+            self._stats['saved_time_ms'] += self._classify_cost.get(namespace, 0.0)
+            verdict = self._entries[best_id][2]
+        return verdict, round(best_similarity, 4)
+
+    def add(self, namespace, fingerprint, verdict):
+        """Thêm verdict của một email vừa được phân loại"""
+        if fingerprint is None:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (namespace, fingerprint, verdict)
+            for key in self._band_keys(namespace, fingerprint):
+                bucket = self._buckets.setdefault(key, [])
+                bucket.append(entry_id)
+                if len(bucket) > MAX_BUCKET_SIZE:
+                    bucket.pop(0)
+            while len(self._entries) > self.capacity:
+                self._evict_oldest()
+
+    def record_cost(self, namespace, elapsed_ms, count=1):
+        """Ghi nhận thời gian phân loại thực tế để ước lượng phần việc tiết kiệm được"""
+        if count <= 0:
+            return
+        per_email = elapsed_ms / count
+        with self._lock:
+            previous = self._classify_cost.get(namespace)
+            if previous is None:
+                self._classify_cost[namespace] = per_email
+            else:
+                self._classify_cost[namespace] = previous + COST_SMOOTHING * (per_email - previous)
+
+    def _evict_oldest(self):
+        entry_id, (namespace, fingerprint, _) = self._entries.popitem(last=False)
+        for key in self._band_keys(namespace, fingerprint):
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                continue
+            try:
+                bucket.remove(entry_id)
+            except ValueError:
+                pass
+            if not bucket:
+                del self._buckets[key]
+
+    def stats(self):
+        """Thống kê tỉ lệ reuse và thời gian phân loại tiết kiệm được"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['entries'] = len(self._entries)
+            stats['buckets'] = len(self._buckets)
+            stats['avg_classify_ms'] = {
+                namespace: round(cost, 4) for namespace, cost in self._classify_cost.items()
+            }
+        stats['hit_ratio'] = round(stats['hits'] / stats['lookups'], 4) if stats['lookups'] else 0.0
+        stats['net_saved_time_ms'] = round(stats['saved_time_ms'] - stats['fingerprint_time_ms'], 2)
+        stats['saved_time_ms'] = round(stats['saved_time_ms'], 2)
+        stats['fingerprint_time_ms'] = round(stats['fingerprint_time_ms'], 2)
+        stats['capacity'] = self.capacity
+        stats['threshold'] = self.threshold
+        return stats
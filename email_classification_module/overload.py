@@ -0,0 +1,217 @@
+import math
+import threading
+import time
+
+# Giới hạn mặc định (theo từng worker process)
+SOFT_IN_FLIGHT = 8              # Từ N request đang xử lý: chuyển sang chế độ degraded
+HARD_IN_FLIGHT = 32             # Từ N request đang xử lý: trả 503 + Retry-After
+LATENCY_TARGET_MS = 500.0       # EWMA độ trễ request đơn lẻ vượt ngưỡng này: degraded
+MIN_LATENCY_SAMPLES = 20        # Chỉ tin EWMA độ trễ khi đã có ít nhất N mẫu
+LATENCY_HALF_LIFE = 10.0        # EWMA độ trễ giảm một nửa sau mỗi N giây không có mẫu mới
+MAX_DEGRADED_BATCH = 1000       # Batch lớn hơn bị từ chối khi degraded (dùng /jobs cho batch lớn)
+RECOVERY_RATIO = 0.8            # Chỉ thoát degraded khi tải giảm dưới 80% ngưỡng (tránh dao động)
+EWMA_ALPHA = 0.2
+MAX_RETRY_AFTER = 30
+
+# Chi phí ban đầu (ms/email) trước khi có số đo thực tế, lấy theo benchmark trong README
+DEFAULT_COSTS = {'rule': 0.27, 'ml': 20.0}
+
+STATES = ('normal', 'degraded', 'overloaded')
+
+
+class Overloaded(Exception):
+    """Request bị từ chối vì server quá tải (trả 503 với Retry-After)"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Admission:
+    """Một request đã được nhận: có bị degraded không và thời điểm bắt đầu"""
+
+    __slots__ = ('degraded', 'start')
+
+    def __init__(self, degraded):
+        self.degraded = degraded
+        self.start = time.perf_counter()
+
+
+class OverloadController:
+    """
+    Kiểm soát quá tải dựa trên số request đang xử lý và độ trễ gần đây
+
+    - normal: phục vụ bình thường
+    - degraded: số request đang xử lý >= soft_limit, hoặc EWMA độ trễ > latency_target_ms
+      trong khi có ít nhất latency_min_in_flight request đang xử lý cùng lúc;
+      request được chuyển sang classifier rẻ hơn (theo chi phí đo được/email)
+      và batch lớn bị từ chối
+    - overloaded: số request đang xử lý >= hard_limit; request mới nhận 503
+
+    Độ trễ chỉ được đo trên request một email (batch dài là bình thường) và chỉ
+    được dùng khi đã có đủ min_latency_samples mẫu. Một request chậm khi server
+    gần như rảnh (khởi động worker, load model) không phải quá tải nên không
+    làm server degraded. EWMA giảm dần theo thời gian (half-life) khi không có
+    mẫu mới nên không giữ server ở degraded mãi sau một đợt chậm.
+    Chi phí/email của từng classifier chỉ được đo khi classifier thực sự chạy
+    (record_cost), không tính kết quả lấy từ cache hay index gần trùng.
+    """
+
+    def __init__(self, soft_limit=SOFT_IN_FLIGHT, hard_limit=HARD_IN_FLIGHT, latency_target_ms=LATENCY_TARGET_MS,
+                 max_degraded_batch=MAX_DEGRADED_BATCH, alpha=EWMA_ALPHA, min_latency_samples=MIN_LATENCY_SAMPLES,
+                 latency_min_in_flight=None, latency_half_life=LATENCY_HALF_LIFE):
+        if not 0 < soft_limit <= hard_limit:
+            raise ValueError('soft_limit must be positive and <= hard_limit')
+        self.soft_limit = soft_limit
+        self.hard_limit = hard_limit
+        self.latency_target_ms = latency_target_ms
+        self.max_degraded_batch = max_degraded_batch
+        self.alpha = alpha
+        self.min_latency_samples = min_latency_samples
+        # Mặc định: một nửa soft_limit (ít nhất 2 request đồng thời)
+        self.latency_min_in_flight = latency_min_in_flight if latency_min_in_flight is not None else \
+            max(2, soft_limit // 2)
+        self.latency_half_life = latency_half_life
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.latency_ms = None
+        self.latency_samples = 0
+        self._latency_time = None
+        self.costs = dict(DEFAULT_COSTS)
+        self._measured = set()
+        self._degraded = False
+        self._stats = {
+            'admitted': 0,
+            'degraded': 0,
+            'rerouted': 0,
+            'rejected': 0,
+            'batches_capped': 0
+        }
+
+    def _decay_latency(self, now):
+        """Giảm EWMA độ trễ theo thời gian từ mẫu gần nhất (gọi khi đang giữ lock)"""
+        if self.latency_ms is None or not self.latency_half_life:
+            return
+        idle = now - self._latency_time
+        if idle > 0:
+            self.latency_ms *= 0.5 ** (idle / self.latency_half_life)
+            self._latency_time = now
+
+    def _update_degraded(self):
+        """Cập nhật chế độ degraded (gọi khi đang giữ lock), có trễ khi thoát"""
+        self._decay_latency(time.monotonic())
+        latency = self.latency_ms or 0.0
+        if self.latency_samples < self.min_latency_samples:
+            latency = 0.0
+        concurrent = self.in_flight >= self.latency_min_in_flight
+        if self._degraded:
+            if self.in_flight < self.soft_limit * RECOVERY_RATIO and \
+                    (not concurrent or latency < self.latency_target_ms * RECOVERY_RATIO):
+                self._degraded = False
+        elif self.in_flight >= self.soft_limit or (concurrent and latency > self.latency_target_ms):
+            self._degraded = True
+        return self._degraded
+
+    def _retry_after(self):
+        """Ước lượng số giây đến khi tải giảm (gọi khi đang giữ lock)"""
+        latency_s = (self.latency_ms or self.latency_target_ms) / 1000.0
+        waves = self.in_flight / float(self.soft_limit)
+        return max(1, min(MAX_RETRY_AFTER, int(math.ceil(latency_s * waves))))
+
+    def admit(self, size=1):
+        """
+        Nhận một request (size = số email)
+
+        Returns:
+            Admission
+
+        Raises:
+            Overloaded: khi vượt hard_limit, hoặc batch quá lớn trong chế độ degraded
+        """
+        with self._lock:
+            if self.in_flight >= self.hard_limit:
+                self._stats['rejected'] += 1
+                raise Overloaded(f'Server overloaded ({self.in_flight} requests in flight)', self._retry_after())
+            degraded = self._update_degraded()
+            if degraded and size > self.max_degraded_batch:
+                self._stats['batches_capped'] += 1
+                raise Overloaded(
+                    f'Server under load: batches are limited to {self.max_degraded_batch} emails '
+                    f'(use /jobs for large batches)', self._retry_after())
+            self.in_flight += 1
+            self._stats['admitted'] += 1
+            if degraded:
+                self._stats['degraded'] += 1
+        return Admission(degraded)
+
+    def release(self, admission, count=1):
+        """Kết thúc request (count = số email): cập nhật độ trễ của request một email"""
+        elapsed_ms = (time.perf_counter() - admission.start) * 1000
+        alpha = self.alpha
+        with self._lock:
+            self.in_flight -= 1
+            if count == 1:
+                now = time.monotonic()
+                self._decay_latency(now)
+                self.latency_ms = elapsed_ms if self.latency_ms is None else \
+                    (1 - alpha) * self.latency_ms + alpha * elapsed_ms
+                self._latency_time = now
+                self.latency_samples += 1
+            self._update_degraded()
+
+    def record_cost(self, method, elapsed_ms, count=1):
+        """Chi phí của một lần classifier thực sự phân loại count email (cache miss)"""
+        if count <= 0:
+            return
+        cost = elapsed_ms / count
+        alpha = self.alpha
+        with self._lock:
+            if method in self._measured:
+                self.costs[method] = (1 - alpha) * self.costs[method] + alpha * cost
+            else:
+                # Số đo đầu tiên thay thế hoàn toàn giá trị mặc định
+                self.costs[method] = cost
+                self._measured.add(method)
+
+    def route(self, method, admission, available):
+        """
+        Chọn classifier cho request: khi degraded, dùng classifier rẻ nhất
+        (theo chi phí đo được) trong số các classifier khả dụng
+        """
+        if admission is None or not admission.degraded:
+            return method
+        candidates = [m for m in available if m in self.costs]
+        if not candidates:
+            return method
+        cheapest = min(candidates, key=lambda m: self.costs[m])
+        if cheapest != method and self.costs[cheapest] < self.costs.get(method, float('inf')):
+            with self._lock:
+                self._stats['rerouted'] += 1
+            return cheapest
+        return method
+
+    def state(self):
+        with self._lock:
+            if self.in_flight >= self.hard_limit:
+                return 'overloaded'
+            return 'degraded' if self._update_degraded() else 'normal'
+
+    def stats(self):
+        """Trạng thái hiện tại, giới hạn, độ trễ, chi phí/email và bộ đếm"""
+        state = self.state()
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                'state': state,
+                'in_flight': self.in_flight,
+                'soft_limit': self.soft_limit,
+                'hard_limit': self.hard_limit,
+                'latency_ewma_ms': round(self.latency_ms, 3) if self.latency_ms is not None else None,
+                'latency_target_ms': self.latency_target_ms,
+                'latency_samples': self.latency_samples,
+                'latency_min_in_flight': self.latency_min_in_flight,
+                'max_degraded_batch': self.max_degraded_batch,
+                'cost_per_email_ms': {method: round(cost, 4) for method, cost in self.costs.items()},
+                'retry_after': self._retry_after()
+            })
+        return stats
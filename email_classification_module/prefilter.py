@@ -0,0 +1,325 @@
+import re
+
+try:
+    from re import _parser as sre_parse, _constants as sre_constants
+except ImportError:  # pragma: no cover - Python < 3.11
+    import sre_parse
+    import sre_constants
+
+try:
+    from re import _casefix
+except ImportError:  # pragma: no cover - Python < 3.11
+    _casefix = None
+
+# Automaton Aho-Corasick (pyahocorasick) là tùy chọn; nếu không có thì dùng `in` từng literal
+try:
+    import ahocorasick
+except ImportError:  # pragma: no cover - phụ thuộc môi trường
+    ahocorasick = None
+
+MAX_EXPANSION = 16          # Số biến thể tối đa khi khai triển [0o], [0o]{2}, ...
+MAX_CHARSET = 4             # Chỉ khai triển lớp ký tự [..] có tối đa N ký tự vào literal
+MIN_TEXT_LENGTH = 64        # Text ngắn hơn: chạy regex trực tiếp còn rẻ hơn quét literal
+MIN_LITERAL_LENGTH = 2      # Literal ngắn hơn (ví dụ '%') gần như luôn xuất hiện, chỉ dùng khi không còn lựa chọn khác
+
+_OPS = sre_constants
+_REPEATS = tuple(
+    getattr(_OPS, name) for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT') if hasattr(_OPS, name)
+)
+
+# IGNORECASE của re so sánh chữ thường "đơn giản" của từng ký tự, cộng thêm một số
+# nhóm ký tự tương đương (ı/i, ſ/s, ς/σ, ...). fold() đưa text về cùng dạng đó.
+_CASE_CANONICAL = {}
+if _casefix is not None:
+    for _code, _others in _casefix._EXTRA_CASES.items():
+        _canonical = chr(min((_code,) + tuple(_others)))
+        for _member in (_code,) + tuple(_others):
+            if chr(_member) != _canonical:
+                _CASE_CANONICAL[_member] = _canonical
+_CASE_SPECIAL_RE = re.compile('[%s]' % re.escape(''.join(map(chr, _CASE_CANONICAL)))) if _CASE_CANONICAL else None
+
+
+def fold(text):
+    """Chuẩn hóa chữ hoa/thường theo đúng ngữ nghĩa re.IGNORECASE (giữ nguyên độ dài)"""
+    if 'İ' in text:
+        # 'İ'.lower() cho 2 ký tự; re dùng chữ thường đơn giản 'i'
+        text = text.replace('İ', 'i')
+    text = text.lower()
+    if _CASE_SPECIAL_RE is not None and _CASE_SPECIAL_RE.search(text):
+        text = text.translate(_CASE_CANONICAL)
+    return text
+
+
+def _charset(items):
+    """Tập ký tự của một lớp [..] chỉ gồm literal, hoặc None"""
+    chars = set()
+    for op, av in items:
+        if op is not _OPS.LITERAL:
+            return None
+        chars.add(chr(av))
+    return chars
+
+
+def _clause_quality(clause):
+    return (min(len(literal) for literal in clause), -len(clause))
+
+
+def _sequence_clauses(items):
+    """
+    Các mệnh đề bắt buộc của một chuỗi node regex
+
+    Mỗi mệnh đề là một frozenset literal: bất kỳ chuỗi nào khớp regex đều phải
+    chứa ít nhất một literal của MỖI mệnh đề. Node không hiểu được chỉ làm ngắt
+    literal hiện tại (an toàn: chỉ làm bộ lọc yếu đi, không bao giờ bỏ sót).
+    """
+    clauses = []
+    run = {''}
+
+    def close_run():
+        nonlocal run
+        if run != {''}:
+            clauses.append(frozenset(run))
+        run = {''}
+
+    def extend(chars):
+        nonlocal run
+        if len(run) * len(chars) > MAX_EXPANSION:
+            close_run()
+        run = {prefix + char for prefix in run for char in chars}
+
+    for op, av in items:
+        if op is _OPS.LITERAL:
+            extend((chr(av),))
+        elif op is _OPS.IN and _charset(av):
+            chars = _charset(av)
+            if len(chars) <= MAX_CHARSET:
+                extend(chars)
+            else:
+                # Lớp ký tự lớn (ví dụ 💰|🎉|🔥 được parser gộp thành [..]): một mệnh đề riêng
+                close_run()
+                clauses.append(frozenset(chars))
+        elif op in _REPEATS:
+            low, high, body = av
+            body_items = list(body)
+            single = None
+            if len(body_items) == 1:
+                body_op, body_av = body_items[0]
+                if body_op is _OPS.LITERAL:
+                    single = (chr(body_av),)
+                elif body_op is _OPS.IN:
+                    single = _charset(body_av)
+            if single and len(single) <= MAX_CHARSET and low == high and len(single) ** low <= MAX_EXPANSION:
+                for _ in range(low):
+                    extend(single)
+                continue
+            close_run()
+            if low >= 1:
+                clauses.extend(_sequence_clauses(body_items))
+        elif op is _OPS.SUBPATTERN:
+            close_run()
+            group, add_flags, del_flags, body = av
+            if add_flags or del_flags:
+                # Cờ cục bộ (?i:...) đổi ngữ nghĩa so khớp: bỏ qua cả nhóm
+                continue
+            clauses.extend(_sequence_clauses(list(body)))
+        elif op is _OPS.BRANCH:
+            close_run()
+            clause = _branch_clause(av[1])
+            if clause:
+                clauses.append(clause)
+        else:
+            # AT (^, $, \b), ANY, CATEGORY, GROUPREF, ASSERT, ...
+            close_run()
+    close_run()
+    return clauses
+
+
+def _branch_clause(branches):
+    """Mệnh đề của A|B|C: hợp các mệnh đề tốt nhất của từng nhánh"""
+    literals = set()
+    for branch in branches:
+        clauses = [clause for clause in _sequence_clauses(list(branch)) if '' not in clause]
+        if not clauses:
+            return None
+        literals.update(max(clauses, key=_clause_quality))
+    return frozenset(literals)
+
+
+def required_literals(pattern):
+    """
+    Các mệnh đề literal bắt buộc của một regex đã compile
+
+    Returns:
+        list: Danh sách frozenset literal (đã fold nếu pattern có IGNORECASE),
+              hoặc list rỗng nếu không trích được literal nào (regex luôn phải chạy)
+    """
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:  # pragma: no cover - pattern đã compile thì parse được
+        return []
+
+    clauses = [clause for clause in _sequence_clauses(list(parsed)) if '' not in clause]
+    if not clauses:
+        return []
+    useful = [clause for clause in clauses if _clause_quality(clause)[0] >= MIN_LITERAL_LENGTH]
+    if not useful:
+        useful = [max(clauses, key=_clause_quality)]
+    if pattern.flags & re.IGNORECASE:
+        useful = [frozenset(fold(literal) for literal in clause) for clause in useful]
+    return useful
+
+
+class LiteralPrefilter:
+    """
+    Bộ lọc literal chạy trước các regex tốn kém
+
+    Với mỗi regex, trích các literal bắt buộc (ví dụ 'tài khoản', 'khóa' trong
+    r'tài khoản.*sẽ bị.*khóa'). Mỗi trường được quét một lần bằng automaton
+    Aho-Corasick chứa mọi literal; regex chỉ được chạy khi mọi mệnh đề literal
+    của nó đều xuất hiện. Regex không trích được literal thì luôn được chạy,
+    nên kết quả giống hệt khi chạy trực tiếp.
+    """
+
+    def __init__(self, patterns, use_automaton=True, min_text_length=MIN_TEXT_LENGTH, literals=None):
+        """
+        Args:
+            patterns: Các regex (đối tượng có .pattern, .flags và .search)
+            literals (dict): Mệnh đề literal đã tính sẵn theo pattern (ví dụ từ
+                             artifact ruleset); pattern không có trong dict sẽ được phân tích
+        """
+        self.min_text_length = min_text_length
+        self.requirements = {}      # pattern -> tuple các frozenset id literal
+        self._literal_ids = {}      # (ignorecase, literal) -> id
+        literals = literals or {}
+        for pattern in patterns:
+            clauses = literals[pattern] if pattern in literals else required_literals(pattern)
+            if not clauses:
+                continue
+            ignorecase = bool(pattern.flags & re.IGNORECASE)
+            self.requirements[pattern] = tuple(
+                frozenset(self._literal_id(ignorecase, literal) for literal in clause)
+                for clause in clauses
+            )
+
+        exact = {literal: lid for (ignorecase, literal), lid in self._literal_ids.items() if not ignorecase}
+        folded = {literal: lid for (ignorecase, literal), lid in self._literal_ids.items() if ignorecase}
+        self.max_literal_length = max((len(literal) for _, literal in self._literal_ids), default=0)
+        self.use_automaton = bool(use_automaton and ahocorasick is not None)
+        self._exact_matcher = self._matcher(exact)
+        self._folded_matcher = self._matcher(folded)
+
+    def _literal_id(self, ignorecase, literal):
+        key = (ignorecase, literal)
+        lid = self._literal_ids.get(key)
+        if lid is None:
+            lid = self._literal_ids[key] = len(self._literal_ids)
+        return lid
+
+    def _matcher(self, literals):
+        if not literals:
+            return None
+        if self.use_automaton:
+            automaton = ahocorasick.Automaton()
+            for literal, lid in literals.items():
+                automaton.add_word(literal, lid)
+            automaton.make_automaton()
+            return lambda text: {lid for _, lid in automaton.iter(text)}
+        items = tuple(literals.items())
+        return lambda text: {lid for literal, lid in items if literal in text}
+
+    def find(self, text):
+        """Tập id của các literal xuất hiện trong text (một lượt quét mỗi chế độ hoa/thường)"""
+        found = set()
+        if text:
+            if self._exact_matcher is not None:
+                found |= self._exact_matcher(text)
+            if self._folded_matcher is not None:
+                found |= self._folded_matcher(fold(text))
+        return found
+
+    def find_joined(self, left, sep, right, found_left, found_right):
+        """
+        Literal trong left + sep + right, dùng lại kết quả đã quét của left và right:
+        chỉ cần quét thêm vùng quanh chỗ nối
+        """
+        k = self.max_literal_length - 1
+        boundary = (left[len(left) - k:] if k > 0 else '') + sep + right[:k]
+        return found_left | found_right | self.find(boundary)
+
+    def scan(self):
+        """Tạo TextScan cho một lần phân loại"""
+        return TextScan(self)
+
+    def describe(self):
+        """Literal bắt buộc của từng regex (dùng để kiểm tra/benchmark)"""
+        names = {lid: literal for (_, literal), lid in self._literal_ids.items()}
+        return {
+            pattern.pattern: [sorted(names[lid] for lid in clause) for clause in clauses]
+            for pattern, clauses in self.requirements.items()
+        }
+
+
+class TextScan:
+    """
+    Trạng thái quét literal của một lần phân loại
+
+    Mỗi text (title, content, from_email, domain) chỉ được quét một lần, sau đó
+    dùng chung cho mọi regex. Không dùng chung giữa các thread.
+    """
+
+    __slots__ = ('_prefilter', '_found')
+
+    def __init__(self, prefilter):
+        self._prefilter = prefilter
+        self._found = {}
+
+    def _lookup(self, text):
+        found = self._found.get(text)
+        if found is None:
+            found = self._found[text] = self._prefilter.find(text)
+        return found
+
+    @staticmethod
+    def _allowed(clauses, found):
+        for clause in clauses:
+            if clause.isdisjoint(found):
+                return False
+        return True
+
+    def search(self, pattern, text):
+        """Như pattern.search(text), nhưng bỏ qua regex khi thiếu literal bắt buộc"""
+        if len(text) >= self._prefilter.min_text_length:
+            clauses = self._prefilter.requirements.get(pattern)
+            if clauses is not None and not self._allowed(clauses, self._lookup(text)):
+                return None
+        return pattern.search(text)
+
+    def search_joined(self, pattern, left, sep, right):
+        """Như pattern.search(left + sep + right), không quét lại left và right"""
+        clauses = self._prefilter.requirements.get(pattern)
+        if clauses is not None:
+            key = (left, sep, right)
+            found = self._found.get(key)
+            if found is None:
+                found = self._found[key] = self._prefilter.find_joined(
+                    left, sep, right, self._lookup(left), self._lookup(right))
+            if not self._allowed(clauses, found):
+                return None
+        return pattern.search(left + sep + right)
+
+
+class DirectScan:
+    """Chạy mọi regex trực tiếp (khi tắt prefilter)"""
+
+    __slots__ = ()
+
+    @staticmethod
+    def search(pattern, text):
+        return pattern.search(text)
+
+    @staticmethod
+    def search_joined(pattern, left, sep, right):
+        return pattern.search(left + sep + right)
+
+
+DIRECT_SCAN = DirectScan()
@@ -0,0 +1,233 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from local_storage import data_path, ensure_private_file
+from serialization import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+# File SQLite nằm trong thư mục dữ liệu riêng của user (0700, file 0600), dùng chung cho mọi worker process
+DEFAULT_CACHE_PATH = data_path('result_cache.sqlite3')
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+EVICT_TARGET_RATIO = 0.9        # Sau khi evict, dung lượng còn lại <= 90% max_bytes
+EVICT_CHECK_INTERVAL = 200      # Kiểm tra dung lượng sau mỗi N lần ghi
+TOUCH_INTERVAL = 60.0           # Chỉ cập nhật thời điểm truy cập nếu đã cũ hơn N giây
+BUSY_TIMEOUT_MS = 50            # Cache là best-effort: không chờ lock lâu
+SQLITE_MAX_VARIABLES = 500
+
+
+def is_cacheable(result):
+    """
+    Chỉ kết quả phân loại thành công mới được dùng lại
+
+    Kết quả fallback của ML classifier (có 'error' khi model lỗi, 'warning' khi
+    text quá ngắn) không phải verdict thật của model nên không được cache.
+    """
+    return result is not None and 'error' not in result and 'warning' not in result
+
+
+class ResultCache:
+    """
+    Cache kết quả phân loại dùng chung giữa các worker process
+
+    Lưu trong SQLite (WAL + mmap) trên máy local, không cần dịch vụ ngoài.
+    Key là hash nội dung email (sau ContentPolicy) cộng với tên classifier và
+    version của model/ruleset, nên khi model hoặc rule thay đổi thì kết quả
+    cũ tự động không còn được dùng. Khi vượt quá max_bytes, các entry ít được
+    truy cập gần đây nhất bị xóa trước.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes_since_check = 0
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'sets': 0,
+            'skipped': 0,
+            'evictions': 0,
+            'errors': 0,
+            'lookup_time_ms': 0.0,
+            'lookups': 0
+        }
+
+        # Kết quả phân loại chứa nội dung suy ra từ email: không cho user khác đọc
+        ensure_private_file(self.path)
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key BLOB PRIMARY KEY, value BLOB NOT NULL, '
+                'size INTEGER NOT NULL, accessed REAL NOT NULL) WITHOUT ROWID'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+
+    def _connection(self):
+        """
+        Mỗi thread một connection; mở lại sau fork vì connection SQLite
+        không được dùng chung giữa các process (ví dụ gunicorn --preload)
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000.0, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(f'PRAGMA mmap_size={self.max_bytes * 2}')
+            connection.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def make_key(namespace, version, title, content, from_email):
+        """Hash nội dung email + classifier + version thành key 16 bytes"""
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (namespace, version, title, content, from_email):
+            digest.update(str(part or '').encode('utf-8', 'surrogatepass'))
+            digest.update(b'\x00')
+        return digest.digest()
+
+    def get(self, key):
+        """Lấy kết quả theo key, trả về None nếu không có"""
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        """Lấy nhiều kết quả trong một truy vấn, trả về list cùng thứ tự với keys"""
+        start_time = time.perf_counter()
+        found = {}
+        try:
+            connection = self._connection()
+            for i in range(0, len(keys), SQLITE_MAX_VARIABLES):
+                chunk = keys[i:i + SQLITE_MAX_VARIABLES]
+                placeholders = ','.join('?' * len(chunk))
+                rows = connection.execute(
+                    f'SELECT key, value, accessed FROM results WHERE key IN ({placeholders})', chunk
+                ).fetchall()
+                for key, value, accessed in rows:
+                    found[key] = (value, accessed)
+            self._touch(connection, found)
+        except sqlite3.Error as e:
+            self._record_error(e)
+
+        results = []
+        for key in keys:
+            entry = found.get(key)
+            results.append(loads(entry[0]) if entry is not None else None)
+
+        hits = len([r for r in results if r is not None])
+        with self._lock:
+            self._stats['hits'] += hits
+            self._stats['misses'] += len(keys) - hits
+            self._stats['lookups'] += 1
+            self._stats['lookup_time_ms'] += (time.perf_counter() - start_time) * 1000
+        return results
+
+    def set(self, key, value):
+        """Lưu một kết quả"""
+        self.set_many([(key, value)])
+
+    def set_many(self, items):
+        """Lưu nhiều kết quả trong một transaction (bỏ qua kết quả lỗi / fallback, xem is_cacheable)"""
+        cacheable = [(key, value) for key, value in items if is_cacheable(value)]
+        if len(cacheable) < len(items):
+            with self._lock:
+                self._stats['skipped'] += len(items) - len(cacheable)
+        if not cacheable:
+            return
+        now = time.time()
+        rows = []
+        for key, value in cacheable:
+            data = dumps(value)
+            rows.append((key, data, len(data) + len(key), now))
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute('BEGIN')
+                connection.executemany(
+                    'INSERT OR REPLACE INTO results (key, value, size, accessed) VALUES (?, ?, ?, ?)', rows
+                )
+        except sqlite3.Error as e:
+            self._record_error(e)
+            return
+
+        with self._lock:
+            self._stats['sets'] += len(rows)
+            self._writes_since_check += len(rows)
+            check = self._writes_since_check >= EVICT_CHECK_INTERVAL
+            if check:
+                self._writes_since_check = 0
+        if check:
+            self.evict()
+
+    def evict(self):
+        """Xóa các entry cũ nhất nếu tổng dung lượng vượt quá max_bytes"""
+        try:
+            connection = self._connection()
+            total, count = connection.execute('SELECT COALESCE(SUM(size), 0), COUNT(*) FROM results').fetchone()
+            if total <= self.max_bytes or count == 0:
+                return 0
+            target = self.max_bytes * EVICT_TARGET_RATIO
+            to_delete = max(1, int(count * (total - target) / total) + 1)
+            with connection:
+                connection.execute('BEGIN')
+                connection.execute(
+                    'DELETE FROM results WHERE key IN '
+                    '(SELECT key FROM results ORDER BY accessed LIMIT ?)', (to_delete,)
+                )
+        except sqlite3.Error as e:
+            self._record_error(e)
+            return 0
+
+        with self._lock:
+            self._stats['evictions'] += to_delete
+        return to_delete
+
+    def clear(self):
+        """Xóa toàn bộ cache"""
+        connection = self._connection()
+        with connection:
+            connection.execute('DELETE FROM results')
+
+    def stats(self):
+        """Thống kê hit ratio, độ trễ tra cứu (của process hiện tại) và dung lượng (dùng chung)"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats.pop('lookups')
+        lookup_time = stats.pop('lookup_time_ms')
+        requests = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / requests, 4) if requests else 0.0
+        stats['avg_lookup_ms'] = round(lookup_time / lookups, 4) if lookups else 0.0
+        stats['pid'] = os.getpid()
+        try:
+            entries, size = self._connection().execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results'
+            ).fetchone()
+            stats['entries'] = entries
+            stats['size_bytes'] = size
+        except sqlite3.Error as e:
+            self._record_error(e)
+        stats['max_bytes'] = self.max_bytes
+        stats['path'] = self.path
+        return stats
+
+    def _touch(self, connection, found):
+        """Cập nhật thời điểm truy cập (xấp xỉ LRU) cho các entry đã cũ"""
+        now = time.time()
+        stale = [(now, key) for key, (_, accessed) in found.items() if now - accessed > TOUCH_INTERVAL]
+        if stale:
+            with connection:
+                connection.execute('BEGIN')
+                connection.executemany('UPDATE results SET accessed = ? WHERE key = ?', stale)
+
+    def _record_error(self, error):
+        with self._lock:
+            self._stats['errors'] += 1
+        logger.warning(f"Result cache error: {error}")
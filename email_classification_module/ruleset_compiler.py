@@ -0,0 +1,602 @@
+"""
+Compiler cho ruleset khai báo (JSON, hoặc YAML nếu đã cài PyYAML)
+
+Ruleset mô tả các category theo thứ tự ưu tiên; mỗi category gồm các nhóm
+pattern (trường áp dụng, trọng số, indicator), ngưỡng điểm, hệ số confidence,
+bước kiểm tra nâng cao và các pattern phủ quyết. Compiler kiểm tra cấu trúc,
+phát hiện regex nguy hiểm (backtracking bùng nổ), trích literal cho prefilter
+và ghi kết quả thành artifact JSON có version, được cache theo hash của file
+nguồn: worker khởi động sau chỉ cần đọc artifact, regex được compile khi
+dùng lần đầu.
+
+Kiểm tra ruleset:
+    python ruleset_compiler.py rules/default.json
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import string
+import sys
+import tempfile
+
+from email_features import FEATURE_FIELDS
+from local_storage import InsecureStorage, data_path, ensure_private_dir
+from prefilter import required_literals, sre_constants, sre_parse
+
+# YAML là tùy chọn
+try:
+    import yaml
+except ImportError:  # pragma: no cover - phụ thuộc môi trường
+    yaml = None
+
+logger = logging.getLogger(__name__)
+
+RULES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules')
+DEFAULT_RULESET_PATH = os.path.join(RULES_DIR, 'default.json')
+DEFAULT_CACHE_DIR = data_path('rulesets')     # Thư mục riêng của user (0700), xem local_storage
+
+# Tăng khi định dạng artifact hoặc cách phân tích thay đổi (làm mất hiệu lực cache cũ)
+COMPILER_VERSION = 1
+
+LABELS = ('An toàn', 'Nghi ngờ', 'Spam', 'Giả mạo')
+# title_content = title + ' ' + content; FEATURE_FIELDS (urls, url_hosts, shorteners, link_lines, ...)
+# được trích xuất bởi email_features, chỉ khi ruleset có dùng đến
+BASE_FIELDS = ('title', 'content', 'from_email', 'domain')
+FIELDS = BASE_FIELDS + ('title_content',) + FEATURE_FIELDS
+TEMPLATE_FIELDS = BASE_FIELDS + FEATURE_FIELDS
+MODES = ('each', 'first')
+
+MAX_PATTERN_LENGTH = 500
+MAX_WILDCARDS = 3           # Số `.*` / `.+` tối đa trong một regex trước khi cảnh báo
+
+_CATEGORY_KEYS = {'id', 'label', 'threshold', 'confidence_per_point', 'groups', 'advanced', 'veto',
+                  'result_indicators', 'description'}
+_GROUP_KEYS = {'name', 'fields', 'patterns', 'weight', 'indicator', 'mode', 'variants', 'ignore_case', 'description'}
+_VARIANT_KEYS = {'pattern', 'fields', 'indicator', 'weight'}
+_VETO_KEYS = {'name', 'fields', 'patterns', 'ignore_case', 'description'}
+_PATTERN_KEYS = {'regex', 'ignore_case'}
+
+
+class RulesetError(ValueError):
+    """Ruleset không hợp lệ (liệt kê mọi lỗi tìm thấy)"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super().__init__('Invalid ruleset:\n' + '\n'.join(f'  - {error}' for error in self.errors))
+
+
+class LazyPattern:
+    """Regex chỉ được compile khi dùng lần đầu (khởi động nhanh khi prefilter bỏ qua phần lớn regex)"""
+
+    __slots__ = ('pattern', 'flags', '_compiled')
+
+    def __init__(self, pattern, flags=0):
+        self.pattern = pattern
+        self.flags = flags
+        self._compiled = None
+
+    def compile(self):
+        # Hai thread cùng compile lần đầu chỉ gán cùng một giá trị: không cần lock
+        compiled = self._compiled
+        if compiled is None:
+            compiled = self._compiled = re.compile(self.pattern, self.flags)
+        return compiled
+
+    def search(self, text):
+        compiled = self._compiled
+        if compiled is None:
+            compiled = self.compile()
+        return compiled.search(text)
+
+    def __repr__(self):
+        return f'LazyPattern({self.pattern!r}, {self.flags})'
+
+
+class RuleGroup:
+    """Nhóm pattern: mỗi pattern khớp (trên một trong các trường) cộng weight và indicator"""
+
+    __slots__ = ('name', 'fields', 'patterns', 'weight', 'indicator', 'first_only', 'variants')
+
+    def __init__(self, name, fields, patterns, weight, indicator, first_only, variants):
+        self.name = name
+        self.fields = fields
+        self.patterns = patterns
+        self.weight = weight
+        self.indicator = indicator
+        self.first_only = first_only
+        self.variants = variants    # [(pattern, fields, indicator, weight)]
+
+
+class RuleCategory:
+    """Một category của ruleset và cách tính điểm của nó"""
+
+    __slots__ = ('id', 'label', 'threshold', 'confidence_per_point', 'groups',
+                 'advanced_below', 'advanced_groups', 'veto', 'result_indicators')
+
+    def __init__(self, id, label, threshold, confidence_per_point, groups,
+                 advanced_below, advanced_groups, veto, result_indicators):
+        self.id = id
+        self.label = label
+        self.threshold = threshold
+        self.confidence_per_point = confidence_per_point
+        self.groups = groups
+        self.advanced_below = advanced_below
+        self.advanced_groups = advanced_groups
+        self.veto = veto
+        self.result_indicators = result_indicators
+
+
+class CompiledRuleset:
+    """
+    Ruleset đã compile: các category theo thứ tự ưu tiên, fallback, danh sách
+    regex và literal bắt buộc của chúng (cho LiteralPrefilter)
+    """
+
+    def __init__(self, artifact):
+        self.name = artifact['name']
+        self.version = artifact['version']
+        self.warnings = artifact['warnings']
+        self.fallback = artifact['fallback']
+        self.patterns = []
+        self.literals = {}
+        self.fields = set()
+
+        self.categories = [self._category(spec) for spec in artifact['categories']]
+        # Chỉ tính các trường dẫn xuất (URL/người gửi, dòng có "link") mà rule dùng đến
+        self.feature_fields = frozenset(self.fields.intersection(FEATURE_FIELDS))
+        self.uses_features = bool(self.feature_fields)
+
+    def _pattern(self, spec):
+        pattern = LazyPattern(spec['regex'], spec['flags'])
+        self.patterns.append(pattern)
+        self.literals[pattern] = [frozenset(clause) for clause in spec['literals']]
+        return pattern
+
+    def _group(self, spec):
+        self.fields.update(spec['fields'])
+        for variant in spec['variants']:
+            self.fields.update(variant['fields'])
+        for indicator in [spec['indicator']] + [variant['indicator'] for variant in spec['variants']]:
+            if indicator:
+                self.fields.update(_template_fields(indicator))
+        return RuleGroup(
+            spec['name'],
+            tuple(spec['fields']),
+            [self._pattern(pattern) for pattern in spec['patterns']],
+            spec['weight'],
+            spec['indicator'],
+            spec['mode'] == 'first',
+            [
+                (self._pattern(variant['pattern']), tuple(variant['fields']), variant['indicator'], variant['weight'])
+                for variant in spec['variants']
+            ]
+        )
+
+    def _category(self, spec):
+        advanced = spec['advanced']
+        return RuleCategory(
+            spec['id'],
+            spec['label'],
+            spec['threshold'],
+            spec['confidence_per_point'],
+            [self._group(group) for group in spec['groups']],
+            advanced['below'] if advanced else None,
+            [self._group(group) for group in advanced['groups']] if advanced else [],
+            [self._group(group) for group in spec['veto']],
+            spec['result_indicators']
+        )
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _template_fields(template):
+    return [name for _, name, _, _ in string.Formatter().parse(template) if name is not None]
+
+
+def analyze_pattern(regex, flags):
+    """
+    Tìm các dấu hiệu regex nguy hiểm
+
+    Returns:
+        tuple: (errors, warnings) - danh sách thông báo
+    """
+    errors, warnings = [], []
+    if len(regex) > MAX_PATTERN_LENGTH:
+        errors.append(f'pattern longer than {MAX_PATTERN_LENGTH} characters')
+        return errors, warnings
+    try:
+        compiled = re.compile(regex, flags)
+    except re.error as e:
+        errors.append(f'invalid regex: {e}')
+        return errors, warnings
+    if compiled.search(''):
+        errors.append('pattern matches the empty string (would match every email)')
+
+    unbounded = sre_constants.MAXREPEAT
+    repeats = tuple(
+        getattr(sre_constants, name) for name in ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+        if hasattr(sre_constants, name)
+    )
+    state = {'wildcards': 0}
+
+    def walk(items, inside_unbounded):
+        for op, av in items:
+            if op in repeats:
+                low, high, body = av
+                is_unbounded = high == unbounded
+                if is_unbounded and inside_unbounded:
+                    errors.append('nested unbounded quantifiers (catastrophic backtracking)')
+                body = list(body)
+                if is_unbounded and len(body) == 1 and body[0][0] is sre_constants.ANY:
+                    state['wildcards'] += 1
+                walk(body, inside_unbounded or is_unbounded)
+            elif op is sre_constants.SUBPATTERN:
+                walk(list(av[-1]), inside_unbounded)
+            elif op is sre_constants.BRANCH:
+                for branch in av[1]:
+                    walk(list(branch), inside_unbounded)
+            elif op in (sre_constants.ASSERT, sre_constants.ASSERT_NOT):
+                walk(list(av[1]), inside_unbounded)
+            elif op is sre_constants.GROUPREF:
+                warnings.append('backreference (cannot be prefiltered, may be slow)')
+
+    walk(list(sre_parse.parse(regex, flags)), False)
+    if state['wildcards'] > MAX_WILDCARDS:
+        warnings.append(f'{state["wildcards"]} unbounded wildcards (.*); backtracking grows as n^{state["wildcards"]}')
+    return sorted(set(errors)), sorted(set(warnings))
+
+
+class _Compiler:
+    """Kiểm tra + chuẩn hóa ruleset thành artifact (dict có thể ghi ra JSON)"""
+
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+
+    def error(self, where, message):
+        self.errors.append(f'{where}: {message}')
+
+    def check_keys(self, where, spec, allowed, required=()):
+        if not isinstance(spec, dict):
+            self.error(where, 'must be an object')
+            return False
+        for key in sorted(set(spec) - allowed):
+            self.error(where, f'unknown key "{key}"')
+        for key in required:
+            if key not in spec:
+                self.error(where, f'missing required key "{key}"')
+        return True
+
+    def fields(self, where, spec, default=None):
+        fields = spec.get('fields', default)
+        if not isinstance(fields, list) or not fields:
+            self.error(where, '"fields" must be a non-empty list')
+            return []
+        for field in fields:
+            if field not in FIELDS:
+                self.error(where, f'unknown field "{field}" (allowed: {", ".join(FIELDS)})')
+        return list(fields)
+
+    def template(self, where, template):
+        if template is None:
+            return None
+        if not isinstance(template, str):
+            self.error(where, 'indicator must be a string or null')
+            return None
+        try:
+            names = _template_fields(template)
+        except ValueError as e:
+            self.error(where, f'invalid indicator template: {e}')
+            return None
+        for name in names:
+            if name not in TEMPLATE_FIELDS:
+                self.error(where, f'indicator uses unknown field "{{{name}}}"')
+        return template
+
+    def weight(self, where, value):
+        if not _is_number(value) or value < 0:
+            self.error(where, 'weight must be a non-negative number')
+            return 0
+        return value
+
+    def pattern(self, where, spec, ignore_case):
+        if isinstance(spec, str):
+            regex = spec
+        elif self.check_keys(where, spec, _PATTERN_KEYS, ('regex',)):
+            regex = spec.get('regex')
+            ignore_case = spec.get('ignore_case', ignore_case)
+        else:
+            return None
+        if not isinstance(regex, str) or not regex:
+            self.error(where, 'regex must be a non-empty string')
+            return None
+        if not isinstance(ignore_case, bool):
+            self.error(where, 'ignore_case must be true or false')
+            return None
+
+        flags = re.IGNORECASE if ignore_case else 0
+        errors, warnings = analyze_pattern(regex, flags)
+        for message in errors:
+            self.error(where, f'{message}: {regex!r}')
+        for message in warnings:
+            self.warnings.append(f'{where}: {message}: {regex!r}')
+        if errors:
+            return None
+
+        # Literal bắt buộc được tính một lần tại đây và lưu trong artifact
+        literals = required_literals(re.compile(regex, flags))
+        return {
+            'regex': regex,
+            'flags': int(re.compile(regex, flags).flags),
+            'literals': [sorted(clause) for clause in literals]
+        }
+
+    def patterns(self, where, spec, ignore_case):
+        patterns = spec.get('patterns')
+        if not isinstance(patterns, list) or not patterns:
+            self.error(where, '"patterns" must be a non-empty list')
+            return []
+        compiled = [self.pattern(f'{where}.patterns[{i}]', p, ignore_case) for i, p in enumerate(patterns)]
+        return [p for p in compiled if p is not None]
+
+    def group(self, where, spec, veto=False):
+        if not self.check_keys(where, spec, _VETO_KEYS if veto else _GROUP_KEYS, ('fields', 'patterns')):
+            return None
+        ignore_case = spec.get('ignore_case', False)
+        fields = self.fields(where, spec)
+        mode = spec.get('mode', 'each')
+        if mode not in MODES:
+            self.error(where, f'mode must be one of: {", ".join(MODES)}')
+
+        variants = []
+        for i, variant in enumerate(spec.get('variants', [])):
+            variant_where = f'{where}.variants[{i}]'
+            if not self.check_keys(variant_where, variant, _VARIANT_KEYS, ('pattern', 'indicator')):
+                continue
+            pattern = self.pattern(f'{variant_where}.pattern', variant['pattern'], ignore_case)
+            if pattern is None:
+                continue
+            variants.append({
+                'pattern': pattern,
+                'fields': self.fields(variant_where, variant, default=fields),
+                'indicator': self.template(variant_where, variant['indicator']),
+                'weight': self.weight(variant_where, variant.get('weight', spec.get('weight', 1)))
+            })
+
+        return {
+            'name': spec.get('name', where),
+            'fields': fields,
+            'patterns': self.patterns(where, spec, ignore_case),
+            'weight': 0 if veto else self.weight(where, spec.get('weight', 1)),
+            'indicator': None if veto else self.template(where, spec.get('indicator')),
+            'mode': 'first' if veto else mode,
+            'variants': variants
+        }
+
+    def category(self, where, spec):
+        if not self.check_keys(where, spec, _CATEGORY_KEYS, ('id', 'label', 'threshold', 'confidence_per_point')):
+            return None
+        if spec.get('label') not in LABELS:
+            self.error(where, f'label must be one of: {", ".join(LABELS)}')
+        if not _is_number(spec.get('threshold')):
+            self.error(where, 'threshold must be a number')
+        rate = spec.get('confidence_per_point')
+        if not _is_number(rate) or not 0 < rate <= 1:
+            self.error(where, 'confidence_per_point must be a number in (0, 1]')
+
+        groups = spec.get('groups', [])
+        if not isinstance(groups, list):
+            self.error(where, '"groups" must be a list')
+            groups = []
+
+        advanced = spec.get('advanced')
+        if advanced is not None:
+            advanced_where = f'{where}.advanced'
+            if self.check_keys(advanced_where, advanced, {'below', 'groups'}, ('below', 'groups')):
+                if not _is_number(advanced.get('below')):
+                    self.error(advanced_where, 'below must be a number')
+                advanced = {
+                    'below': advanced.get('below'),
+                    'groups': [
+                        self.group(f'{advanced_where}.groups[{i}]', group)
+                        for i, group in enumerate(advanced.get('groups') or [])
+                    ]
+                }
+            else:
+                advanced = None
+
+        result_indicators = spec.get('result_indicators')
+        if result_indicators is not None and (
+                not isinstance(result_indicators, list) or not all(isinstance(i, str) for i in result_indicators)):
+            self.error(where, 'result_indicators must be a list of strings')
+
+        return {
+            'id': spec.get('id'),
+            'label': spec.get('label'),
+            'threshold': spec.get('threshold'),
+            'confidence_per_point': rate,
+            'groups': [self.group(f'{where}.groups[{i}]', group) for i, group in enumerate(groups)],
+            'advanced': advanced,
+            'veto': [self.group(f'{where}.veto[{i}]', group, veto=True) for i, group in enumerate(spec.get('veto', []))],
+            'result_indicators': result_indicators
+        }
+
+    def ruleset(self, spec):
+        if not self.check_keys('ruleset', spec, {'name', 'description', 'categories', 'fallback'},
+                               ('name', 'categories', 'fallback')):
+            raise RulesetError(self.errors)
+
+        categories = spec.get('categories')
+        if not isinstance(categories, list) or not categories:
+            self.error('ruleset', '"categories" must be a non-empty list')
+            categories = []
+        compiled = [self.category(f'categories[{i}]', category) for i, category in enumerate(categories)]
+        ids = [category['id'] for category in compiled if category]
+        if len(ids) != len(set(ids)):
+            self.error('ruleset', 'category ids must be unique')
+
+        fallback = spec.get('fallback')
+        if self.check_keys('fallback', fallback, {'label', 'confidence', 'indicators', 'level'},
+                           ('label', 'confidence', 'indicators')):
+            if fallback.get('label') not in LABELS:
+                self.error('fallback', f'label must be one of: {", ".join(LABELS)}')
+            if not _is_number(fallback.get('confidence')):
+                self.error('fallback', 'confidence must be a number')
+            fallback = {
+                'category': fallback.get('label'),
+                'confidence': fallback.get('confidence'),
+                'indicators': list(fallback.get('indicators') or []),
+                'level': fallback.get('level', 'basic')
+            }
+
+        if self.errors:
+            raise RulesetError(self.errors)
+
+        artifact = {
+            'name': spec['name'],
+            'categories': compiled,
+            'fallback': fallback
+        }
+        artifact['version'] = ruleset_version(artifact)
+        artifact['warnings'] = self.warnings
+        artifact['compiler'] = COMPILER_VERSION
+        return artifact
+
+
+def ruleset_version(artifact):
+    """Version chỉ phụ thuộc nội dung đã chuẩn hóa (không phụ thuộc định dạng/khoảng trắng của file)"""
+    content = {key: artifact[key] for key in ('name', 'categories', 'fallback')}
+    canonical = json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def source_digest(source):
+    """
+    Hash của file nguồn + COMPILER_VERSION + phiên bản Python: artifact chỉ hợp lệ với
+    đúng bộ này (literal của prefilter được trích từ parser regex của Python đang chạy)
+    """
+    digest = hashlib.blake2b(source, digest_size=16)
+    digest.update(f'compiler={COMPILER_VERSION};python={sys.version_info[0]}.{sys.version_info[1]}'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _valid_artifact(artifact, digest):
+    """Artifact trong cache phải được compile từ đúng file nguồn, đúng compiler và không bị sửa/hỏng"""
+    try:
+        return (artifact.get('compiler') == COMPILER_VERSION
+                and artifact.get('source_digest') == digest
+                and artifact.get('version') == ruleset_version(artifact))
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return False
+
+
+def parse_source(source, path):
+    """Đọc nội dung file ruleset (JSON hoặc YAML theo phần mở rộng)"""
+    if path.endswith(('.yaml', '.yml')):
+        if yaml is None:
+            raise RulesetError([f'{path}: YAML rulesets require PyYAML to be installed'])
+        try:
+            return yaml.safe_load(source)
+        except yaml.YAMLError as e:
+            raise RulesetError([f'{path}: invalid YAML: {e}'])
+    try:
+        return json.loads(source)
+    except ValueError as e:
+        raise RulesetError([f'{path}: invalid JSON: {e}'])
+
+
+def compile_ruleset(spec):
+    """
+    Kiểm tra và compile ruleset (dict) thành artifact
+
+    Raises:
+        RulesetError: nếu ruleset có lỗi (cấu trúc, regex không hợp lệ hoặc nguy hiểm)
+    """
+    return _Compiler().ruleset(spec)
+
+
+def load_ruleset(path=DEFAULT_RULESET_PATH, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    Load ruleset, dùng artifact đã compile trong cache_dir nếu file nguồn không đổi
+
+    Artifact trong cache chỉ được dùng khi thư mục cache thuộc user hiện tại và
+    không ai khác ghi được, và artifact ghi đúng digest của file nguồn, đúng
+    COMPILER_VERSION và phiên bản Python, với version khớp nội dung; ngược lại ruleset
+    được compile lại.
+
+    Args:
+        path (str): File ruleset (.json, .yaml)
+        cache_dir (str): Thư mục cache artifact, None để không dùng cache
+
+    Returns:
+        CompiledRuleset
+    """
+    with open(path, 'rb') as f:
+        source = f.read()
+
+    digest = source_digest(source)
+    name = os.path.splitext(os.path.basename(path))[0]
+    artifact_path = None
+    if cache_dir:
+        try:
+            ensure_private_dir(cache_dir)
+            artifact_path = os.path.join(cache_dir, f'{name}-{digest}.json')
+        except (OSError, InsecureStorage) as e:
+            logger.warning(f"⚠️ Not using ruleset cache {cache_dir}: {e}")
+
+    if artifact_path:
+        try:
+            with open(artifact_path, 'rb') as f:
+                artifact = json.loads(f.read())
+            if _valid_artifact(artifact, digest):
+                return CompiledRuleset(artifact)
+            logger.warning(f"⚠️ Ignoring invalid ruleset cache {artifact_path}")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError):
+            logger.warning(f"⚠️ Ignoring unreadable ruleset cache {artifact_path}")
+
+    artifact = compile_ruleset(parse_source(source, path))
+    artifact['source_digest'] = digest
+    for warning in artifact['warnings']:
+        logger.warning(f"⚠️ Ruleset {name}: {warning}")
+
+    if artifact_path:
+        # Ghi ra file tạm (0600) rồi rename để các worker khác không đọc phải file ghi dở
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(artifact, f, ensure_ascii=False)
+            os.replace(tmp_path, artifact_path)
+        except OSError as e:
+            logger.warning(f"Could not write ruleset cache {artifact_path}: {e}")
+    return CompiledRuleset(artifact)
+
+
+def main(argv=None):
+    """Kiểm tra một file ruleset, in cảnh báo và thống kê"""
+    argv = sys.argv[1:] if argv is None else argv
+    path = argv[0] if argv else DEFAULT_RULESET_PATH
+    try:
+        with open(path, 'rb') as f:
+            artifact = compile_ruleset(parse_source(f.read(), path))
+    except RulesetError as e:
+        print(f'❌ {e}')
+        return 1
+
+    ruleset = CompiledRuleset(artifact)
+    prefiltered = sum(1 for clauses in ruleset.literals.values() if clauses)
+    print(f'✅ {ruleset.name} (version {ruleset.version}): {len(ruleset.categories)} categories, '
+          f'{len(ruleset.patterns)} patterns, {prefiltered} with required literals')
+    for warning in ruleset.warnings:
+        print(f'⚠️  {warning}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
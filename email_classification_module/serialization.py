@@ -0,0 +1,160 @@
+import json
+
+from flask import Response
+
+# orjson nhanh hơn json chuẩn nhiều lần; dùng nếu đã được cài đặt
+try:
+    import orjson
+except ImportError:  # pragma: no cover - phụ thuộc môi trường
+    orjson = None
+
+REQUIRED_FIELDS = ('title', 'content', 'from_email')
+
+RESPONSE_FORMATS = ('records', 'columnar')
+
+
+class InvalidPayload(ValueError):
+    """Request body không phải JSON hợp lệ"""
+
+
+def _json_default(obj):
+    """Chuyển các kiểu numpy (float64, int64, ndarray) sang kiểu Python"""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if hasattr(obj, 'item'):
+        return obj.item()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def _std_loads(data):
+    return json.loads(data)
+
+
+def _std_dumps(obj):
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+
+if orjson is not None:
+    _ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def _orjson_dumps(obj):
+        return orjson.dumps(obj, default=_json_default, option=_ORJSON_OPTIONS)
+
+    _loads, _dumps, codec = orjson.loads, _orjson_dumps, 'orjson'
+else:  # pragma: no cover - phụ thuộc môi trường
+    _loads, _dumps, codec = _std_loads, _std_dumps, 'json'
+
+
+def use_codec(name):
+    """Chọn codec JSON ('orjson' hoặc 'json'), chủ yếu dùng cho benchmark"""
+    global _loads, _dumps, codec
+    if name == 'orjson':
+        if orjson is None:
+            raise ValueError('orjson is not installed')
+        _loads, _dumps = orjson.loads, _orjson_dumps
+    elif name == 'json':
+        _loads, _dumps = _std_loads, _std_dumps
+    else:
+        raise ValueError(f'Unknown JSON codec: {name}')
+    codec = name
+
+
+def loads(data):
+    """Parse JSON từ bytes/str"""
+    try:
+        return _loads(data)
+    except ValueError as e:
+        raise InvalidPayload(f'Invalid JSON data: {e}')
+
+
+def dumps(obj):
+    """Serialize obj thành JSON bytes (UTF-8)"""
+    return _dumps(obj)
+
+
+def read_json(req):
+    """Đọc body JSON của Flask request, trả về None nếu body rỗng"""
+    body = req.get_data(cache=False)
+    if not body:
+        return None
+    return loads(body)
+
+
+def json_response(payload, status=200, headers=None):
+    """Tạo Flask Response từ payload bằng codec nhanh"""
+    return Response(dumps(payload), status=status, headers=headers, mimetype='application/json')
+
+
+def validate_email(data):
+    """
+    Kiểm tra một email, trả về thông báo lỗi hoặc None nếu hợp lệ
+    """
+    if not isinstance(data, dict):
+        return 'Email must be a JSON object'
+    for field in REQUIRED_FIELDS:
+        if field not in data:
+            return f'Missing required field: {field}'
+    return None
+
+
+def validate_batch(data):
+    """
+    Kiểm tra payload của /predict/batch trong một lượt duyệt
+
+    Returns:
+        tuple: (emails, method, response_format, error) - error là None nếu hợp lệ
+    """
+    if not data or not isinstance(data, dict) or 'emails' not in data:
+        return None, None, None, 'No emails array provided'
+
+    emails = data['emails']
+    method = data.get('method', 'rule')  # Default to rule-based
+    response_format = data.get('format', 'records')
+
+    if not isinstance(emails, list):
+        return None, None, None, 'emails must be an array'
+    if len(emails) == 0:
+        return None, None, None, 'emails array cannot be empty'
+    if response_format not in RESPONSE_FORMATS:
+        return None, None, None, f'format must be one of: {", ".join(RESPONSE_FORMATS)}'
+
+    # Both methods require same 3 fields
+    for i, email in enumerate(emails):
+        if not isinstance(email, dict):
+            return None, None, None, f'Email {i+1} must be a JSON object'
+        missing = [field for field in REQUIRED_FIELDS if field not in email]
+        if missing:
+            return None, None, None, f'Email {i+1} missing required field: {missing[0]}'
+
+    return emails, method, response_format, None
+
+
+def columnar_results(method, results, id_to_category):
+    """
+    Chuyển danh sách kết quả (records) sang dạng cột gọn cho batch lớn
+
+    Mapping id -> category chỉ được gửi một lần; mỗi email chỉ còn category id,
+    confidence và (với ML) một hàng trong ma trận xác suất theo thứ tự id.
+    """
+    category_to_id = {category: category_id for category_id, category in id_to_category.items()}
+    category_ids = sorted(id_to_category)
+
+    columns = {
+        'id_to_category': {str(category_id): id_to_category[category_id] for category_id in category_ids},
+        'category_ids': [category_to_id[r['category']] for r in results],
+        'confidence': [r['confidence'] for r in results]
+    }
+
+    if any(r.get('near_duplicate') for r in results):
+        columns['near_duplicate_similarity'] = [r.get('similarity') for r in results]
+
+    if method == 'ml':
+        columns['probabilities'] = [
+            [r['probabilities'][id_to_category[category_id]] for category_id in category_ids]
+            for r in results
+        ]
+    else:
+        columns['indicators'] = [r['indicators'] for r in results]
+        columns['level'] = [r['level'] for r in results]
+
+    return columns
@@ -0,0 +1,216 @@
+import collections
+import logging
+import queue
+import random
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_RATE = 0.05          # Tỉ lệ request được gửi sang candidate
+DEFAULT_MAX_QUEUE = 1000            # Hàng đợi đầy: bỏ mẫu thay vì làm chậm request chính
+LATENCY_WINDOW = 2000               # Số mẫu độ trễ gần nhất dùng để tính percentile
+MAX_DISAGREEMENTS = 20              # Số ca lệch gần nhất giữ lại trong báo cáo
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return round(ordered[index], 3)
+
+
+def _latency_summary(values):
+    return {
+        'mean': round(sum(values) / len(values), 3) if values else None,
+        'p50': _percentile(values, 50),
+        'p95': _percentile(values, 95),
+        'samples': len(values)
+    }
+
+
+class ShadowCandidate:
+    """
+    Model/ruleset ứng viên chạy song song với production cho một method
+
+    classify(email) nhận email đã qua content policy và trả về dict có
+    category và confidence (cùng dạng với classifier production).
+    """
+
+    def __init__(self, method, classify, description, version=None, primary_version=None):
+        self.method = method
+        self.classify = classify
+        self.description = description
+        self.version = version
+        self.primary_version = primary_version
+        self.samples = 0
+        self.agreements = 0
+        self.errors = 0
+        self.confidence_delta = 0.0
+        self.confusion = collections.defaultdict(collections.Counter)
+        self.primary_latency = collections.deque(maxlen=LATENCY_WINDOW)
+        self.candidate_latency = collections.deque(maxlen=LATENCY_WINDOW)
+        self.disagreements = collections.deque(maxlen=MAX_DISAGREEMENTS)
+
+    def record(self, primary, primary_ms, candidate, candidate_ms):
+        """Cộng dồn một cặp kết quả (gọi khi đang giữ lock của evaluator)"""
+        self.samples += 1
+        self.confusion[primary['category']][candidate['category']] += 1
+        self.confidence_delta += abs(candidate['confidence'] - primary['confidence'])
+        if primary['category'] == candidate['category']:
+            self.agreements += 1
+        else:
+            # Chỉ giữ verdict, không giữ nội dung email
+            self.disagreements.append({
+                'primary': primary['category'],
+                'candidate': candidate['category'],
+                'primary_confidence': primary['confidence'],
+                'candidate_confidence': candidate['confidence'],
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S')
+            })
+        if primary_ms is not None:
+            self.primary_latency.append(primary_ms)
+        self.candidate_latency.append(candidate_ms)
+
+    def report(self):
+        categories = sorted(set(self.confusion) | {c for row in self.confusion.values() for c in row})
+        per_category = {}
+        for category in categories:
+            primary_total = sum(self.confusion[category].values())
+            per_category[category] = {
+                'primary': primary_total,
+                'candidate': sum(row[category] for row in self.confusion.values()),
+                'agreement': round(self.confusion[category][category] / primary_total, 4) if primary_total else None
+            }
+        return {
+            'candidate': self.description,
+            'candidate_version': self.version,
+            'primary_version': self.primary_version,
+            'samples': self.samples,
+            'errors': self.errors,
+            'agreement': round(self.agreements / self.samples, 4) if self.samples else None,
+            'mean_confidence_delta': round(self.confidence_delta / self.samples, 4) if self.samples else None,
+            'per_category': per_category,
+            'confusion': {primary: dict(row) for primary, row in self.confusion.items()},
+            'latency_ms': {
+                'primary': _latency_summary(list(self.primary_latency)),
+                'candidate': _latency_summary(list(self.candidate_latency))
+            },
+            'recent_disagreements': list(self.disagreements)
+        }
+
+
+class ShadowEvaluator:
+    """
+    Đánh giá shadow: một phần request được sao chép vào hàng đợi có giới hạn
+    và được candidate phân loại trong thread nền, ngoài đường xử lý chính.
+
+    submit() không bao giờ chặn: khi hàng đợi đầy, mẫu bị bỏ và được đếm
+    trong 'dropped'. prepare(email) (ví dụ content policy) cũng chạy trong
+    thread nền để request chính không phải trả thêm chi phí.
+    """
+
+    def __init__(self, candidates, sample_rate=DEFAULT_SAMPLE_RATE, max_queue=DEFAULT_MAX_QUEUE, prepare=None):
+        self.candidates = {candidate.method: candidate for candidate in candidates}
+        self.sample_rate = sample_rate
+        self.max_queue = max_queue
+        self.prepare = prepare
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._random = random.Random()
+        self._stats = {
+            'submitted': 0,
+            'dropped': 0,
+            'processed': 0
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='shadow-evaluator', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, method, email, primary, primary_ms=None):
+        """
+        Gửi một request (với xác suất sample_rate) sang candidate
+
+        Args:
+            method (str): 'rule' hoặc 'ml'
+            email (dict): Email gốc (title, content, from_email)
+            primary (dict): Kết quả production (category, confidence)
+            primary_ms (float): Thời gian phân loại của production, None nếu
+                                kết quả lấy từ cache (không so sánh độ trễ)
+
+        Returns:
+            bool: True nếu mẫu được đưa vào hàng đợi
+        """
+        if method not in self.candidates or self._random.random() >= self.sample_rate:
+            return False
+        return self._enqueue((method, email, primary, primary_ms))
+
+    def submit_batch(self, method, titles, contents, from_emails, results, primary_ms=None):
+        """Lấy mẫu từ một batch dạng cột; primary_ms là thời gian trung bình mỗi email"""
+        if method not in self.candidates or not results:
+            return 0
+        n = len(results)
+        # Làm tròn ngẫu nhiên: kỳ vọng đúng bằng n * sample_rate, không cần random cho từng email
+        k = int(n * self.sample_rate + self._random.random())
+        submitted = 0
+        for i in self._random.sample(range(n), min(k, n)):
+            email = {'title': titles[i], 'content': contents[i], 'from_email': from_emails[i]}
+            if not self._enqueue((method, email, results[i], primary_ms)):
+                break
+            submitted += 1
+        return submitted
+
+    def _enqueue(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped'] += 1
+            return False
+        with self._lock:
+            self._stats['submitted'] += 1
+        return True
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            method, email, primary, primary_ms = item
+            candidate = self.candidates[method]
+            try:
+                # Tính cả bước chuẩn bị như thời gian của production (content policy + phân loại)
+                start_time = time.perf_counter()
+                if self.prepare is not None:
+                    email = self.prepare(email)
+                result = candidate.classify(email)
+                elapsed = (time.perf_counter() - start_time) * 1000
+            except Exception as e:
+                logger.warning(f"Shadow candidate {candidate.description} failed: {e}")
+                with self._lock:
+                    candidate.errors += 1
+                continue
+            with self._lock:
+                candidate.record(primary, primary_ms, result, elapsed)
+                self._stats['processed'] += 1
+
+    def report(self):
+        """Báo cáo độ khớp verdict và độ trễ giữa production và candidate"""
+        with self._lock:
+            report = dict(self._stats)
+            report.update({
+                'sample_rate': self.sample_rate,
+                'queue_size': self._queue.qsize(),
+                'max_queue': self.max_queue,
+                'candidates': {method: candidate.report() for method, candidate in self.candidates.items()}
+            })
+        return report
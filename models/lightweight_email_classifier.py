@@ -4,20 +4,265 @@ Lightweight Email Classifier for Prediction
 Fast and efficient email classification
 """
 
+import hashlib
+import io
+import json
 import pickle
 import os
 import re
+import sys
 import numpy as np
 from datetime import datetime
 
+MODEL_FILE = 'lightweight_email_classifier.pkl'
+
+# Weight precisions supported by the scoring path ('float64' is the original sklearn pipeline)
+PRECISIONS = ('float64', 'float32', 'int8')
+INT8_LEVELS = 127
+
+
+def quantized_model_file(precision):
+    """File name of a pre-quantized model artifact"""
+    return f'lightweight_email_classifier.{precision}.npz'
+
+
+# (npz stat, pkl stat) -> whether the npz was quantized from that pkl
+_quantized_current = {}
+
+
+def source_digest(model_bytes):
+    """sha256 of the pipeline a quantized artifact was built from"""
+    return hashlib.sha256(model_bytes).hexdigest()
+
+
+def _stat_key(path):
+    info = os.stat(path)
+    return info.st_mtime_ns, info.st_size
+
+
+def quantized_is_current(quantized_path, pipeline_path):
+    """Whether a .npz artifact was quantized from the current .pkl (checked once per file change)"""
+    key = (quantized_path, _stat_key(quantized_path), _stat_key(pipeline_path))
+    current = _quantized_current.get(key)
+    if current is None:
+        with np.load(quantized_path, allow_pickle=False) as arrays:
+            config = json.loads(arrays['config'].tobytes().decode('utf-8'))
+        with open(pipeline_path, 'rb') as f:
+            current = config.get('source_sha256') == source_digest(f.read())
+        if not current:
+            print(f"⚠️ {quantized_path} was not built from the current {MODEL_FILE}; "
+                  f"ignoring it (re-run models/quantize_model.py)")
+        _quantized_current[key] = current
+    return current
+
+
+def model_file(model_path, precision='float64'):
+    """
+    Artifact loaded for a precision: the pre-quantized weights if present and
+    built from the current pipeline, otherwise the pipeline
+    """
+    pipeline_path = os.path.join(model_path, MODEL_FILE)
+    quantized_path = os.path.join(model_path, quantized_model_file(precision))
+    if (precision != 'float64' and os.path.exists(quantized_path)
+            and quantized_is_current(quantized_path, pipeline_path)):
+        return quantized_path
+    return pipeline_path
+
+
+def model_version(model_bytes, precision='float64', features=False):
+    """Model version (content hash + precision), used to key cached predictions"""
+    version = hashlib.blake2b(model_bytes, digest_size=8).hexdigest()
+    if precision != 'float64':
+        version += f'-{precision}'
+    if features:
+        version += '-features'
+    return version
+
+
+class QuantizedScorer:
+    """
+    TF-IDF + multinomial logistic regression scoring with reduced-precision weights
+
+    Term counts come from a CountVectorizer sharing the fitted vocabulary and
+    tokenization; IDF weighting, l2 normalisation, the linear layer and the
+    softmax are done here in float32. With 'int8' the coefficients are stored
+    as int8 with one float32 scale per class (symmetric, max-abs).
+    """
+
+    def __init__(self, terms, config, idf, coef, intercept, classes, scales=None):
+        from sklearn.feature_extraction.text import CountVectorizer
+
+        self.terms = terms
+        self.config = config
+        self.precision = config['precision']
+        self.idf = idf
+        self.coef_t = np.ascontiguousarray(coef.T)
+        self.intercept = intercept
+        self.classes = classes
+        self.scales = scales
+        self.vectorizer = CountVectorizer(
+            vocabulary={term: i for i, term in enumerate(terms)},
+            ngram_range=tuple(config['ngram_range']),
+            strip_accents=config['strip_accents'],
+            lowercase=config['lowercase'],
+            token_pattern=config['token_pattern'],
+            dtype=np.float32
+        )
+
+    @classmethod
+    def from_pipeline(cls, pipeline, precision, source_sha256=None):
+        """
+        Post-training quantization of a fitted TfidfVectorizer + LogisticRegression pipeline
+
+        source_sha256 (sha256 of the .pkl) is stored with the weights so that a
+        stale artifact can be detected after the pipeline is retrained.
+        """
+        if precision not in ('float32', 'int8'):
+            raise ValueError(f'Unsupported quantized precision: {precision}')
+        vectorizer = pipeline.steps[0][1]
+        classifier = pipeline.steps[-1][1]
+        if vectorizer.analyzer != 'word' or vectorizer.norm not in ('l2', None) or not vectorizer.use_idf:
+            raise ValueError('Only word analyzers with idf and l2/no norm can be quantized')
+        # Settings the scorer's CountVectorizer does not reproduce
+        unsupported = [name for name in ('stop_words', 'tokenizer', 'preprocessor')
+                       if getattr(vectorizer, name, None) is not None]
+        if vectorizer.binary:
+            unsupported.append('binary')
+        if unsupported:
+            raise ValueError(f'Vectorizer settings cannot be quantized: {", ".join(unsupported)}')
+        if len(classifier.classes_) < 3 or getattr(classifier, 'multi_class', 'auto') == 'ovr':
+            raise ValueError('Only multinomial logistic regression can be quantized')
+
+        terms = [None] * len(vectorizer.vocabulary_)
+        for term, index in vectorizer.vocabulary_.items():
+            terms[index] = term
+        config = {
+            'precision': precision,
+            'ngram_range': list(vectorizer.ngram_range),
+            'strip_accents': vectorizer.strip_accents,
+            'lowercase': vectorizer.lowercase,
+            'token_pattern': vectorizer.token_pattern,
+            'sublinear_tf': vectorizer.sublinear_tf,
+            'norm': vectorizer.norm,
+            'source_sha256': source_sha256
+        }
+
+        coef = classifier.coef_
+        scales = None
+        if precision == 'int8':
+            scales = np.abs(coef).max(axis=1) / INT8_LEVELS
+            scales[scales == 0] = 1.0
+            coef = np.clip(np.round(coef / scales[:, None]), -INT8_LEVELS, INT8_LEVELS).astype(np.int8)
+            scales = scales.astype(np.float32)
+        else:
+            coef = coef.astype(np.float32)
+
+        return cls(terms, config, vectorizer.idf_.astype(np.float32), coef,
+                   classifier.intercept_.astype(np.float32), np.asarray(classifier.classes_), scales)
+
+    def predict_proba(self, texts):
+        """Class probabilities (float32), same layout as pipeline.predict_proba"""
+        X = self.vectorizer.transform(texts)
+        if self.config['sublinear_tf']:
+            np.log(X.data, out=X.data)
+            X.data += 1
+        X.data *= self.idf[X.indices]
+        if self.config['norm'] == 'l2':
+            row_lengths = np.diff(X.indptr)
+            norms = np.zeros(len(row_lengths), dtype=np.float32)
+            nonempty = row_lengths > 0
+            norms[nonempty] = np.sqrt(np.add.reduceat(X.data * X.data, X.indptr[:-1][nonempty]))
+            norms[~nonempty] = 1.0
+            X.data /= np.repeat(norms, row_lengths)
+
+        scores = X @ self.coef_t
+        if self.scales is not None:
+            scores *= self.scales
+        scores += self.intercept
+
+        # Softmax
+        scores -= scores.max(axis=1, keepdims=True)
+        np.exp(scores, out=scores)
+        scores /= scores.sum(axis=1, keepdims=True)
+        return scores
+
+    @property
+    def nbytes(self):
+        """Memory used by the numeric weights"""
+        arrays = (self.idf, self.coef_t, self.intercept, self.scales)
+        return sum(array.nbytes for array in arrays if array is not None)
+
+    def dumps(self):
+        """Serialize to .npz bytes (loading does not need pickle)"""
+        arrays = {
+            'terms': np.frombuffer('\n'.join(self.terms).encode('utf-8'), dtype=np.uint8),
+            'config': np.frombuffer(json.dumps(self.config).encode('utf-8'), dtype=np.uint8),
+            'idf': self.idf,
+            'coef': np.ascontiguousarray(self.coef_t.T),
+            'intercept': self.intercept,
+            'classes': self.classes
+        }
+        if self.scales is not None:
+            arrays['scales'] = self.scales
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        return buffer.getvalue()
+
+    @classmethod
+    def loads(cls, data):
+        """Load from bytes written by dumps()"""
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            terms = arrays['terms'].tobytes().decode('utf-8').split('\n')
+            config = json.loads(arrays['config'].tobytes().decode('utf-8'))
+            scales = arrays['scales'] if 'scales' in arrays.files else None
+            return cls(terms, config, arrays['idf'], arrays['coef'], arrays['intercept'],
+                       arrays['classes'], scales)
+
+
 class LightweightEmailClassifier:
-    def __init__(self, model_path='models'):
-        """Initialize the classifier"""
+    """
+    TF-IDF + Logistic Regression email classifier
+
+    Prediction only reads the fitted model, so one instance can serve several
+    threads at once. Call warm_up() before concurrent use so the vectorizer's
+    lazily initialised state is built once, outside request handling.
+    """
+
+    def __init__(self, model_path='models', precision='float64', feature_tokens=None):
+        """
+        Initialize the classifier
+        
+        Args:
+            model_path (str): Directory containing the model files
+            precision (str): Weight precision: 'float64' (original pipeline),
+                'float32' or 'int8'. Reduced precisions load a pre-quantized
+                artifact if present, otherwise quantize the pipeline on load.
+            feature_tokens (callable): Optional (title, content, from_email) -> list
+                of extra tokens (e.g. structured URL/sender features) appended to
+                the preprocessed text. Only useful with a model trained on them.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f'precision must be one of: {", ".join(PRECISIONS)}')
         self.model_path = model_path
+        self.precision = precision
+        self.pipeline = None
+        self.scorer = None
+        self.feature_tokens = feature_tokens
         
         # Load model
-        with open(os.path.join(model_path, 'lightweight_email_classifier.pkl'), 'rb') as f:
-            self.pipeline = pickle.load(f)
+        path = model_file(model_path, precision)
+        with open(path, 'rb') as f:
+            model_bytes = f.read()
+        if path != os.path.join(model_path, MODEL_FILE):
+            self.scorer = QuantizedScorer.loads(model_bytes)
+        else:
+            self.pipeline = pickle.loads(model_bytes)
+            if precision != 'float64':
+                # Only the quantized weights are kept in memory
+                self.scorer = QuantizedScorer.from_pipeline(self.pipeline, precision, source_digest(model_bytes))
+                self.pipeline = None
+        
+        self.version = model_version(model_bytes, precision, feature_tokens is not None)
         
         # Load mappings
         with open(os.path.join(model_path, 'category_mapping.pkl'), 'rb') as f:
@@ -26,8 +271,32 @@ class LightweightEmailClassifier:
         with open(os.path.join(model_path, 'id_to_category.pkl'), 'rb') as f:
             self.id_to_category = pickle.load(f)
         
+        if feature_tokens is not None and not self.known_feature_tokens():
+            print("⚠️ Model vocabulary has no feature tokens; they will be ignored until the model is retrained")
+        
         print("✅ Lightweight classifier loaded successfully")
     
+    def warm_up(self):
+        """Run one prediction to build lazily initialised vectorizer state"""
+        self.predict_many(['warm up'], ['warm up prediction'], [''])
+    
+    def memory_bytes(self):
+        """Approximate memory held by the loaded model (weights, vocabulary, mappings)"""
+        seen = set()
+        return sum(_deep_sizeof(part, seen) for part in
+                   (self.pipeline, self.scorer, self.category_mapping, self.id_to_category))
+    
+    def vocabulary(self):
+        """Terms known to the fitted vectorizer"""
+        if self.scorer is not None:
+            return self.scorer.terms
+        return self.pipeline.steps[0][1].vocabulary_
+    
+    def known_feature_tokens(self):
+        """Feature tokens (url_*, urlhost_*, sender_*) present in the model vocabulary"""
+        prefixes = ('url_', 'urlhost_', 'sender_tld_', 'sender_domain_')
+        return [term for term in self.vocabulary() if term.startswith(prefixes)]
+    
     def preprocess_text(self, text):
         """Preprocess text for prediction"""
         if not text:
@@ -56,71 +325,81 @@ class LightweightEmailClassifier:
         Returns:
             dict: Prediction result with category, confidence, and probabilities
         """
-        start_time = datetime.now()
+        return self.predict_many([title], [content], [from_email])[0]
+    
+    def predict_many(self, titles, contents, from_emails):
+        """
+        Predict many emails given as parallel columns with a single
+        vectorized predict_proba call
         
-        # Preprocess text
-        title_clean = self.preprocess_text(title)
-        content_clean = self.preprocess_text(content)
-        from_email_clean = self.preprocess_text(from_email)
+        Args:
+            titles (list): Email subjects
+            contents (list): Email body contents
+            from_emails (list): Sender emails
+            
+        Returns:
+            list: Prediction results in input order (same format as predict)
+        """
+        start_time = datetime.now()
+        preprocess = self.preprocess_text
         
         # Combine text (title, content, from_email)
-        text_combined = title_clean + ' ' + content_clean + ' ' + from_email_clean
-        
-        if len(text_combined.strip()) < 5:
-            return {
-                'category': 'Nghi ngờ',
-                'confidence': 0.5,
-                'probabilities': {
-                    'An toàn': 0.25,
-                    'Nghi ngờ': 0.5,
-                    'Spam': 0.125,
-                    'Giả mạo': 0.125
-                },
-                'processing_time': 0.001,
-                'warning': 'Text too short for reliable classification'
-            }
+        texts = [
+            preprocess(title) + ' ' + preprocess(content) + ' ' + preprocess(from_email)
+            for title, content, from_email in zip(titles, contents, from_emails)
+        ]
+        
+        results = [None] * len(texts)
+        valid = []
+        for i, text in enumerate(texts):
+            if len(text.strip()) < 5:
+                results[i] = _fallback_result(warning='Text too short for reliable classification')
+            else:
+                valid.append(i)
+        
+        if not valid:
+            return results
+        
+        model_texts = [texts[i] for i in valid]
+        # Structured URL/sender features survive as whole tokens (preprocess_text splits URLs apart)
+        if self.feature_tokens is not None:
+            extract = self.feature_tokens
+            model_texts = [
+                text + ' ' + ' '.join(extract(titles[i], contents[i], from_emails[i]))
+                for text, i in zip(model_texts, valid)
+            ]
         
         # Make prediction
         try:
-            # Get probabilities
-            probabilities = self.pipeline.predict_proba([text_combined])[0]
-            
-            # Get predicted class
-            predicted_class = np.argmax(probabilities)
-            confidence = probabilities[predicted_class]
-            
-            # Get category name
-            category = self.id_to_category[predicted_class]
-            
-            # Create probability dict
-            prob_dict = {
-                self.id_to_category[i]: float(prob)
-                for i, prob in enumerate(probabilities)
-            }
-            
-            processing_time = (datetime.now() - start_time).total_seconds()
-            
-            return {
-                'category': category,
-                'confidence': float(confidence),
-                'probabilities': prob_dict,
-                'processing_time': processing_time,
-                'text_length': len(text_combined)
-            }
-            
+            probabilities = self.predict_proba(model_texts)
         except Exception as e:
-            return {
-                'category': 'Nghi ngờ',
-                'confidence': 0.5,
-                'probabilities': {
-                    'An toàn': 0.25,
-                    'Nghi ngờ': 0.5,
-                    'Spam': 0.125,
-                    'Giả mạo': 0.125
-                },
-                'processing_time': 0.001,
-                'error': str(e)
+            for i in valid:
+                results[i] = _fallback_result(error=str(e))
+            return results
+        
+        # Get predicted classes and category names
+        predicted_classes = np.argmax(probabilities, axis=1)
+        categories = [self.id_to_category[i] for i in range(probabilities.shape[1])]
+        processing_time = (datetime.now() - start_time).total_seconds() / len(valid)
+        
+        for row, i in enumerate(valid):
+            row_probabilities = probabilities[row].tolist()
+            predicted_class = predicted_classes[row]
+            results[i] = {
+                'category': categories[predicted_class],
+                'confidence': row_probabilities[predicted_class],
+                'probabilities': dict(zip(categories, row_probabilities)),
+                'processing_time': processing_time,
+                'text_length': len(texts[i])
             }
+        
+        return results
+    
+    def predict_proba(self, texts):
+        """Class probabilities for preprocessed texts at the configured precision"""
+        if self.scorer is not None:
+            return self.scorer.predict_proba(texts)
+        return self.pipeline.predict_proba(texts)
     
     def predict_batch(self, emails):
         """
@@ -132,18 +411,45 @@ class LightweightEmailClassifier:
         Returns:
             list: List of prediction results
         """
-        results = []
-        
-        for email in emails:
-            title = email.get('title', '')
-            content = email.get('content', '')
-            from_email = email.get('from_email', '')
-            to_email = email.get('to_email', '')
-            
-            result = self.predict(title, content, from_email, to_email)
-            results.append(result)
-        
-        return results
+        return self.predict_many(
+            [email.get('title', '') for email in emails],
+            [email.get('content', '') for email in emails],
+            [email.get('from_email', '') for email in emails]
+        )
+
+
+def _deep_sizeof(obj, seen):
+    """Size of an object graph: containers, numpy arrays and instance attributes"""
+    if obj is None or id(obj) in seen or isinstance(obj, type):
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj) + (obj.nbytes if obj.base is None else 0)
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        return size + sum(_deep_sizeof(key, seen) + _deep_sizeof(value, seen) for key, value in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(_deep_sizeof(value, seen) for value in obj)
+    if hasattr(obj, '__dict__'):
+        size += _deep_sizeof(vars(obj), seen)
+    return size
+
+
+def _fallback_result(**extra):
+    """Default result used when the model cannot classify an email"""
+    result = {
+        'category': 'Nghi ngờ',
+        'confidence': 0.5,
+        'probabilities': {
+            'An toàn': 0.25,
+            'Nghi ngờ': 0.5,
+            'Spam': 0.125,
+            'Giả mạo': 0.125
+        },
+        'processing_time': 0.001
+    }
+    result.update(extra)
+    return result
 
 # Example usage
 if __name__ == "__main__":
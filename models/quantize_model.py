@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Post-training quantization of the TF-IDF + Logistic Regression model
+
+Writes lightweight_email_classifier.<precision>.npz next to the .pkl model.
+LightweightEmailClassifier(precision=...) loads that artifact when present and
+built from the current .pkl (otherwise it quantizes the .pkl on load).
+
+Usage:
+    python models/quantize_model.py [--precision float32|int8|all] [--model-path models]
+"""
+
+import argparse
+import os
+import pickle
+
+from lightweight_email_classifier import MODEL_FILE, QuantizedScorer, quantized_model_file, source_digest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--precision', default='all', choices=['float32', 'int8', 'all'])
+    parser.add_argument('--model-path', default=os.path.dirname(os.path.abspath(__file__)))
+    args = parser.parse_args()
+
+    with open(os.path.join(args.model_path, MODEL_FILE), 'rb') as f:
+        model_bytes = f.read()
+    pipeline = pickle.loads(model_bytes)
+
+    precisions = ['float32', 'int8'] if args.precision == 'all' else [args.precision]
+    for precision in precisions:
+        scorer = QuantizedScorer.from_pipeline(pipeline, precision, source_digest(model_bytes))
+        path = os.path.join(args.model_path, quantized_model_file(precision))
+        data = scorer.dumps()
+        with open(path, 'wb') as f:
+            f.write(data)
+        print(f"✅ {precision}: {path} ({len(data):,} bytes, weights {scorer.nbytes:,} bytes)")
+
+
+if __name__ == '__main__':
+    main()
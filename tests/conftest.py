@@ -0,0 +1,22 @@
+import os
+import sys
+
+import pytest
+
+# Các module của API import lẫn nhau như module top-level (chạy từ email_classification_module/)
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'email_classification_module'))
+
+
+@pytest.fixture(scope='session')
+def backend():
+    """api_backend đã load classifiers (mọi tác vụ chạy trên thread), không có cache kết quả, job nền hay shadow"""
+    import api_backend
+    api_backend.RESULT_CACHE_ENABLED = False
+    api_backend.JOBS_ENABLED = False
+    api_backend.SHADOW_ENABLED = False
+    api_backend.EXECUTION_MODE = 'thread'
+    api_backend.init_classifiers()
+    yield api_backend
+    if api_backend.executor is not None:
+        api_backend.executor.shutdown()
@@ -0,0 +1,33 @@
+import pytest
+
+TOKEN = 's3cret-token'
+
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
+
+
+@pytest.mark.parametrize('path', ['/admin/memory', '/admin/models'])
+def test_admin_endpoints_are_disabled_without_token(backend, client, monkeypatch, path):
+    monkeypatch.setattr(backend, 'ADMIN_TOKEN', None)
+    response = client.post(path, json={'action': 'refresh'}, headers={'X-Admin-Token': ''})
+    assert response.status_code == 404
+    assert not backend.diagnostics.enabled
+
+
+@pytest.mark.parametrize('headers', [{}, {'X-Admin-Token': 'wrong'}, {'X-Admin-Token': TOKEN + 'x'}])
+def test_wrong_token_is_rejected(backend, client, monkeypatch, headers):
+    monkeypatch.setattr(backend, 'ADMIN_TOKEN', TOKEN)
+    assert client.post('/admin/memory', json={'action': 'start'}, headers=headers).status_code == 403
+    assert client.post('/admin/models', json={'action': 'refresh'}, headers=headers).status_code == 403
+    assert not backend.diagnostics.enabled
+
+
+def test_valid_token_is_accepted(backend, client, monkeypatch):
+    monkeypatch.setattr(backend, 'ADMIN_TOKEN', TOKEN)
+    response = client.get('/admin/memory?top=0', headers={'X-Admin-Token': TOKEN})
+    assert response.status_code == 200
+    assert response.get_json()['success']
+    response = client.post('/admin/models', json={'action': 'refresh'}, headers={'X-Admin-Token': TOKEN})
+    assert response.status_code == 200
@@ -0,0 +1,138 @@
+import asyncio
+import json
+
+import pytest
+
+import asgi_backend
+from asgi_backend import AsyncEmailClassificationApp, Backpressure
+
+EMAIL = {'title': 'Thông báo khẩn', 'content': 'Tài khoản của bạn sẽ bị khóa', 'from_email': 'a@b.tk'}
+
+
+@pytest.fixture
+def make_app(backend):
+    """App ASGI dùng classifiers đã load của api_backend (không shutdown executor dùng chung)"""
+    apps = []
+
+    def make(**options):
+        app = AsyncEmailClassificationApp(workers=2, **options)
+        apps.append(app)
+        return app
+
+    yield make
+    for app in apps:
+        if app.executor is not None:
+            app.executor.shutdown()
+
+
+def request(app, method, path, chunks=(b'',), before_body=None):
+    """Gửi một request ASGI; trả về (status, headers, payload)"""
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    sent = []
+
+    async def receive():
+        if before_body is not None:
+            await before_body.wait()
+        return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+    async def send(message):
+        sent.append(message)
+
+    async def call():
+        await app({'type': 'http', 'method': method, 'path': path, 'headers': []}, receive, send)
+        return sent[0]['status'], dict(sent[0]['headers']), json.loads(sent[1]['body'])
+
+    return call()
+
+
+def test_queue_full_returns_429_with_retry_after(make_app):
+    app = make_app(max_concurrency=1, max_queue=0)
+    body = json.dumps(EMAIL).encode()
+
+    async def scenario():
+        release = asyncio.Event()
+        # Request đầu giữ chỗ duy nhất trong lúc đọc body
+        first = asyncio.ensure_future(request(app, 'POST', '/predict/rule', (body,), release))
+        await asyncio.sleep(0.05)
+        rejected = await request(app, 'POST', '/predict/rule', (body,))
+        release.set()
+        return await first, rejected
+
+    (status, _, payload), (rejected_status, headers, rejected) = asyncio.run(scenario())
+    assert status == 200 and payload['category']
+    assert rejected_status == 429 and not rejected['success']
+    assert headers[b'retry-after'] == str(asgi_backend.RETRY_AFTER_SECONDS).encode()
+    assert app.backpressure.stats()['rejected'] == 1
+
+
+def test_backpressure_counts_waiting_requests():
+    backpressure = Backpressure(max_concurrency=1, max_queue=1)
+
+    async def scenario():
+        assert backpressure.try_enter()
+        async with backpressure:
+            assert backpressure.try_enter()
+            waiter = asyncio.ensure_future(backpressure.__aenter__())
+            await asyncio.sleep(0)
+            assert not backpressure.try_enter()
+        await waiter
+        await backpressure.__aexit__(None, None, None)
+
+    asyncio.run(scenario())
+    assert backpressure.stats() == {'in_flight': 0, 'waiting': 0, 'max_concurrency': 1, 'max_queue': 1,
+                                    'accepted': 2, 'rejected': 1}
+
+
+def test_oversized_body_is_rejected(make_app, monkeypatch):
+    monkeypatch.setattr(asgi_backend, 'MAX_BODY_BYTES', 64)
+    status, _, payload = asyncio.run(request(make_app(), 'POST', '/predict/rule', (b'{"title": "', b'x' * 100)))
+    assert status == 400
+    assert payload['error'] == 'Request body exceeds 64 bytes'
+
+
+def test_invalid_email_is_rejected(make_app):
+    status, _, payload = asyncio.run(request(make_app(), 'POST', '/predict/ml', (b'{"title": 1}',)))
+    assert status == 400 and not payload['success']
+
+
+def test_combined_runs_policy_and_admission_once(backend, make_app, monkeypatch):
+    applied = []
+    apply = backend.content_policy.apply
+    monkeypatch.setattr(backend.content_policy, 'apply', lambda data: applied.append(data) or apply(data))
+    admitted = backend.overload_controller.stats()['admitted']
+
+    status, _, payload = asyncio.run(request(make_app(), 'POST', '/predict/combined', (json.dumps(EMAIL).encode(),)))
+
+    assert status == 200
+    assert (payload['method'], payload['degraded']) == ('combined', False)
+    assert payload['rule_based']['method'] == 'rule_based'
+    assert payload['ml_classifier']['method'] == 'ml_classifier'
+    assert payload['agreement'] == (payload['rule_based']['category'] == payload['ml_classifier']['category'])
+    assert len(applied) == 1
+    stats = backend.overload_controller.stats()
+    assert (stats['admitted'], stats['in_flight']) == (admitted + 1, 0)
+
+
+def test_combined_matches_single_endpoints(backend, make_app):
+    app = make_app()
+    body = json.dumps(EMAIL).encode()
+    _, _, combined = asyncio.run(request(app, 'POST', '/predict/combined', (body,)))
+    _, _, rule = asyncio.run(request(app, 'POST', '/predict/rule', (body,)))
+    _, _, ml = asyncio.run(request(app, 'POST', '/predict/ml', (body,)))
+    for key in ('category', 'confidence', 'indicators'):
+        assert combined['rule_based'][key] == rule[key]
+    assert combined['ml_classifier']['probabilities'] == ml['probabilities']
+
+
+def test_concurrent_first_requests_start_once(make_app, monkeypatch):
+    app = make_app()
+    created = []
+    pool = asgi_backend.ThreadPoolExecutor
+    monkeypatch.setattr(asgi_backend, 'ThreadPoolExecutor', lambda **options: created.append(options) or pool(**options))
+
+    async def scenario():
+        return await asyncio.gather(*(request(app, 'GET', '/health') for _ in range(8)))
+
+    assert [status for status, _, _ in asyncio.run(scenario())] == [200] * 8
+    assert len(created) == 1
@@ -0,0 +1,45 @@
+import pytest
+
+import columnar_input
+from columnar_input import ARROW_FILE_TYPE, ARROW_STREAM_TYPE, decode_columns
+from serialization import InvalidPayload
+
+pyarrow = pytest.importorskip('pyarrow')
+
+
+def arrow_body(table, file_format=False):
+    sink = pyarrow.BufferOutputStream()
+    open_writer = pyarrow.ipc.new_file if file_format else pyarrow.ipc.new_stream
+    with open_writer(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+@pytest.mark.parametrize('file_format, mimetype', [(False, ARROW_STREAM_TYPE), (True, ARROW_FILE_TYPE)])
+def test_arrow_columns_become_python_strings(file_format, mimetype):
+    table = pyarrow.table({
+        'title': ['Khuyến mãi', None],
+        'content': ['Giảm giá 50%', 'Nội dung'],
+        'from_email': ['shop@ban.vn', 'a@b.vn'],
+    }).replace_schema_metadata({'method': 'ml', 'format': 'columnar'})
+    columns = decode_columns(arrow_body(table, file_format), mimetype)
+
+    assert columns.titles == ['Khuyến mãi', '']
+    assert columns.contents == ['Giảm giá 50%', 'Nội dung']
+    assert all(type(title) is str for title in columns.titles)
+    assert (columns.method, columns.format, columns.model) == ('ml', 'columnar', None)
+
+
+@pytest.mark.parametrize('table, error', [
+    ({'title': ['a'], 'content': ['b']}, 'Missing required column: from_email'),
+    ({'title': ['a'], 'content': ['b'], 'from_email': [1]}, 'Column from_email must be a string column'),
+])
+def test_invalid_arrow_columns_are_rejected(table, error):
+    with pytest.raises(InvalidPayload, match=error):
+        decode_columns(arrow_body(pyarrow.table(table)), ARROW_STREAM_TYPE)
+
+
+def test_arrow_requires_pyarrow(monkeypatch):
+    monkeypatch.setattr(columnar_input, 'pyarrow', None)
+    with pytest.raises(InvalidPayload, match='requires pyarrow'):
+        decode_columns(b'x', ARROW_STREAM_TYPE)
@@ -0,0 +1,73 @@
+import time
+
+import pytest
+
+from content_policy import RAW_WINDOW_FACTOR, ContentPolicy, strip_html
+
+# Input gây backtracking với các regex bỏ HTML cũ (nhiều giây tới vài phút cho mỗi email)
+PATHOLOGICAL = {
+    'unclosed_links': '<a href=' * 20000,
+    'unclosed_comments': '<!--' * 20000,
+    'unclosed_head': '<head' * 16000,
+    'unclosed_tags': '<' * 80000,
+    'unclosed_scripts': '<script>' * 10000,
+    'long_tag': '<a ' * 30000 + '>',
+}
+
+
+@pytest.fixture
+def policy():
+    return ContentPolicy()
+
+
+@pytest.mark.parametrize('name', sorted(PATHOLOGICAL))
+def test_pathological_html_is_linear(policy, name):
+    content = PATHOLOGICAL[name]
+    assert len(content) >= policy.max_chars * RAW_WINDOW_FACTOR
+    start_time = time.perf_counter()
+    policy.clean_content(content)
+    assert time.perf_counter() - start_time < 1.0
+
+
+def test_strip_html_keeps_links_and_text():
+    content = ('<html><head><title>Ẩn</title><style>p {color: red}</style></head><body>'
+               '<p>Tài khoản của bạn&nbsp;bị khóa</p><!-- tracking -->'
+               '<a class="btn" href="http://bit.ly/verify">Xác minh</a><br/>'
+               '<script>alert(1)</script>Trân trọng</body></html>')
+    assert strip_html(content) == 'Tài khoản của bạn\xa0bị khóa\n  http://bit.ly/verify Xác minh \n Trân trọng'
+
+
+def test_stray_angle_brackets_are_text():
+    assert strip_html('<p>1 < 2 và 3 > 2</p>') == '1 < 2 và 3 > 2'
+    assert strip_html('<b>giá <a') == 'giá <a'
+
+
+def test_plain_text_with_addresses_is_not_stripped(policy):
+    content = 'Gửi từ Nguyễn An <an@corp.vn>\n\n  Xem <https://example.com/x>  '
+    assert policy.clean_content(content) == content
+
+
+def test_html_mode_only_on_real_tags(policy):
+    assert policy.clean_content('Xin chào <br> bạn') == 'Xin chào \n bạn'
+    assert policy.clean_content('a <b@c.vn> d') == 'a <b@c.vn> d'
+
+
+def test_oversized_content_keeps_head_and_tail():
+    policy = ContentPolicy(max_chars=100, max_tokens=None, head_ratio=0.75)
+    content = 'đầu ' + 'x' * 1000 + ' cuối'
+    cleaned = policy.clean_content(content)
+    assert len(cleaned) == 101
+    assert cleaned.startswith('đầu ') and cleaned.endswith(' cuối')
+    assert '\n' in cleaned
+
+
+def test_token_cap_keeps_head_and_tail():
+    policy = ContentPolicy(max_tokens=4, head_ratio=0.5)
+    assert policy.clean_content('một hai ba bốn năm sáu') == 'một hai\nnăm sáu'
+
+
+def test_quoted_reply_is_kept_unless_enabled():
+    content = 'Vui lòng xác minh ngay\nOn Mon, A wrote:\n> tin cũ'
+    assert ContentPolicy().clean_content(content) == content
+    stripped = ContentPolicy(strip_quoted=True, max_quoted_chars=0).clean_content(content)
+    assert stripped == 'Vui lòng xác minh ngay'
@@ -0,0 +1,82 @@
+import tracemalloc
+
+import pytest
+
+from diagnostics import MemoryDiagnostics, rss_bytes
+
+
+@pytest.fixture
+def diagnostics():
+    diagnostics = MemoryDiagnostics()
+    yield diagnostics
+    diagnostics.stop()
+
+
+def test_disabled_stage_is_a_shared_noop(diagnostics):
+    assert diagnostics.stage('parse') is diagnostics.stage('classify')
+    with diagnostics.stage('parse'):
+        pass
+    report = diagnostics.report()
+    assert report['enabled'] is False and 'stages' not in report
+    assert diagnostics.top_allocations() == []
+    assert not diagnostics.reset()
+
+
+def test_stage_records_allocated_bytes(diagnostics):
+    assert diagnostics.start(frames=1, rss_interval=60)
+    assert not diagnostics.start()
+    kept = []
+    for _ in range(3):
+        with diagnostics.stage('allocate'):
+            kept.append(bytearray(256 * 1024))
+    with diagnostics.stage('noop'):
+        pass
+
+    report = diagnostics.report(top=5)
+    allocate = report['stages']['allocate']
+    assert allocate['calls'] == 3
+    assert allocate['min_bytes'] >= 256 * 1024
+    assert allocate['net_bytes'] >= 3 * 256 * 1024
+    assert report['stages']['noop']['calls'] == 1
+    assert report['rss']['interval_seconds'] == 60 and report['rss_bytes'] > 0
+    assert any(site['size_diff'] >= 256 * 1024 for site in report['top_allocations'])
+
+    assert diagnostics.reset()
+    assert diagnostics.report(top=0)['stages'] == {}
+
+
+def test_stop_only_stops_tracemalloc_it_started(diagnostics):
+    diagnostics.start(frames=1, rss_interval=60)
+    assert tracemalloc.is_tracing()
+    assert diagnostics.stop()
+    assert not tracemalloc.is_tracing()
+    assert not diagnostics.stop()
+
+    tracemalloc.start()
+    try:
+        diagnostics.start(rss_interval=60)
+        diagnostics.stop()
+        assert tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
+
+
+def test_rss_is_measured():
+    assert rss_bytes() > 0
+
+
+def test_admin_memory_actions(backend, monkeypatch):
+    monkeypatch.setattr(backend, 'ADMIN_TOKEN', 'token')
+    client = backend.app.test_client()
+    headers = {'X-Admin-Token': 'token'}
+    try:
+        response = client.post('/admin/memory', json={'action': 'start', 'frames': 1}, headers=headers)
+        assert response.get_json()['enabled'] is True
+        client.post('/predict/rule', json={'title': 'a', 'content': 'b', 'from_email': 'c@d.vn'})
+        report = client.get('/admin/memory?top=3', headers=headers).get_json()
+        assert {'parse', 'content_policy', 'classify_rule', 'serialize'} <= set(report['stages'])
+        assert len(report['top_allocations']) <= 3
+    finally:
+        response = client.post('/admin/memory', json={'action': 'stop'}, headers=headers)
+    assert response.get_json()['enabled'] is False
+    assert not backend.diagnostics.enabled
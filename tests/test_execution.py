@@ -0,0 +1,141 @@
+import json
+import os
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import execution
+from execution import DEFAULT_POLICY, MAX_POOL_FAILURES, TASKS, ClassifierExecutor, load_policy
+
+PROCESS_POLICY = {task: 'process' for task in TASKS}
+
+
+def write_policy(tmp_path, data):
+    path = tmp_path / 'policy.json'
+    path.write_text(json.dumps(data), encoding='utf-8')
+    return str(path)
+
+
+def exit_in_worker(parent_pid):
+    """Làm chết worker process (không làm gì khi chạy trên thread của process chính)"""
+    if os.getpid() != parent_pid:
+        os._exit(1)
+    return 'thread'
+
+
+class BrokenPool:
+    def submit(self, *args):
+        raise BrokenProcessPool('worker died')
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+@pytest.mark.parametrize('cpus, servers, expected', [
+    (8, None, DEFAULT_POLICY),
+    (8, '4', DEFAULT_POLICY),
+    (8, '8', {task: 'thread' for task in TASKS}),
+    (1, None, {task: 'thread' for task in TASKS}),
+])
+def test_default_policy_depends_on_cpus_per_server(monkeypatch, cpus, servers, expected):
+    monkeypatch.setattr(execution.os, 'cpu_count', lambda: cpus)
+    if servers is None:
+        monkeypatch.delenv(execution.SERVER_PROCESSES_ENV, raising=False)
+    else:
+        monkeypatch.setenv(execution.SERVER_PROCESSES_ENV, servers)
+    assert load_policy() == expected
+
+
+def test_process_workers_are_shared_between_server_processes(monkeypatch):
+    monkeypatch.setattr(execution.os, 'cpu_count', lambda: 32)
+    monkeypatch.setenv(execution.SERVER_PROCESSES_ENV, '8')
+    assert execution.default_process_workers() == 4
+    monkeypatch.setenv(execution.SERVER_PROCESSES_ENV, '1')
+    assert execution.default_process_workers() == execution.MAX_PROCESS_WORKERS
+
+
+def test_policy_file_overrides_defaults(tmp_path, monkeypatch):
+    monkeypatch.setattr(execution.os, 'cpu_count', lambda: 1)
+    policy = load_policy(write_policy(tmp_path, {'policy': {'batch_ml': 'process'}}))
+    assert policy == {'rule': 'thread', 'ml': 'thread', 'batch_rule': 'thread', 'batch_ml': 'process'}
+
+
+@pytest.mark.parametrize('data, message', [
+    ({'policy': {'gpu': 'thread'}}, 'Unknown task "gpu"'),
+    ({'ml': 'fiber'}, 'Unknown mode "fiber" for ml'),
+])
+def test_invalid_policy_file_is_rejected(tmp_path, data, message):
+    with pytest.raises(ValueError, match=message):
+        load_policy(write_policy(tmp_path, data))
+
+
+def test_broken_pool_falls_back_to_thread():
+    executor = ClassifierExecutor(PROCESS_POLICY, process_workers=1, initializer=None)
+    try:
+        assert executor.call('ml', exit_in_worker, os.getpid()) == 'thread'
+        stats = executor.stats()
+        assert stats['calls']['ml'] == {'thread': 0, 'process': 0, 'fallback': 1}
+        assert (stats['process_pool_started'], stats['process_pool_failures']) == (False, 1)
+    finally:
+        executor.shutdown()
+
+
+def test_broken_pool_is_rebuilt_after_backoff(monkeypatch):
+    executor = ClassifierExecutor(PROCESS_POLICY, process_workers=1, initializer=None)
+    executor._processes = BrokenPool()
+    assert executor.call('ml', os.getpid) == os.getpid()
+
+    # Trong thời gian chờ: chạy trên thread, không tạo pool mới
+    assert executor.call('ml', os.getpid) == os.getpid()
+    assert executor.stats()['process_pool_started'] is False
+    assert executor.executor('ml') is executor.thread_pool()
+
+    monkeypatch.setattr(execution.time, 'monotonic', lambda: executor._retry_at)
+    created = []
+    monkeypatch.setattr(executor, 'process_pool', lambda: created.append(1) or BrokenPool())
+    executor.call('ml', os.getpid)
+    assert created == [1]
+    executor.shutdown()
+
+
+def test_repeated_failures_disable_processes_until_restart(monkeypatch):
+    monkeypatch.setattr(execution, 'POOL_RETRY_SECONDS', 0.0)
+    executor = ClassifierExecutor(PROCESS_POLICY, process_workers=1, initializer=None)
+    for _ in range(MAX_POOL_FAILURES):
+        executor._processes = BrokenPool()
+        executor.call('batch_ml', os.getpid)
+    stats = executor.stats()
+    assert (stats['process_pool_disabled'], stats['process_pool_failures']) == (True, MAX_POOL_FAILURES)
+
+    executor._processes = BrokenPool()
+    assert executor.call('batch_ml', os.getpid) == os.getpid()
+    assert executor.stats()['calls']['batch_ml']['fallback'] == MAX_POOL_FAILURES + 1
+
+    executor._processes = None
+    assert executor.restart()
+    assert executor.processes_available()
+    assert not executor.stats()['process_pool_disabled']
+    executor.shutdown()
+
+
+def test_restart_replaces_worker_processes():
+    executor = ClassifierExecutor(PROCESS_POLICY, process_workers=1, initializer=None)
+    try:
+        assert not executor.restart()
+        first = executor.call('ml', os.getpid)
+        assert first != os.getpid()
+
+        assert executor.restart()
+        second = executor.call('ml', os.getpid)
+        assert second not in (first, os.getpid())
+        stats = executor.stats()
+        assert (stats['process_pool_restarts'], stats['calls']['ml']['process']) == (1, 2)
+    finally:
+        executor.shutdown()
+
+
+def test_thread_policy_runs_on_calling_thread():
+    executor = ClassifierExecutor({task: 'thread' for task in TASKS}, initializer=None)
+    assert executor.call('rule', os.getpid) == os.getpid()
+    assert not executor.uses_processes()
+    assert executor.stats()['calls']['rule']['thread'] == 1
@@ -0,0 +1,173 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+import job_queue
+from job_queue import MAX_ATTEMPTS, JobRunner, JobStore
+
+TITLES = [f'title {i}' for i in range(5)]
+CONTENTS = [f'content {i}' for i in range(5)]
+FROM_EMAILS = [f'user{i}@example.com' for i in range(5)]
+NO_REUSE = {'cache_hits': 0, 'near_duplicate_hits': 0}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.sqlite3'), chunk_size=2)
+
+
+def create(store, model=None):
+    return store.create('rule', TITLES, CONTENTS, FROM_EMAILS, model=model)['id']
+
+
+def classify_chunk(titles):
+    return [{'category': 'An toàn', 'title': title} for title in titles]
+
+
+def dead_owner():
+    """Owner của một process trên máy này đã kết thúc"""
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return f'{socket.gethostname()}:{process.pid}:1'
+
+
+def test_claim_returns_method_and_model(store):
+    job_id = create(store, model='acme/vi')
+    assert store.claim('worker') == {'id': job_id, 'method': 'rule', 'model': 'acme/vi'}
+    assert store.claim('other') is None
+    job = store.get(job_id)
+    assert (job['status'], job['attempts']) == ('running', 1)
+
+
+def test_job_resumes_after_crash_from_unfinished_chunk(store):
+    job_id = create(store)
+    owner = dead_owner()
+    store.claim(owner)
+    chunk, titles, _, _ = store.next_chunk(job_id, owner)
+    assert store.save_chunk(job_id, owner, chunk, classify_chunk(titles), NO_REUSE)
+
+    assert store.recover(socket.gethostname()) == 1
+    assert store.get(job_id)['status'] == 'queued'
+    assert store.claim('worker')['id'] == job_id
+    chunk, titles, _, _ = store.next_chunk(job_id, 'worker')
+    assert (chunk, titles) == (1, TITLES[2:4])
+
+    # Owner cũ không còn ghi được kết quả
+    assert not store.save_chunk(job_id, owner, chunk, classify_chunk(titles), NO_REUSE)
+
+
+def test_recover_keeps_jobs_of_live_processes(store):
+    job_ids = [create(store), create(store)]
+    store.claim(f'{socket.gethostname()}:{os.getpid()}:1')
+    # Không kiểm tra được process trên máy khác: chờ hết lease
+    store.claim('other-host:1:1')
+    assert store.recover(socket.gethostname()) == 0
+    assert [store.get(job_id)['status'] for job_id in job_ids] == ['running', 'running']
+
+
+def test_expired_lease_is_taken_over(store, monkeypatch):
+    job_id = create(store)
+    store.claim('host-a:1:1')
+    assert store.claim('host-b:1:1') is None
+
+    monkeypatch.setattr(job_queue, 'LEASE_TIMEOUT', -1.0)
+    assert store.claim('host-b:1:1')['id'] == job_id
+    assert store.next_chunk(job_id, 'host-a:1:1') is False
+    assert store.get(job_id)['attempts'] == 2
+
+
+def test_job_fails_after_max_attempts(store, monkeypatch):
+    job_id = create(store)
+    monkeypatch.setattr(job_queue, 'LEASE_TIMEOUT', -1.0)
+    for attempt in range(MAX_ATTEMPTS):
+        assert store.claim(f'worker-{attempt}')['id'] == job_id
+    assert store.claim('worker-last') is None
+    job = store.get(job_id)
+    assert job['status'] == 'failed'
+    assert f'after {MAX_ATTEMPTS} attempts' in job['error']
+
+
+def test_runner_completes_job_with_model(store):
+    job_id = create(store, model='acme/vi')
+    calls = []
+
+    def classify(method, titles, contents, from_emails, model):
+        calls.append((method, model, len(titles)))
+        return classify_chunk(titles), {'cache_hits': 1, 'near_duplicate_hits': 0}
+
+    runner = JobRunner(store, classify)
+    job = store.claim(runner._owner())
+    runner.run(job['id'], job['method'], job['model'])
+
+    assert calls == [('rule', 'acme/vi', 2), ('rule', 'acme/vi', 2), ('rule', 'acme/vi', 1)]
+    job = store.get(job_id)
+    assert (job['status'], job['processed'], job['cache_hits']) == ('completed', 5, 3)
+    assert [result['title'] for result in store.results(job_id)] == TITLES
+    assert [result['title'] for result in store.results(job_id, offset=3, limit=10)] == TITLES[3:]
+
+
+def test_runner_marks_unavailable_method_failed(store):
+    job_id = create(store)
+    runner = JobRunner(store, lambda *args: (None, None))
+    job = store.claim(runner._owner())
+    runner.run(job['id'], job['method'])
+    job = store.get(job_id)
+    assert (job['status'], job['error']) == ('failed', 'Method rule not available')
+
+
+def test_cancel_stops_runner(store):
+    job_id = create(store)
+    runner = JobRunner(store, lambda method, titles, *args: (classify_chunk(titles), NO_REUSE))
+    owner = runner._owner()
+    store.claim(owner)
+    assert store.cancel(job_id) == 'cancelled'
+    runner.run(job_id, 'rule')
+    job = store.get(job_id)
+    assert (job['status'], job['processed']) == ('cancelled', 0)
+
+
+def test_heartbeat_is_renewed_during_long_chunks(store, monkeypatch):
+    create(store)
+    monkeypatch.setattr(job_queue, 'HEARTBEAT_INTERVAL', 0.01)
+    beats = []
+    heartbeat = store.heartbeat
+    monkeypatch.setattr(store, 'heartbeat', lambda *args: beats.append(args) or heartbeat(*args))
+
+    def slow_classify(method, titles, *args):
+        time.sleep(0.1)
+        return classify_chunk(titles), NO_REUSE
+
+    runner = JobRunner(store, slow_classify)
+    job = store.claim(runner._owner())
+    runner.run(job['id'], job['method'])
+
+    assert len(beats) >= 3
+    assert store.get(job['id'])['status'] == 'completed'
+    assert not store.heartbeat(job['id'], runner._owner())
+
+
+def test_columnar_results_use_job_model_categories(backend, store, monkeypatch):
+    job_id = create(store, model='acme/vi')
+    store.claim('worker')
+    for _ in range(3):
+        chunk, titles, _, _ = store.next_chunk(job_id, 'worker')
+        results = [{'category': 'Khác', 'confidence': 0.5, 'indicators': [], 'level': 'basic'} for _ in titles]
+        store.save_chunk(job_id, 'worker', chunk, results, NO_REUSE)
+
+    requested = []
+
+    def id_to_category(model=None):
+        requested.append(model)
+        return {0: 'An toàn', 7: 'Khác'}
+
+    monkeypatch.setattr(backend, 'job_store', store)
+    monkeypatch.setattr(backend.model_registry, 'id_to_category', id_to_category)
+    payload = backend.app.test_client().get(f'/jobs/{job_id}/results?format=columnar').get_json()
+
+    assert requested == ['acme/vi']
+    assert payload['id_to_category'] == {'0': 'An toàn', '7': 'Khác'}
+    assert payload['category_ids'] == [7] * 5
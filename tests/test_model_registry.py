@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from model_registry import MODELS_DIR, ModelRegistry, UnknownModel
+
+MODEL_FILES = ('lightweight_email_classifier.pkl', 'category_mapping.pkl', 'id_to_category.pkl')
+
+
+def copy_model(directory, config=None):
+    os.makedirs(directory, exist_ok=True)
+    for name in MODEL_FILES:
+        shutil.copy(os.path.join(MODELS_DIR, name), directory)
+    if config is not None:
+        with open(os.path.join(directory, 'model.json'), 'w', encoding='utf-8') as f:
+            json.dump(config, f)
+
+
+@pytest.fixture(scope='module')
+def models_dir(tmp_path_factory):
+    root = tmp_path_factory.mktemp('models')
+    copy_model(str(root))
+    copy_model(str(root / 'acme' / 'vi'), {'precision': 'int8'})
+    copy_model(str(root / 'beta' / 'en'))
+    return str(root)
+
+
+def test_discovers_models_by_relative_path(models_dir):
+    registry = ModelRegistry(models_dir)
+    assert registry.names() == ['acme/vi', 'beta/en', 'default']
+    assert registry.resolve() == 'default'
+    with pytest.raises(UnknownModel):
+        registry.resolve('missing')
+
+
+def test_version_and_categories_without_loading(models_dir):
+    registry = ModelRegistry(models_dir)
+    versions = {name: registry.version(name) for name in registry.names()}
+    categories = registry.id_to_category('acme/vi')
+    assert registry.stats()['loaded'] == []
+    assert versions['acme/vi'].endswith('-int8')
+
+    for name, version in versions.items():
+        assert registry.get(name).version == version
+    assert registry.get('acme/vi').id_to_category == categories
+
+
+def test_model_is_loaded_once(models_dir):
+    registry = ModelRegistry(models_dir)
+    assert registry.get('beta/en') is registry.get('beta/en')
+    stats = registry.stats()
+    assert stats['loaded'] == ['beta/en']
+    assert stats['models']['beta/en']['loads'] == 1
+    assert stats['models']['beta/en']['bytes'] > 0
+
+
+def test_least_recently_used_model_is_evicted(models_dir):
+    registry = ModelRegistry(models_dir, max_bytes=1)
+    default = registry.get()
+    registry.get('acme/vi')
+    assert registry.stats()['loaded'] == ['default', 'acme/vi']
+
+    registry.get('beta/en')
+    stats = registry.stats()
+    # Model mặc định không bao giờ bị loại
+    assert stats['loaded'] == ['default', 'beta/en']
+    assert stats['models']['acme/vi']['evictions'] == 1
+    assert registry.get() is default
+
+
+def test_unloaded_model_is_reloaded_on_next_use(models_dir):
+    registry = ModelRegistry(models_dir)
+    registry.get('acme/vi')
+    assert registry.unload('acme/vi')
+    assert not registry.unload('acme/vi')
+    assert registry.stats()['loaded'] == []
+
+    registry.get('acme/vi')
+    assert registry.stats()['models']['acme/vi']['loads'] == 2
+
+
+def test_removed_model_is_dropped_on_discover(tmp_path):
+    copy_model(str(tmp_path))
+    copy_model(str(tmp_path / 'acme'))
+    registry = ModelRegistry(str(tmp_path))
+    registry.get('acme')
+    shutil.rmtree(tmp_path / 'acme')
+
+    assert registry.discover() == ['default']
+    assert registry.stats()['loaded'] == []
+    with pytest.raises(UnknownModel):
+        registry.get('acme')
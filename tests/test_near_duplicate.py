@@ -0,0 +1,77 @@
+import pytest
+
+from near_duplicate import NearDuplicateIndex, link_hosts, sender_domain
+
+NAMESPACE = 'rule:test'
+TITLE = 'Your monthly account statement is ready'
+CONTENT = (
+    'Dear customer, your statement for order 10231 is now available. '
+    'Please review it at https://portal.bank.com.vn/statements/10231 before the end of the month. '
+    'Thank you for banking with us.'
+)
+SENDER = 'noreply@bank.com.vn'
+VERDICT = {'category': 'An toàn', 'confidence': 0.9}
+
+
+@pytest.fixture
+def index():
+    index = NearDuplicateIndex()
+    index.add(NAMESPACE, index.fingerprint(TITLE, CONTENT, SENDER), VERDICT)
+    return index
+
+
+def lookup(index, title=TITLE, content=CONTENT, from_email=SENDER, namespace=NAMESPACE):
+    return index.lookup(namespace, index.fingerprint(title, content, from_email))
+
+
+def test_variant_with_same_hosts_reuses_verdict(index):
+    # Cùng chiến dịch: chỉ khác số tham chiếu và đường dẫn trên cùng host
+    content = CONTENT.replace('10231', '88412')
+    verdict, similarity = lookup(index, content=content)
+    assert verdict == VERDICT
+    assert similarity >= index.threshold
+
+
+def test_changed_link_host_prevents_reuse(index):
+    content = CONTENT.replace('portal.bank.com.vn', 'portal-bank.com.vn.verify-login.tk')
+    assert lookup(index, content=content) == (None, 0.0)
+
+
+def test_added_link_host_prevents_reuse(index):
+    content = CONTENT + ' Or sign in at http://bit.ly/3xYz'
+    assert lookup(index, content=content) == (None, 0.0)
+
+
+def test_changed_sender_domain_prevents_reuse(index):
+    assert lookup(index, from_email='noreply@bank-com-vn.support') == (None, 0.0)
+
+
+def test_sender_display_name_and_case_are_ignored(index):
+    verdict, _ = lookup(index, from_email='Bank <NoReply@Bank.com.vn>')
+    assert verdict == VERDICT
+
+
+def test_other_namespace_is_not_reused(index):
+    assert lookup(index, namespace='rule:other')[0] is None
+
+
+def test_short_email_has_no_fingerprint():
+    index = NearDuplicateIndex()
+    assert index.fingerprint('Hi', 'see you', SENDER) is None
+    assert index.lookup(NAMESPACE, None) == (None, 0.0)
+
+
+def test_link_hosts_normalizes_hosts():
+    hosts = link_hosts('Visit WWW.Example.com/a,', 'and https://bit.ly/x. or example.com/b')
+    assert hosts == frozenset({'example.com', 'bit.ly'})
+    assert sender_domain('Name <user@Mail.Example.COM>') == 'mail.example.com'
+
+
+def test_capacity_evicts_oldest_entries():
+    index = NearDuplicateIndex(capacity=2)
+    for i in range(3):
+        content = CONTENT.replace('portal.bank.com.vn', f'host{i}.bank.com.vn')
+        index.add(NAMESPACE, index.fingerprint(TITLE, content, SENDER), dict(VERDICT, i=i))
+    assert index.stats()['entries'] == 2
+    assert lookup(index, content=CONTENT.replace('portal.bank.com.vn', 'host0.bank.com.vn'))[0] is None
+    assert lookup(index, content=CONTENT.replace('portal.bank.com.vn', 'host2.bank.com.vn'))[0]['i'] == 2
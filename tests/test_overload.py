@@ -0,0 +1,112 @@
+import pytest
+
+from overload import Overloaded, OverloadController
+from result_cache import ResultCache
+
+
+def finish(controller, elapsed_s, count=1):
+    """Nhận rồi kết thúc một request mất elapsed_s giây"""
+    admission = controller.admit(count)
+    admission.start -= elapsed_s
+    controller.release(admission, count)
+
+
+@pytest.fixture
+def controller():
+    return OverloadController(soft_limit=4, hard_limit=6, latency_target_ms=100, min_latency_samples=5,
+                              latency_half_life=None)
+
+
+def test_single_slow_request_does_not_degrade(controller):
+    finish(controller, 5.0)
+    assert controller.state() == 'normal'
+
+
+def test_slow_requests_without_concurrency_do_not_degrade(controller):
+    for _ in range(20):
+        finish(controller, 1.0)
+    assert controller.state() == 'normal'
+
+
+def test_slow_requests_with_concurrency_degrade(controller):
+    for _ in range(5):
+        finish(controller, 1.0)
+    held = [controller.admit() for _ in range(controller.latency_min_in_flight)]
+    assert controller.state() == 'degraded'
+    assert controller.admit().degraded
+    for admission in held:
+        controller.release(admission)
+
+
+def test_in_flight_limits(controller):
+    held = [controller.admit() for _ in range(4)]
+    assert controller.state() == 'degraded'
+    with pytest.raises(Overloaded):
+        controller.admit(size=controller.max_degraded_batch + 1)
+    held += [controller.admit() for _ in range(2)]
+    assert controller.state() == 'overloaded'
+    with pytest.raises(Overloaded) as error:
+        controller.admit()
+    assert error.value.retry_after >= 1
+
+    for admission in held:
+        controller.release(admission)
+    assert controller.state() == 'normal'
+    assert controller.stats()['rejected'] == 1
+
+
+def test_latency_decays_when_idle(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr('overload.time.monotonic', lambda: clock[0])
+    controller = OverloadController(soft_limit=4, hard_limit=8, latency_target_ms=100, min_latency_samples=1,
+                                    latency_half_life=10.0)
+    finish(controller, 0.8)
+    held = [controller.admit() for _ in range(2)]
+    assert controller.state() == 'degraded'
+
+    clock[0] += 30.0            # 3 half-life: 800ms -> 100ms, vẫn trên ngưỡng phục hồi 80ms
+    assert controller.stats()['latency_ewma_ms'] == pytest.approx(100.0)
+    clock[0] += 10.0
+    assert controller.state() == 'normal'
+    for admission in held:
+        controller.release(admission)
+
+
+def test_degraded_routes_to_cheapest_classifier(controller):
+    controller.record_cost('rule', 0.1)
+    controller.record_cost('ml', 50.0)
+    held = [controller.admit() for _ in range(controller.soft_limit)]
+    admission = controller.admit()
+    assert admission.degraded
+    assert controller.route('ml', admission, ['rule', 'ml']) == 'rule'
+    assert controller.route('ml', None, ['rule', 'ml']) == 'ml'
+    for item in held + [admission]:
+        controller.release(item)
+
+
+def test_cost_is_only_measured_on_classifier_work(controller):
+    default = controller.stats()['cost_per_email_ms']['ml']
+    # Request chậm nhưng không gọi classifier (ví dụ toàn cache hit) không đổi chi phí
+    finish(controller, 0.5)
+    assert controller.stats()['cost_per_email_ms']['ml'] == default
+
+    controller.record_cost('ml', 40.0, count=4)
+    assert controller.stats()['cost_per_email_ms']['ml'] == 10.0
+    controller.record_cost('ml', 20.0)
+    assert controller.stats()['cost_per_email_ms']['ml'] == pytest.approx(0.8 * 10.0 + 0.2 * 20.0)
+    controller.record_cost('ml', 0.0, count=0)
+    assert controller.stats()['cost_per_email_ms']['ml'] == pytest.approx(12.0)
+
+
+def test_cache_hits_do_not_lower_classifier_cost(backend, monkeypatch, tmp_path):
+    controller = OverloadController()
+    monkeypatch.setattr(backend, 'overload_controller', controller)
+    monkeypatch.setattr(backend, 'result_cache', ResultCache(str(tmp_path / 'cache.sqlite3')))
+    client = backend.app.test_client()
+    email = {'title': 'Khuyến mãi', 'content': 'Giảm giá 50% cho mọi đơn hàng', 'from_email': 'shop@ban.vn'}
+
+    assert not client.post('/predict/ml', json=email).get_json()['cached']
+    measured = controller.stats()['cost_per_email_ms']['ml']
+    for _ in range(5):
+        assert client.post('/predict/ml', json=email).get_json()['cached']
+    assert controller.stats()['cost_per_email_ms']['ml'] == measured
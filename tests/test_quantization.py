@@ -0,0 +1,97 @@
+import json
+import os
+import pickle
+
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.pipeline import Pipeline
+
+from model_registry import MODELS_DIR, ModelRegistry, load_classifier_module
+from test_model_registry import copy_model
+
+DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'rule_verdicts.json')
+# Độ lệch confidence tối đa so với float64
+TOLERANCE = {'float32': 1e-5, 'int8': 0.01}
+
+classifier_module = load_classifier_module()
+
+
+@pytest.fixture(scope='module')
+def columns():
+    with open(DATA, encoding='utf-8') as f:
+        emails = [case['email'] for case in json.load(f)]
+    return [[email[key] for email in emails] for key in ('title', 'content', 'from_email')]
+
+
+@pytest.fixture(scope='module')
+def reference(columns):
+    return classifier_module.LightweightEmailClassifier(MODELS_DIR).predict_many(*columns)
+
+
+@pytest.mark.parametrize('precision', ['float32', 'int8'])
+def test_quantized_predictions_match_float64(columns, reference, precision):
+    classifier = classifier_module.LightweightEmailClassifier(MODELS_DIR, precision=precision)
+    results = classifier.predict_many(*columns)
+    assert [r['category'] for r in results] == [r['category'] for r in reference]
+    for result, expected in zip(results, reference):
+        assert abs(result['confidence'] - expected['confidence']) <= TOLERANCE[precision]
+
+
+def quantize(directory, precision):
+    with open(os.path.join(directory, classifier_module.MODEL_FILE), 'rb') as f:
+        model_bytes = f.read()
+    scorer = classifier_module.QuantizedScorer.from_pipeline(
+        pickle.loads(model_bytes), precision, classifier_module.source_digest(model_bytes))
+    with open(os.path.join(directory, classifier_module.quantized_model_file(precision)), 'wb') as f:
+        f.write(scorer.dumps())
+
+
+def test_stale_quantized_artifact_is_ignored(tmp_path):
+    directory = str(tmp_path)
+    copy_model(directory, {'precision': 'int8'})
+    quantize(directory, 'int8')
+    npz_path = os.path.join(directory, classifier_module.quantized_model_file('int8'))
+    assert classifier_module.model_file(directory, 'int8') == npz_path
+    fresh_version = ModelRegistry(directory).version()
+
+    # Model được train lại (pkl khác) nhưng chưa chạy lại quantize_model.py
+    pkl_path = os.path.join(directory, classifier_module.MODEL_FILE)
+    with open(pkl_path, 'rb') as f:
+        pipeline = pickle.load(f)
+    pipeline.steps[-1][1].intercept_ = pipeline.steps[-1][1].intercept_ + 1.0
+    model_bytes = pickle.dumps(pipeline)
+    with open(pkl_path, 'wb') as f:
+        f.write(model_bytes)
+
+    assert classifier_module.model_file(directory, 'int8') == pkl_path
+    registry = ModelRegistry(directory)
+    version = registry.version()
+    assert version != fresh_version
+    assert version == classifier_module.model_version(model_bytes, 'int8')
+    classifier = registry.get()
+    assert classifier.version == version
+    assert classifier.scorer.config['source_sha256'] == classifier_module.source_digest(model_bytes)
+
+
+def fitted_pipeline(**options):
+    texts = ['tài khoản bị khóa', 'khuyến mãi lớn', 'họp lúc 9 giờ', 'xác minh mật khẩu ngay']
+    pipeline = Pipeline([('tfidf', TfidfVectorizer(**options)), ('classifier', LogisticRegression())])
+    return pipeline.fit(texts, [0, 1, 2, 0])
+
+
+@pytest.mark.parametrize('options', [
+    {'stop_words': ['lớn']},
+    {'tokenizer': str.split, 'token_pattern': None},
+    {'preprocessor': str.lower},
+    {'binary': True},
+])
+def test_unreproducible_vectorizer_settings_are_rejected(options):
+    with pytest.raises(ValueError):
+        classifier_module.QuantizedScorer.from_pipeline(fitted_pipeline(**options), 'int8')
+
+
+def test_default_vectorizer_settings_quantize():
+    scorer = classifier_module.QuantizedScorer.from_pipeline(fitted_pipeline(), 'float32', 'abc')
+    assert scorer.config['source_sha256'] == 'abc'
+    assert scorer.predict_proba(['tài khoản bị khóa']).shape == (1, 3)
@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+from result_cache import ResultCache
+
+VERDICT = {'category': 'Spam', 'confidence': 0.9, 'indicators': ['Khuyến mãi'], 'level': 'basic'}
+EMAIL = {'title': 'Khuyến mãi', 'content': 'Giảm giá 50% cho mọi đơn hàng hôm nay', 'from_email': 'shop@ban.vn'}
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'cache.sqlite3')
+
+
+def key(version='v1', title='title', content='content'):
+    return ResultCache.make_key('rule', version, title, content, 'a@b.vn')
+
+
+def test_hits_and_misses_are_counted(path):
+    cache = ResultCache(path)
+    assert cache.get(key()) is None
+    cache.set(key(), VERDICT)
+    assert cache.get_many([key(), key(title='other')]) == [VERDICT, None]
+
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['sets'], stats['entries']) == (1, 2, 1, 1)
+    assert stats['hit_ratio'] == pytest.approx(1 / 3, abs=1e-4)
+
+
+def test_fallback_results_are_not_cached(path):
+    cache = ResultCache(path)
+    cache.set_many([(key(title='a'), dict(VERDICT, error='model failed')),
+                    (key(title='b'), dict(VERDICT, warning='Text too short')),
+                    (key(title='c'), None)])
+    stats = cache.stats()
+    assert (stats['sets'], stats['skipped'], stats['entries']) == (0, 3, 0)
+
+
+def test_version_is_part_of_the_key(path):
+    cache = ResultCache(path)
+    cache.set(key('v1'), VERDICT)
+    assert key('v1') != key('v2')
+    assert cache.get(key('v2')) is None
+    assert cache.get(key('v1')) == VERDICT
+
+
+def test_classifier_version_change_invalidates_results(backend, monkeypatch, path):
+    monkeypatch.setattr(backend, 'result_cache', ResultCache(path))
+    client = backend.app.test_client()
+    assert not client.post('/predict/rule', json=EMAIL).get_json()['cached']
+    assert client.post('/predict/rule', json=EMAIL).get_json()['cached']
+
+    monkeypatch.setattr(backend.rule_classifier, 'version', backend.rule_classifier.version + '-changed')
+    assert not client.post('/predict/rule', json=EMAIL).get_json()['cached']
+    assert client.post('/predict/rule', json=EMAIL).get_json()['cached']
+
+
+def test_least_recently_used_entries_are_evicted(path, monkeypatch):
+    cache = ResultCache(path, max_bytes=2000)
+    for i in range(40):
+        monkeypatch.setattr('result_cache.time.time', lambda: 1000.0 + i)
+        cache.set(key(title=str(i)), VERDICT)
+    assert cache.evict() > 0
+
+    stats = cache.stats()
+    assert 0 < stats['size_bytes'] <= 2000
+    assert cache.get(key(title='39')) == VERDICT
+    assert cache.get(key(title='0')) is None
+
+
+def test_concurrent_writers_share_one_file(path):
+    # Hai instance (như hai worker process) và nhiều thread trên cùng file WAL
+    caches = [ResultCache(path), ResultCache(path)]
+    assert caches[0]._connection().execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    errors = []
+
+    def write(worker):
+        cache = caches[worker % 2]
+        try:
+            for i in range(25):
+                cache.set_many([(key(title=f'{worker}-{i}-{j}'), VERDICT) for j in range(4)])
+                cache.get_many([key(title=f'{worker}-{i}-{j}') for j in range(4)])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    written = sum(cache.stats()['sets'] for cache in caches)
+    failed = sum(cache.stats()['errors'] for cache in caches)
+    # Cache là best-effort: lần ghi gặp lock quá BUSY_TIMEOUT_MS bị bỏ qua chứ không làm lỗi request
+    assert written + 4 * failed >= 6 * 25 * 4
+    reader = ResultCache(path)
+    assert reader.stats()['entries'] == written
+    keys = [key(title=f'{worker}-{i}-{j}') for worker in range(6) for i in range(25) for j in range(4)]
+    assert sum(result is not None for result in reader.get_many(keys)) == written
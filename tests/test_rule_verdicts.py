@@ -0,0 +1,86 @@
+import json
+import os
+
+import pytest
+
+import email_classifier
+import prefilter
+from email_classifier import EmailClassifier
+from email_features import extract_features, link_lines
+
+# Email mẫu và kết quả của rule-based trước khi có ruleset compiler, prefilter và
+# trường dẫn xuất (link_lines, shorteners): các tối ưu không được đổi kết quả
+VERDICTS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'rule_verdicts.json')
+
+
+@pytest.fixture(scope='module')
+def cases():
+    with open(VERDICTS_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def assert_verdicts(cases, results):
+    for case, result in zip(cases, results):
+        assert result == case['expected'], case['email']
+    assert len(results) == len(cases)
+
+
+def test_direct_scan_matches_baseline(cases):
+    classifier = EmailClassifier(use_prefilter=False, cache_dir=None)
+    assert_verdicts(cases, [classifier.classify_email(case['email']) for case in cases])
+
+
+def test_prefilter_matches_baseline(cases):
+    classifier = EmailClassifier(cache_dir=None)
+    assert_verdicts(cases, [classifier.classify_email(case['email']) for case in cases])
+
+
+def test_columns_match_baseline(cases):
+    classifier = EmailClassifier(cache_dir=None)
+    emails = [case['email'] for case in cases]
+    results = classifier.classify_columns([e['title'] for e in emails], [e['content'] for e in emails],
+                                          [e['from_email'] for e in emails])
+    assert_verdicts(cases, results)
+
+
+def test_cached_artifact_matches_baseline(cases, tmp_path):
+    cache_dir = str(tmp_path / 'rulesets')
+    compiled = EmailClassifier(cache_dir=cache_dir)
+    loaded = EmailClassifier(cache_dir=cache_dir)
+    assert loaded.version == compiled.version
+    assert_verdicts(cases, [loaded.classify_email(case['email']) for case in cases])
+
+
+def test_link_lines_keeps_only_lines_with_link():
+    text = 'Xin chào\nClick vào LINK để xác minh\r ngay\nTrân trọng\nlink khác'
+    assert link_lines(text) == 'Click vào LINK để xác minh\r ngay\nlink khác'
+    assert link_lines('không có gì') == ''
+
+
+def test_bare_shortener_mentions_are_features():
+    # "bit.ly" không có path không phải URL nhưng vẫn là link rút gọn
+    features = extract_features('Thông báo', 'go to bit.ly now', 'a@b.com')
+    assert features.shortener_hosts == ['bit.ly']
+
+
+def test_substring_fallback_matches_baseline(cases, monkeypatch):
+    # Không có pyahocorasick: prefilter tìm từng literal bằng `in`
+    monkeypatch.setattr(prefilter, 'ahocorasick', None)
+    classifier = EmailClassifier(cache_dir=None)
+    assert classifier.prefilter is not None and not classifier.prefilter.use_automaton
+    assert_verdicts(cases, [classifier.classify_email(case['email']) for case in cases])
+
+
+def test_version_covers_scoring_features_and_prefilter(tmp_path, monkeypatch):
+    version = EmailClassifier(cache_dir=None).version
+    for i, path in enumerate(email_classifier.VERSION_SOURCES):
+        changed = tmp_path / f'source_{i}.py'
+        with open(path, 'rb') as f:
+            changed.write_bytes(f.read() + b'\n# changed\n')
+        sources = list(email_classifier.VERSION_SOURCES)
+        sources[i] = str(changed)
+        with monkeypatch.context() as patch:
+            patch.setattr(email_classifier, 'VERSION_SOURCES', tuple(sources))
+            assert EmailClassifier(cache_dir=None).version != version
+    assert [os.path.basename(path) for path in email_classifier.VERSION_SOURCES] == [
+        'email_classifier.py', 'email_features.py', 'prefilter.py']
@@ -0,0 +1,68 @@
+import json
+import os
+import stat
+import sys
+
+import ruleset_compiler
+from ruleset_compiler import DEFAULT_RULESET_PATH, load_ruleset
+
+
+def artifact_files(cache_dir):
+    return [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith('.json')]
+
+
+def test_cache_dir_is_private(tmp_path):
+    cache_dir = str(tmp_path / 'rulesets')
+    load_ruleset(DEFAULT_RULESET_PATH, cache_dir=cache_dir)
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+    [artifact] = artifact_files(cache_dir)
+    assert stat.S_IMODE(os.stat(artifact).st_mode) == 0o600
+
+
+def test_tampered_artifact_is_recompiled(tmp_path):
+    cache_dir = str(tmp_path / 'rulesets')
+    expected = load_ruleset(DEFAULT_RULESET_PATH, cache_dir=cache_dir)
+    [artifact_path] = artifact_files(cache_dir)
+    with open(artifact_path, encoding='utf-8') as f:
+        artifact = json.load(f)
+    artifact['fallback']['category'] = 'An toàn'
+    with open(artifact_path, 'w', encoding='utf-8') as f:
+        json.dump(artifact, f)
+
+    ruleset = load_ruleset(DEFAULT_RULESET_PATH, cache_dir=cache_dir)
+    assert ruleset.fallback == expected.fallback
+    assert ruleset.version == expected.version
+
+
+def test_artifact_from_other_source_is_not_used(tmp_path):
+    cache_dir = str(tmp_path / 'rulesets')
+    load_ruleset(DEFAULT_RULESET_PATH, cache_dir=cache_dir)
+    [artifact_path] = artifact_files(cache_dir)
+    with open(artifact_path, encoding='utf-8') as f:
+        artifact = json.load(f)
+    artifact['source_digest'] = '0' * 32
+    with open(artifact_path, 'w', encoding='utf-8') as f:
+        json.dump(artifact, f)
+
+    load_ruleset(DEFAULT_RULESET_PATH, cache_dir=cache_dir)
+    with open(artifact_path, encoding='utf-8') as f:
+        assert json.load(f)['source_digest'] != '0' * 32
+
+
+def test_shared_writable_cache_dir_is_not_used(tmp_path):
+    cache_dir = tmp_path / 'shared'
+    cache_dir.mkdir()
+    os.chmod(cache_dir, 0o777)
+    ruleset = load_ruleset(DEFAULT_RULESET_PATH, cache_dir=str(cache_dir))
+    assert ruleset.categories
+    assert os.listdir(cache_dir) == []
+
+
+def test_artifact_is_keyed_by_python_version(tmp_path, monkeypatch):
+    # Literal của prefilter được trích bằng parser regex của Python đang chạy
+    cache_dir = str(tmp_path / 'rulesets')
+    expected = load_ruleset(DEFAULT_RULESET_PATH, cache_dir=cache_dir)
+    monkeypatch.setattr(ruleset_compiler.sys, 'version_info', (sys.version_info[0], sys.version_info[1] + 1, 0))
+    ruleset = load_ruleset(DEFAULT_RULESET_PATH, cache_dir=cache_dir)
+    assert len(artifact_files(cache_dir)) == 2
+    assert ruleset.version == expected.version
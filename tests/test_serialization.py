@@ -0,0 +1,82 @@
+import numpy as np
+import pytest
+
+import serialization
+from serialization import InvalidPayload, columnar_results, dumps, loads, validate_batch, validate_email
+
+EMAIL = {'title': 'Thông báo', 'content': 'Nội dung', 'from_email': 'a@b.vn'}
+ID_TO_CATEGORY = {0: 'An toàn', 1: 'Nghi ngờ', 2: 'Spam', 3: 'Giả mạo'}
+
+
+@pytest.fixture(params=['json', 'orjson'])
+def codec(request):
+    if request.param == 'orjson' and serialization.orjson is None:
+        pytest.skip('orjson is not installed')
+    previous = serialization.codec
+    serialization.use_codec(request.param)
+    yield request.param
+    serialization.use_codec(previous)
+
+
+def test_round_trip_keeps_unicode_and_numpy(codec):
+    payload = {'category': 'Giả mạo', 'confidence': np.float64(0.75), 'ids': np.arange(3), 'count': np.int64(2)}
+    data = dumps(payload)
+    assert isinstance(data, bytes)
+    assert 'Giả mạo'.encode('utf-8') in data
+    assert loads(data) == {'category': 'Giả mạo', 'confidence': 0.75, 'ids': [0, 1, 2], 'count': 2}
+
+
+def test_invalid_json_raises_invalid_payload(codec):
+    with pytest.raises(InvalidPayload, match='Invalid JSON data'):
+        loads(b'{"title": ')
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        serialization.use_codec('pickle')
+
+
+def test_validate_email_reports_first_missing_field():
+    assert validate_email(EMAIL) is None
+    assert validate_email(['not', 'a', 'dict']) == 'Email must be a JSON object'
+    assert validate_email({'title': 'x'}) == 'Missing required field: content'
+
+
+@pytest.mark.parametrize('data, error', [
+    (None, 'No emails array provided'),
+    ({'emails': 'x'}, 'emails must be an array'),
+    ({'emails': []}, 'emails array cannot be empty'),
+    ({'emails': [EMAIL], 'format': 'csv'}, 'format must be one of: records, columnar'),
+    ({'emails': [EMAIL, 'x']}, 'Email 2 must be a JSON object'),
+    ({'emails': [EMAIL, {'title': 'x', 'content': 'y'}]}, 'Email 2 missing required field: from_email'),
+])
+def test_validate_batch_errors(data, error):
+    assert validate_batch(data)[3] == error
+
+
+def test_validate_batch_defaults():
+    assert validate_batch({'emails': [EMAIL]}) == ([EMAIL], 'rule', 'records', None)
+
+
+def test_columnar_rule_results():
+    results = [
+        {'category': 'Spam', 'confidence': 0.8, 'indicators': ['Khuyến mãi'], 'level': 'basic'},
+        {'category': 'An toàn', 'confidence': 0.6, 'indicators': [], 'level': 'advanced',
+         'near_duplicate': True, 'similarity': 0.95},
+    ]
+    assert columnar_results('rule', results, ID_TO_CATEGORY) == {
+        'id_to_category': {'0': 'An toàn', '1': 'Nghi ngờ', '2': 'Spam', '3': 'Giả mạo'},
+        'category_ids': [2, 0],
+        'confidence': [0.8, 0.6],
+        'near_duplicate_similarity': [None, 0.95],
+        'indicators': [['Khuyến mãi'], []],
+        'level': ['basic', 'advanced'],
+    }
+
+
+def test_columnar_ml_probabilities_follow_category_ids():
+    probabilities = {'Giả mạo': 0.1, 'An toàn': 0.6, 'Spam': 0.2, 'Nghi ngờ': 0.1}
+    columns = columnar_results('ml', [{'category': 'An toàn', 'confidence': 0.6, 'probabilities': probabilities}],
+                               ID_TO_CATEGORY)
+    assert columns['probabilities'] == [[0.6, 0.1, 0.2, 0.1]]
+    assert 'indicators' not in columns and 'near_duplicate_similarity' not in columns
@@ -0,0 +1,104 @@
+import random
+
+from shadow import ShadowCandidate, ShadowEvaluator
+
+EMAIL = {'title': 'Thông báo khẩn', 'content': 'Tài khoản của bạn sẽ bị khóa', 'from_email': 'a@b.tk'}
+
+
+def verdict(category, confidence=0.8):
+    return {'category': category, 'confidence': confidence}
+
+
+def candidate(classify, method='rule'):
+    return ShadowCandidate(method, classify, 'candidate', 'v2', 'v1')
+
+
+def run(evaluator, items):
+    """Gửi các cặp (email, kết quả production) rồi chờ thread nền xử lý hết"""
+    evaluator.start()
+    for email, primary in items:
+        evaluator.submit('rule', email, primary, 1.0)
+    evaluator.stop(timeout=5)
+    return evaluator.report()
+
+
+def test_sample_rate_bounds_submissions():
+    evaluator = ShadowEvaluator([candidate(lambda email: verdict('Spam'))], sample_rate=0.0)
+    assert not evaluator.submit('rule', EMAIL, verdict('Spam'))
+
+    evaluator = ShadowEvaluator([candidate(lambda email: verdict('Spam'))], sample_rate=0.25, max_queue=10000)
+    evaluator._random = random.Random(7)
+    submitted = sum(evaluator.submit('rule', EMAIL, verdict('Spam')) for _ in range(4000))
+    assert 900 <= submitted <= 1100
+
+
+def test_method_without_candidate_is_not_sampled():
+    evaluator = ShadowEvaluator([candidate(lambda email: verdict('Spam'))], sample_rate=1.0)
+    assert not evaluator.submit('ml', EMAIL, verdict('Spam'))
+    assert evaluator.report()['submitted'] == 0
+
+
+def test_batch_sampling_takes_expected_share():
+    evaluator = ShadowEvaluator([candidate(lambda email: verdict('Spam'))], sample_rate=0.25, max_queue=1000)
+    titles = [f'title {i}' for i in range(100)]
+    results = [verdict('Spam')] * 100
+    assert evaluator.submit_batch('rule', titles, titles, titles, results) == 25
+
+
+def test_full_queue_drops_samples_without_blocking():
+    evaluator = ShadowEvaluator([candidate(lambda email: verdict('Spam'))], sample_rate=1.0, max_queue=2)
+    assert [evaluator.submit('rule', EMAIL, verdict('Spam')) for _ in range(3)] == [True, True, False]
+    report = evaluator.report()
+    assert (report['submitted'], report['dropped'], report['queue_size']) == (2, 1, 2)
+
+
+def test_disagreements_are_accounted():
+    evaluator = ShadowEvaluator([candidate(lambda email: verdict('Spam', 0.6))], sample_rate=1.0)
+    report = run(evaluator, [(EMAIL, verdict('Spam', 0.8)), (EMAIL, verdict('Spam', 0.8)),
+                             (EMAIL, verdict('Giả mạo', 0.9)), (EMAIL, verdict('An toàn', 0.6))])
+
+    result = report['candidates']['rule']
+    assert (report['processed'], result['samples'], result['errors']) == (4, 4, 0)
+    assert result['agreement'] == 0.5
+    assert result['mean_confidence_delta'] == 0.175
+    assert result['confusion'] == {'Spam': {'Spam': 2}, 'Giả mạo': {'Spam': 1}, 'An toàn': {'Spam': 1}}
+    assert result['per_category']['Spam'] == {'primary': 2, 'candidate': 4, 'agreement': 1.0}
+    assert result['per_category']['Giả mạo'] == {'primary': 1, 'candidate': 0, 'agreement': 0.0}
+    assert [(d['primary'], d['candidate']) for d in result['recent_disagreements']] == [
+        ('Giả mạo', 'Spam'), ('An toàn', 'Spam')]
+    assert (result['candidate_version'], result['primary_version']) == ('v2', 'v1')
+
+
+def test_candidate_errors_are_counted_and_isolated():
+    def failing(email):
+        raise RuntimeError('candidate crashed')
+
+    def prepare(email):
+        if not email['content']:
+            raise ValueError('bad email')
+        return email
+
+    evaluator = ShadowEvaluator([candidate(failing)], sample_rate=1.0, prepare=prepare)
+    report = run(evaluator, [(EMAIL, verdict('Spam')), (dict(EMAIL, content=''), verdict('Spam'))])
+    assert (report['processed'], report['candidates']['rule']['errors']) == (0, 2)
+
+
+def test_shadow_errors_do_not_change_primary_response(backend, monkeypatch):
+    client = backend.app.test_client()
+    expected = client.post('/predict/rule', json=EMAIL).get_json()
+
+    def failing(email):
+        raise RuntimeError('candidate crashed')
+
+    evaluator = ShadowEvaluator([candidate(failing)], sample_rate=1.0)
+    evaluator.start()
+    monkeypatch.setattr(backend, 'shadow_evaluator', evaluator)
+    response = client.post('/predict/rule', json=EMAIL)
+    evaluator.stop(timeout=5)
+
+    assert response.status_code == 200
+    payload = response.get_json()
+    for key in ('category', 'confidence', 'indicators', 'level'):
+        assert payload[key] == expected[key]
+    report = evaluator.report()
+    assert (report['submitted'], report['candidates']['rule']['errors']) == (1, 1)